@@ -0,0 +1,58 @@
+"""
+Compares the sequential and the thread-pool execution of OpenCV-based image steps.
+
+Run from the repository root with 'python -m benchmarks.thread_pool'.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator
+
+import numpy as np
+
+from pipeline.control_flow import Block
+from pipeline.image_steps import Denoising, Resize, Dilation, Erosion
+from pipeline.pipeline_step import FirstPipelineStep
+
+
+class RandomImages(FirstPipelineStep):
+
+    def get_next(self, previous: Generator, shape=(384, 384, 4), **arguments) -> Generator:
+        yield [np.random.randint(0, 255, size=shape, dtype=np.uint8)]
+
+
+def get_pipeline():
+    return Block([
+        RandomImages(),
+        Denoising(),
+        Dilation(),
+        Erosion(),
+        Resize(width=256, height=256)
+    ])()
+
+
+def measure(view, nr_elements):
+    generator = view.get_generator()
+    next(generator)
+
+    start = time.perf_counter()
+    for _ in range(nr_elements): next(generator)
+    return (time.perf_counter() - start) / nr_elements
+
+
+def main(nr_elements=32):
+    nr_threads = os.cpu_count()
+
+    sequential = measure(get_pipeline().get_view(), nr_elements)
+    print(f'sequential:            {1000 * sequential:8.2f} ms / element')
+
+    with ThreadPoolExecutor(nr_threads) as thread_pool:
+        view = get_pipeline().get_view(thread_pool=thread_pool, nr_parallel_elements=nr_threads)
+        threaded = measure(view, nr_elements)
+
+    print(f'thread pool ({nr_threads:3} threads): {1000 * threaded:8.2f} ms / element')
+    print(f'speedup:               {sequential / threaded:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
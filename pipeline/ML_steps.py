@@ -1,14 +1,24 @@
-from typing import Generator
+import threading
+from math import ceil
+from queue import Queue
+from typing import Generator, List, Tuple
 
 import numpy as np
 
+from pipeline.dtypes import get_batch_dtype, get_dtype, copy_into, stack, is_quantized_array
+from pipeline.exceptions import IteratedThroughAll
 from pipeline.pipeline_step import PipelineStep, FinalPipelineStep
+from pipeline.pipeline_step_view import PipelineStepView
 from pipeline.transformer import FunctionTransformer
 
 
 class BatchGenerator(PipelineStep):
+    """
+    Stacks 'batch_size' elements of every incoming stream into one batch. The batches follow the dtype policy given by
+    the view argument 'dtype', quantized elements are dequantized (see pipeline.dtypes).
+    """
 
-    def get_next(self, previous: Generator, batch_size=32, **arguments) -> Generator:
+    def get_next(self, previous: Generator, batch_size=32, dtype=None, **arguments) -> Generator:
         batches = [[n] for n in next(previous)]
 
         for elem in range(batch_size - 1):
@@ -17,21 +27,113 @@ class BatchGenerator(PipelineStep):
             for i, next_input in enumerate(next_inputs):
                 batches[i].append(next_input)
 
-        yield [np.array(batch) for batch in batches]
+        yield [stack(batch, dtype) for batch in batches]
+
+
+class BucketBatchGenerator(PipelineStep):
+    """
+    A batch generator for elements of variable shape (e.g. images which are not resized). The incoming elements are
+    grouped into buckets by their shape, rounded up to the next bucket boundary. Once a bucket contains 'batch_size'
+    elements, they are padded to the bucket shape with 'padding_value' and yielded as dense batches. If
+    'output_masks' is set, a boolean mask (True for all non-padded values) is appended for every stream.
+
+    'bucket_boundaries' contains a sorted list of boundaries for each of the leading axes. Axes without boundaries and
+    sizes larger than all boundaries are not padded. If 'bucket_boundaries' is None, elements are only grouped with
+    elements of identical shape.
+
+    At most 'max_buffered_elements' (by default 8 x 'batch_size') elements are buffered. If this is exceeded, the
+    fullest bucket is yielded as a smaller batch. Once the incoming data is exhausted (see 'all_then_stop'), all
+    remaining buckets are yielded as smaller batches.
+
+    The fraction of padded values in all yielded batches is available as 'padding_overhead'. The batches follow the
+    dtype policy given by the view argument 'dtype', quantized elements are dequantized (see pipeline.dtypes).
+    """
+
+    def __init__(self, **arguments):
+        super().__init__(**arguments)
+        self.nr_values = 0
+        self.nr_padded_values = 0
+
+    @property
+    def padding_overhead(self) -> float:
+        if self.nr_values + self.nr_padded_values == 0: return 0.0
+        return self.nr_padded_values / (self.nr_values + self.nr_padded_values)
+
+    def get_next(self, previous: Generator, batch_size=32, bucket_boundaries=None, max_buffered_elements=None,
+                 padding_value=0, output_masks=True, dtype=None, **arguments) -> Generator:
+        if max_buffered_elements is None: max_buffered_elements = 8 * batch_size
+
+        buckets = dict()
+        nr_buffered = 0
+
+        try:
+            for inputs in previous:
+                key = tuple(self._get_bucket_shape(np.shape(i), bucket_boundaries) for i in inputs)
+                buckets.setdefault(key, []).append(inputs)
+                nr_buffered += 1
+
+                if len(buckets[key]) < batch_size and nr_buffered <= max_buffered_elements: continue
+                if len(buckets[key]) < batch_size: key = max(buckets, key=lambda k: len(buckets[k]))
+
+                elements = buckets.pop(key)
+                nr_buffered -= len(elements)
+
+                yield self._pad_batch(elements, key, padding_value, output_masks, dtype)
+        except IteratedThroughAll:
+            # the remaining buckets are yielded as smaller batches before the end of the data is passed on
+            for key, elements in buckets.items():
+                yield self._pad_batch(elements, key, padding_value, output_masks, dtype)
+            raise
+
+    def _get_bucket_shape(self, shape: Tuple, bucket_boundaries) -> Tuple:
+        if bucket_boundaries is None: return tuple(shape)
+
+        bucket_shape = list(shape)
+        for axis, boundaries in enumerate(bucket_boundaries[:len(shape)]):
+            bucket_shape[axis] = next((b for b in boundaries if b >= shape[axis]), shape[axis])
+
+        return tuple(bucket_shape)
+
+    def _pad_batch(self, elements: List, bucket_shapes: Tuple, padding_value, output_masks: bool, dtype) -> List:
+        batches, masks = [], []
+
+        for stream, shape in enumerate(bucket_shapes):
+            stream_elements = [np.asanyarray(e[stream]) for e in elements]
+
+            batch_dtype = get_batch_dtype(stream_elements[0].dtype, dtype, is_quantized_array(stream_elements[0]))
+            batch = np.full((len(elements),) + shape, padding_value, dtype=batch_dtype)
+            mask = np.zeros((len(elements),) + shape, dtype=bool)
+
+            for i, element in enumerate(stream_elements):
+                region = (i,) + tuple(slice(0, s) for s in element.shape)
+                copy_into(batch[region + (Ellipsis,)], element)
+                mask[region] = True
+
+            self.nr_values += int(np.count_nonzero(mask))
+            self.nr_padded_values += mask.size - int(np.count_nonzero(mask))
+
+            batches.append(batch)
+            masks.append(mask)
+
+        return batches + masks if output_masks else batches
 
 
 class OneHotEncoder(FunctionTransformer):
 
-    def transform(self, class_nr: int = 0, num_classes: int = 1, **arguments):
-        one_hot = np.zeros(num_classes)
+    def transform(self, class_nr: int = 0, num_classes: int = 1, dtype=None, **arguments):
+        one_hot = np.zeros(num_classes, dtype=get_dtype(dtype, np.float64))
         one_hot[class_nr] = 1
         return one_hot
 
 
 class KerasTrainingGenerator(FinalPipelineStep):
+    """
+    Yields batches of 'batch_size' elements as (inputs, outputs) for keras. The batches follow the dtype policy given
+    by the view argument 'dtype', quantized elements are dequantized (see pipeline.dtypes).
+    """
 
-    def get_next(self, previous: Generator, batch_size=32, input_indices=None, output_indices=None, **arguments)\
-            -> Generator:
+    def get_next(self, previous: Generator, batch_size=32, input_indices=None, output_indices=None, dtype=None,
+                 **arguments) -> Generator:
         if input_indices is None: input_indices = [0]
         if output_indices is None: output_indices = [1]
 
@@ -49,8 +151,8 @@ class KerasTrainingGenerator(FinalPipelineStep):
             for i, index in enumerate(output_indices):
                 output_data[i].append(all_data[index])
 
-        input_data = [np.array(d) for d in input_data]
-        output_data = [np.array(d) for d in output_data]
+        input_data = [stack(d, dtype) for d in input_data]
+        output_data = [stack(d, dtype) for d in output_data]
 
         yield input_data, output_data
 
@@ -79,3 +181,100 @@ class KerasTestGenerator(FinalPipelineStep):
         output_data = [d for d in output_data]
 
         yield input_data, output_data
+
+
+class KerasValidationGenerator(FinalPipelineStep):
+    """
+    Yields batches of 'batch_size' elements as (inputs, outputs) for the validation or the inference of a keras
+    model. Once the incoming data is exhausted (see 'all_then_stop'), the remaining elements are yielded as a smaller
+    last batch. The batches follow the dtype policy given by the view argument 'dtype', quantized elements are
+    dequantized (see pipeline.dtypes).
+
+    Use SinglePassData to iterate exactly once through the data.
+    """
+
+    def get_next(self, previous: Generator, batch_size=32, input_indices=None, output_indices=None, dtype=None,
+                 **arguments) -> Generator:
+        if input_indices is None: input_indices = [0]
+        if output_indices is None: output_indices = [1]
+
+        elements, is_exhausted = [], False
+        try:
+            while len(elements) < batch_size: elements.append(next(previous))
+        except IteratedThroughAll:
+            if not elements: raise
+            is_exhausted = True
+
+        assert len(elements[0]) == (len(input_indices) + len(output_indices)), \
+            'Number of provided input and output indices does not match with the number of incoming streams.'
+
+        input_data = [stack([e[index] for e in elements], dtype) for index in input_indices]
+        output_data = [stack([e[index] for e in elements], dtype) for index in output_indices]
+
+        yield input_data, output_data
+
+        if is_exhausted: raise IteratedThroughAll()
+
+
+class SinglePassData:
+    """
+    Iterates exactly once through the data of a finalized view (e.g. a view of KerasValidationGenerator), starting
+    from the beginning of all cached views, such that it can be passed to 'model.evaluate' or 'model.predict'.
+
+    The batches are assembled by a background thread while the consumer processes the previous ones; at most
+    'prefetch' batches are buffered.
+
+    If every source of the view is behind a cached view, the number of batches is known in advance ('nr_batches',
+    also returned by 'len'). As for PipelineSequence, this requires that every cached element corresponds to exactly
+    one element at the end of the pipeline. Otherwise, 'nr_batches' is None.
+    """
+
+    def __init__(self, view: PipelineStepView, prefetch=2):
+        self.view = view
+        self.prefetch = prefetch
+
+        cached_views = view.get_cached_views()
+        batch_size = view.arguments.get('batch_size', 32)
+
+        self.nr_batches = None
+        if cached_views and not view.has_uncached_sources():
+            self.nr_batches = ceil(min([len(v.cache) for v in cached_views]) / batch_size)
+
+    def __len__(self):
+        if self.nr_batches is None: raise TypeError('The number of batches is only known for cached pipelines.')
+        return self.nr_batches
+
+    def __iter__(self) -> Generator:
+        view = self.view.get_view(all_then_stop=True, shuffle=False)
+        for cached_view in view.get_cached_views(): cached_view.next_cache_index = 0
+
+        batches = Queue(self.prefetch)
+        is_stopped = threading.Event()
+
+        def produce():
+            generator = view.get_generator()
+
+            try:
+                while not is_stopped.is_set(): batches.put((next(generator), None))
+            except IteratedThroughAll:
+                batches.put((None, None))
+            except Exception as e:
+                batches.put((None, e))
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                batch, exception = batches.get()
+
+                if exception is not None: raise exception
+                if batch is None: return
+
+                yield batch
+        finally:
+            # unblock the producer if the consumer stops early
+            is_stopped.set()
+            while thread.is_alive():
+                if not batches.empty(): batches.get()
+                thread.join(0.01)
@@ -0,0 +1,49 @@
+"""
+The public steps and helpers of the package are available as attributes of 'pipeline' (e.g. 'pipeline.Resize'). The
+modules defining them are only imported when an attribute is accessed for the first time, so that importing the
+package does not load the heavy dependencies (OpenCV, matplotlib, pydicom, TensorFlow) of steps which are not used.
+"""
+
+import importlib
+
+_EXPORTS = {
+    'pipeline.exceptions': ['IteratedThroughAll'],
+    'pipeline.pipeline_step': ['PipelineStep', 'FirstPipelineStep', 'FinalPipelineStep'],
+    'pipeline.pipeline_step_view': ['PipelineStepView'],
+    'pipeline.control_flow': ['Identity', 'Block', 'DuplicateStream', 'Duplicator', 'RoundRobinMerger',
+                              'WeightedInterleave', 'CachePoint', 'Filter', 'FunctionFilter'],
+    'pipeline.transformer': ['FunctionTransformer', 'StreamsToList', 'ListToStreams', 'StreamsToTuple',
+                             'StackIncomingStreams', 'StackChannels', 'DictToValue', 'ToNumpyArray'],
+    'pipeline.image_steps': ['Rescale', 'Resize', 'AddChannel', 'ToRGB', 'Reshape', 'RandomlyCrop', 'GeometricAugment',
+                             'AverageFilter', 'Denoising', 'Dilation', 'Erosion', 'Morphology',
+                             'get_structuring_element', 'ShowImage', 'HideHalfImage', 'HideQuarterImage',
+                             'HideRandomBlock', 'RandomBlockMasking', 'GetNormalizedAxis', 'GaussianPyramid',
+                             'LaplacianPyramid'],
+    'pipeline.ML_steps': ['BatchGenerator', 'BucketBatchGenerator', 'OneHotEncoder', 'KerasTrainingGenerator',
+                          'KerasTestGenerator', 'KerasValidationGenerator', 'SinglePassData'],
+    'pipeline.debug_steps': ['DebugStep', 'PreviewType', 'PreviewIdentity'],
+    'pipeline.dicom_steps': ['DicomSource'],
+    'pipeline.keras_adapters': ['PipelineSequence', 'to_dataset', 'get_output_signature'],
+    'pipeline.optimization': ['FilterPushdownReport', 'push_down_filters', 'fuse_geometric_steps', 'fuse_morphology'],
+    'pipeline.autotune': ['ExecutionConfig', 'Autotuner'],
+    'pipeline.data_service': ['PipelineServer', 'RemoteSource'],
+    'pipeline.shared_memory': ['SharedMemoryRing', 'SharedMemorySource', 'SharedMemoryProducers'],
+    'pipeline.shared_cache': ['SharedCache', 'write_shared_cache'],
+}
+
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name: str):
+    if name not in _MODULES: raise AttributeError(f"module 'pipeline' has no attribute '{name}'")
+
+    value = getattr(importlib.import_module(_MODULES[name]), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,202 @@
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil, inf
+from typing import Dict, Generator, List
+
+import numpy as np
+
+from pipeline.pipeline_step_view import PipelineStepView
+from pipeline.transformer import FunctionTransformer
+
+
+class ExecutionConfig:
+    """
+    The execution parameters chosen by Autotuner: the number of threads of the shared thread pool ('nr_threads') and
+    the view arguments set per view ('view_arguments', keyed by the position of the view in 'get_all_views'), i.e.
+    'nr_parallel_elements' for FunctionTransformer's which release the GIL and 'prefetch' for buffered views.
+
+    A config can be frozen with 'to_dict' (which is JSON-serializable) and restored with 'from_dict'.
+    """
+
+    def __init__(self, nr_threads=0, view_arguments: Dict[int, dict] = None):
+        self.nr_threads = nr_threads
+        self.view_arguments = dict() if view_arguments is None else view_arguments
+
+    def to_dict(self) -> dict:
+        return {'nr_threads': self.nr_threads,
+                'view_arguments': {str(position): a for position, a in self.view_arguments.items()}}
+
+    @staticmethod
+    def from_dict(config: dict) -> 'ExecutionConfig':
+        return ExecutionConfig(config['nr_threads'],
+                               {int(position): a for position, a in config['view_arguments'].items()})
+
+    def apply(self, view: PipelineStepView, thread_pool: ThreadPoolExecutor = None) -> PipelineStepView:
+        """Returns a clone of 'view' with the view arguments of this config, using 'thread_pool' if needed."""
+        view = view.get_view()
+        views = view.get_all_views()
+
+        assert all([p < len(views) for p in self.view_arguments]), 'The config belongs to a differently wired graph.'
+
+        for position, arguments in self.view_arguments.items():
+            views[position].arguments.update(arguments)
+            if 'nr_parallel_elements' in arguments: views[position].arguments['thread_pool'] = thread_pool
+
+        return view
+
+    def __str__(self):
+        return f'{self.nr_threads} threads, view arguments {self.view_arguments}'
+
+
+class Autotuner:
+    """
+    Iterates through a view while tuning its execution. During the first 'nr_warmup_elements' elements, the exclusive
+    latency of every view (i.e. without the time spent in its incoming views), the size of its outputs and the time
+    the consumer needs per element are measured. Then, the execution parameters are chosen (see ExecutionConfig) and
+    the remaining elements are obtained from a tuned clone of the view.
+
+    The parameters are chosen within 'cpu_budget' threads (by default the number of CPUs) and 'memory_budget' bytes
+    of buffered elements:
+        - The final view prefetches enough elements to hide the latency of the pipeline from the consumer.
+        - The most expensive FunctionTransformer's which release the GIL process as many elements in parallel as
+          needed to keep up with the consumer, using a shared thread pool. As these views run concurrently, the pool
+          has one thread per element processed in parallel by any of them.
+
+    The chosen config is available as 'config' after the warm-up. If 'config' is provided, no measurements are done
+    and the config is used directly, e.g. to reproduce a previous run.
+    """
+
+    def __init__(self, view: PipelineStepView, nr_warmup_elements=50, cpu_budget: int = None,
+                 memory_budget: float = inf, config: ExecutionConfig = None):
+        self.view = view
+        self.nr_warmup_elements = nr_warmup_elements
+        self.cpu_budget = os.cpu_count() if cpu_budget is None else cpu_budget
+        self.memory_budget = memory_budget
+
+        self.config = config
+        self.thread_pool = None
+        self.measured_view = None
+
+        self.latencies = dict()
+        self.output_sizes = dict()
+        self.consumer_time = None
+
+    def __iter__(self) -> Generator:
+        if self.config is None:
+            yield from self._measure()
+            self.config = self._choose_config()
+            logging.info(f'Autotuned execution: {self.config}')
+
+        if self.config.nr_threads > 0 and self.thread_pool is None:
+            self.thread_pool = ThreadPoolExecutor(self.config.nr_threads)
+
+        view = self.config.apply(self.view if self.measured_view is None else self.measured_view, self.thread_pool)
+
+        # the tuned view continues from the state of the measured one, including its queued and prefetched elements
+        if self.measured_view is not None: view.load_state_dict(self.measured_view.state_dict())
+
+        yield from view.get_generator()
+
+    def close(self):
+        if self.thread_pool is not None: self.thread_pool.shutdown(wait=False)
+
+    def _measure(self) -> Generator:
+        view = self.measured_view = self.view.get_view(prefetch=None)
+        profiler = _Profiler(view.get_all_views())
+
+        generator = view.get_generator()
+        consumer_time = 0.0
+
+        for _ in range(self.nr_warmup_elements):
+            element = next(generator)
+
+            start = time.perf_counter()
+            yield element
+            consumer_time += time.perf_counter() - start
+
+        # the latencies are given per element of the final view
+        self.latencies = {p: t / self.nr_warmup_elements for p, t in profiler.exclusive_times.items()}
+        self.output_sizes = {p: profiler.output_sizes[p] / max(profiler.nr_calls[p], 1) for p in profiler.nr_calls}
+        self.consumer_time = consumer_time / self.nr_warmup_elements
+
+    def _choose_config(self) -> ExecutionConfig:
+        views = self.view.get_all_views()
+        config = ExecutionConfig()
+
+        consumer_time = max(self.consumer_time, 1e-6)
+        pipeline_time = sum(self.latencies.values())
+
+        nr_threads_left = self.cpu_budget - 1
+        memory_left = self.memory_budget
+
+        final = len(views) - 1
+        if nr_threads_left > 0:
+            depth = min(ceil(pipeline_time / consumer_time) + 1, 64)
+            depth = int(min(depth, memory_left // max(self.output_sizes.get(final, 0), 1)))
+
+            if depth > 0:
+                config.view_arguments[final] = {'prefetch': depth}
+                nr_threads_left -= 1
+                memory_left -= depth * self.output_sizes.get(final, 0)
+
+        candidates = [p for p, v in enumerate(views)
+                      if isinstance(v.step, FunctionTransformer) and v.step.releases_gil and not v.is_cached]
+
+        for position in sorted(candidates, key=lambda p: -self.latencies.get(p, 0)):
+            if nr_threads_left <= 1: break
+
+            nr_parallel = min(ceil(self.latencies.get(position, 0) / consumer_time), nr_threads_left)
+            nr_parallel = int(min(nr_parallel, memory_left // max(self.output_sizes.get(position, 0), 1)))
+            if nr_parallel <= 1: continue
+
+            config.view_arguments.setdefault(position, dict())['nr_parallel_elements'] = nr_parallel
+            config.nr_threads += nr_parallel
+            nr_threads_left -= nr_parallel
+            memory_left -= nr_parallel * self.output_sizes.get(position, 0)
+
+        return config
+
+
+class _Profiler:
+    """
+    Measures the exclusive time spent in every view (keyed by its position in 'views') by wrapping the method which
+    computes the outgoing data of the view.
+    """
+
+    def __init__(self, views: List[PipelineStepView]):
+        self.exclusive_times = Counter()
+        self.output_sizes = Counter()
+        self.nr_calls = Counter()
+
+        # the time spent in nested calls of incoming views, for every running call
+        self.stack = []
+
+        for position, view in enumerate(views): self._wrap(position, view)
+
+    def _wrap(self, position: int, view: PipelineStepView):
+        compute = view._next_outgoing_data
+
+        def timed_compute():
+            self.stack.append(0.0)
+            start = time.perf_counter()
+
+            try:
+                outgoing_data = compute()
+                self.output_sizes[position] += _get_size(outgoing_data)
+                self.nr_calls[position] += 1
+                return outgoing_data
+
+            finally:
+                elapsed = time.perf_counter() - start
+                self.exclusive_times[position] += elapsed - self.stack.pop()
+                if self.stack: self.stack[-1] += elapsed
+
+        view._next_outgoing_data = timed_compute
+
+
+def _get_size(data) -> int:
+    if isinstance(data, (list, tuple)): return sum([_get_size(d) for d in data])
+    return data.nbytes if isinstance(data, np.ndarray) else 0
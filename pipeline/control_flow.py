@@ -1,6 +1,12 @@
+import threading
+from abc import abstractmethod
 from copy import deepcopy
-from typing import Generator, List, Union
+from queue import Queue, Full
+from typing import Generator, List, Union, Callable
 
+import numpy as np
+
+from pipeline.exceptions import IteratedThroughAll
 from pipeline.pipeline_step import PipelineStep
 from pipeline.pipeline_step_view import PipelineStepView
 
@@ -38,9 +44,11 @@ class DuplicateStream(PipelineStep):
         super().__init__(**arguments)
         self.nr_duplications = nr_duplications
 
-    def get_next(self, previous: Generator, **arguments) -> Generator:
+    def get_next(self, previous: Generator, needed_outputs: List[int] = None, **arguments) -> Generator:
         inputs = next(previous)
-        yield [deepcopy(i) for _ in range(self.nr_duplications) for i in inputs]
+        outputs = [i for _ in range(self.nr_duplications) for i in inputs]
+
+        yield [deepcopy(o) if needed_outputs is None or k in needed_outputs else None for k, o in enumerate(outputs)]
 
 
 class Duplicator(PipelineStep):
@@ -66,8 +74,170 @@ class RoundRobinMerger(PipelineStep):
         super().__init__(**arguments)
         self.merged_steps = merged_steps
 
-    def get_next(self, previous: Generator, **arguments) -> Generator:
+    def get_next(self, previous: Generator, needed_outputs: List[int] = None, **arguments) -> Generator:
         output = []
         while len(output) < self.merged_steps:
             output += next(previous)
-        yield output
+
+        # all incoming elements are consumed anyway, but the ones never read are not kept in the queues
+        yield [o if needed_outputs is None or k in needed_outputs else None for k, o in enumerate(output)]
+
+
+class WeightedInterleave(PipelineStep):
+    """
+    A pipeline step which interleaves the elements of several incoming views (e.g. different datasets), which all
+    have to have the same number of streams.
+
+    Every incoming view is read by its own thread, which reads up to 'read_ahead' elements in advance. Every outgoing
+    element is taken from a view sampled according to 'weights' (equal weights by default). If the sampled view has
+    no element ready, an element of another view is taken instead and the sampled view is compensated as soon as it
+    has elements ready again (for at most 'read_ahead' missed elements). A slow view therefore does not block the
+    others; its share is only reached while it keeps up.
+
+    An incoming view which raises IteratedThroughAll (see 'all_then_stop') is no longer sampled, the others continue.
+    Once all incoming views are exhausted, IteratedThroughAll is raised. If 'output_source' is set, the index of the
+    incoming view is appended as an additional stream.
+    """
+
+    separate_inputs = True
+
+    def get_next(self, previous: List[Generator], weights: List[float] = None, read_ahead=4, output_source=False,
+                 rng=None, **arguments) -> Generator:
+        weights = np.ones(len(previous)) if weights is None else np.asarray(weights, dtype=float)
+        assert len(weights) == len(previous), 'The number of weights does not match the number of incoming views.'
+
+        queues = [Queue(read_ahead) for _ in previous]
+        is_ready = threading.Condition()
+        is_stopped = threading.Event()
+
+        for generator, queue in zip(previous, queues):
+            threading.Thread(target=_read_ahead, args=(generator, queue, is_ready, is_stopped), daemon=True).start()
+
+        active = set(range(len(previous)))
+        # the number of elements every view has missed because it had no element ready
+        missed = np.zeros(len(previous), dtype=int)
+
+        try:
+            while active:
+                with is_ready:
+                    is_ready.wait_for(lambda: any([not queues[i].empty() for i in active]))
+
+                ready = [i for i in sorted(active) if not queues[i].empty()]
+                compensated = [i for i in ready if missed[i] > 0]
+
+                if compensated:
+                    source = compensated[0]
+                    missed[source] -= 1
+                else:
+                    source = _sample(sorted(active), weights, rng)
+
+                    if source not in ready:
+                        missed[source] = min(missed[source] + 1, read_ahead)
+                        source = _sample(ready, weights, rng)
+
+                element, exception = queues[source].get()
+
+                if isinstance(exception, IteratedThroughAll):
+                    active.remove(source)
+                elif exception is not None:
+                    raise exception
+                else:
+                    yield element + [source] if output_source else element
+
+            raise IteratedThroughAll()
+
+        finally:
+            is_stopped.set()
+
+
+def _sample(sources: List[int], weights: np.ndarray, rng) -> int:
+    return sources[rng.choice(len(sources), p=weights[sources] / np.sum(weights[sources]))]
+
+
+def _read_ahead(generator: Generator, queue: Queue, is_ready: threading.Condition, is_stopped: threading.Event):
+    """Puts the elements of 'generator' (or the exception raised by it) into 'queue' until 'is_stopped' is set."""
+    while not is_stopped.is_set():
+        try:
+            item = (next(generator), None)
+        except Exception as e:
+            item = (None, e)
+
+        while not is_stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                break
+            except Full:
+                pass
+
+        with is_ready:
+            is_ready.notify()
+
+        if item[1] is not None: return
+
+
+class CachePoint(PipelineStep):
+    """
+    A pipeline step which marks a cache point in the middle of a pipeline graph. Before the first element is
+    requested, all incoming data is generated once and cached (see PipelineStepView.cache_or_load). The preceding
+    deterministic steps are thus only executed once, whereas the succeeding steps (e.g. random augmentations) are
+    executed again in every epoch, fed from the cache.
+
+    If the view argument 'cache_filepath' is provided, the cache is stored at and loaded from this file. Otherwise,
+    it is only kept in memory. As the cache depends on the view arguments, different views should use different files.
+    """
+
+    is_cache_point = True
+
+    def get_next(self, previous: Generator, **arguments) -> Generator:
+        yield next(previous)
+
+
+class Filter(PipelineStep):
+    """
+    The base class for pipeline steps which only drop elements. Concrete implementations have to provide 'accept',
+    which decides whether an element (the list of incoming elements of all streams) is passed on.
+
+    'commutes_with' contains the step classes a filter can be moved in front of without changing which elements are
+    accepted. 'pre_check' is an optional cheap function with the same signature as 'accept', which is applied to the
+    raw data early in the pipeline. Both are used by pipeline.optimization.push_down_filters.
+
+    The number of checked and rejected elements is counted in 'nr_checked' and 'nr_rejected'.
+    """
+
+    commutes_with = ()
+
+    def __init__(self, pre_check: Callable = None, **arguments):
+        super().__init__(**arguments)
+        self.pre_check = pre_check
+        self.nr_checked = 0
+        self.nr_rejected = 0
+
+    def get_next(self, previous: Generator, **arguments) -> Generator:
+        for inputs in previous:
+            self.nr_checked += 1
+
+            if self.accept(inputs, **arguments):
+                yield inputs
+            else:
+                self.nr_rejected += 1
+
+    def state_dict(self) -> dict:
+        return {'nr_checked': self.nr_checked, 'nr_rejected': self.nr_rejected}
+
+    def load_state_dict(self, state: dict):
+        self.nr_checked, self.nr_rejected = state['nr_checked'], state['nr_rejected']
+
+    @abstractmethod
+    def accept(self, inputs: List, **arguments) -> bool:
+        pass
+
+
+class FunctionFilter(Filter):
+    """A filter which only passes on elements for which 'function' returns true."""
+
+    def __init__(self, function: Callable = None, **arguments):
+        super().__init__(**arguments)
+        self.function = function
+
+    def accept(self, inputs: List, **arguments) -> bool:
+        return self.function(inputs, **arguments)
@@ -0,0 +1,255 @@
+import logging
+import socket
+import struct
+import threading
+from queue import Queue, Empty, Full
+from typing import Generator, List, Tuple, Union
+
+import numpy as np
+
+from pipeline.dtypes import encode_dtype, decode_dtype, quantized
+from pipeline.exceptions import IteratedThroughAll, RemotePipelineError
+from pipeline.pipeline_step import FirstPipelineStep
+from pipeline.pipeline_step_view import PipelineStepView
+
+# every frame starts with its kind and the number of arrays it contains
+_FRAME_HEADER = struct.Struct('!BI')
+_ELEMENT, _END_OF_EPOCH, _ERROR = 0, 1, 2
+
+_SHARD_HEADER = struct.Struct('!I')
+
+
+class PipelineServer:
+    """
+    Hosts a PipelineStepView and streams its elements to 'nr_clients' clients (see RemoteSource), such that several
+    training processes on one node can share one running pipeline.
+
+    'address' is either a (host, port) tuple for a TCP socket (port 0 picks a free port) or a path for a unix socket.
+    The actual address is available as 'address' after 'start'.
+
+    The view is iterated epoch by epoch (using 'all_then_stop') in a background thread. The k-th element of every
+    epoch is sent to the client with shard index k % 'nr_clients', so the sharding is deterministic. Up to 'prefetch'
+    elements are buffered per client. If the view argument 'seed' is provided, every epoch is seeded with the seed and
+    the epoch number.
+
+    Every element is sent as a list of numpy arrays (see 'write_frame'). If the view raises an exception, it is sent
+    to all clients (which raise a RemotePipelineError) and no further elements are produced. Clients with an invalid
+    shard index receive an error as well and are disconnected.
+    """
+
+    def __init__(self, view: PipelineStepView, nr_clients=1, address: Union[Tuple, str] = ('127.0.0.1', 0),
+                 prefetch=16):
+        self.view = view
+        self.nr_clients = nr_clients
+        self.address = address
+        self.prefetch = prefetch
+
+        self.queues = [Queue(prefetch) for _ in range(nr_clients)]
+        self.is_stopped = threading.Event()
+        self.server_socket = None
+        self.connections = []
+        self.threads = []
+
+    def start(self):
+        family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+        self.server_socket = socket.socket(family, socket.SOCK_STREAM)
+        self.server_socket.bind(self.address)
+        self.server_socket.listen(self.nr_clients)
+        self.address = self.server_socket.getsockname()
+
+        self._start_thread(self._produce)
+        self._start_thread(self._accept)
+
+        logging.info(f'Serving pipeline at {self.address} for {self.nr_clients} clients.')
+        return self
+
+    def stop(self):
+        self.is_stopped.set()
+
+        for s in self.connections + [self.server_socket]:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            s.close()
+
+        for thread in self.threads: thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def _produce(self):
+        epoch = 0
+
+        while not self.is_stopped.is_set():
+            view = self.view.get_view(all_then_stop=True)
+
+            if self.view.arguments.get('seed') is not None:
+                seed_sequence = self.view.seed_sequence
+                view.reseed(np.random.SeedSequence(seed_sequence.entropy, spawn_key=seed_sequence.spawn_key + (epoch,)))
+
+            generator = view.get_generator()
+            position = 0
+
+            try:
+                while True:
+                    self._put(self.queues[position % self.nr_clients], (_ELEMENT, next(generator)))
+                    position += 1
+            except IteratedThroughAll:
+                pass
+            except Exception as e:
+                logging.exception('The served pipeline raised an exception.')
+
+                for q in self.queues: self._put(q, (_ERROR, [_encode_message(f'{type(e).__name__}: {e}')]))
+                return
+
+            for q in self.queues: self._put(q, (_END_OF_EPOCH, []))
+            epoch += 1
+
+    def _accept(self):
+        while not self.is_stopped.is_set():
+            try:
+                connection, _ = self.server_socket.accept()
+            except OSError:
+                return
+
+            self.connections.append(connection)
+            self._start_thread(self._serve, connection)
+
+    def _serve(self, connection: socket.socket):
+        try:
+            shard_index, = _SHARD_HEADER.unpack(_receive_exactly(connection, _SHARD_HEADER.size))
+
+            if shard_index >= self.nr_clients:
+                message = f'Shard index {shard_index} is out of range for {self.nr_clients} clients.'
+                write_frame(connection, _ERROR, [_encode_message(message)])
+                connection.close()
+                return
+
+            while not self.is_stopped.is_set():
+                try:
+                    kind, element = self.queues[shard_index].get(timeout=0.1)
+                except Empty:
+                    continue
+
+                write_frame(connection, kind, element)
+
+                if kind == _ERROR:
+                    connection.close()
+                    return
+
+        except (OSError, ConnectionError):
+            pass
+
+    def _put(self, queue: Queue, item):
+        while not self.is_stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+
+class RemoteSource(FirstPipelineStep):
+    """
+    A data source yielding the elements streamed by a PipelineServer at 'address'. The client receives the shard
+    'shard_index' of every epoch. At the end of an epoch, 'finished_iteration' is called if the view argument
+    'all_then_stop' is provided, otherwise the next epoch follows directly. Errors sent by the server are raised as
+    RemotePipelineError.
+    """
+
+    def __init__(self, address: Union[Tuple, str], shard_index=0, **arguments):
+        super().__init__(**arguments)
+        self.address = address
+        self.shard_index = shard_index
+        self.connection = None
+
+    def get_next(self, previous: Generator, all_then_stop=False, **arguments) -> Generator:
+        if self.connection is None: self._connect()
+
+        kind, element = self._read_frame()
+
+        if kind == _END_OF_EPOCH:
+            if all_then_stop: self.finished_iteration()
+            kind, element = self._read_frame()
+
+        yield element
+
+    def close(self):
+        if self.connection is not None: self.connection.close()
+        self.connection = None
+
+    def _connect(self):
+        family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+        self.connection = socket.socket(family, socket.SOCK_STREAM)
+        self.connection.connect(self.address)
+        self.connection.sendall(_SHARD_HEADER.pack(self.shard_index))
+
+    def _read_frame(self) -> Tuple[int, List[np.ndarray]]:
+        kind, arrays = read_frame(self.connection)
+        if kind == _ERROR: raise RemotePipelineError(_decode_message(arrays[0]))
+        return kind, arrays
+
+
+def write_frame(connection: socket.socket, kind: int, arrays: List):
+    """
+    Sends a frame containing 'arrays'. Every array is sent as its dtype, its shape and its raw data (non-array
+    elements are converted with numpy.asarray).
+    """
+    connection.sendall(_FRAME_HEADER.pack(kind, len(arrays)))
+
+    for array in arrays:
+        array = np.asanyarray(array, order='C')
+        dtype = encode_dtype(array)
+
+        connection.sendall(struct.pack(f'!B{len(dtype)}sB{array.ndim}Q', len(dtype), dtype, array.ndim, *array.shape))
+        connection.sendall(array.reshape(-1).view(np.uint8).data)
+
+
+def read_frame(connection: socket.socket) -> Tuple[int, List[np.ndarray]]:
+    """Receives a frame sent by 'write_frame' and returns its kind and its arrays."""
+    kind, nr_arrays = _FRAME_HEADER.unpack(_receive_exactly(connection, _FRAME_HEADER.size))
+
+    arrays = []
+    for _ in range(nr_arrays):
+        dtype_length, = struct.unpack('!B', _receive_exactly(connection, 1))
+        dtype, is_quantized = decode_dtype(_receive_exactly(connection, dtype_length))
+
+        ndim, = struct.unpack('!B', _receive_exactly(connection, 1))
+        shape = struct.unpack(f'!{ndim}Q', _receive_exactly(connection, 8 * ndim))
+
+        data = _receive_exactly(connection, dtype.itemsize * int(np.prod(shape)))
+        array = np.frombuffer(data, dtype=dtype).reshape(shape)
+        arrays.append(quantized(array) if is_quantized else array)
+
+    return kind, arrays
+
+
+def _encode_message(message: str) -> np.ndarray:
+    return np.frombuffer(message.encode(), dtype=np.uint8)
+
+
+def _decode_message(array: np.ndarray) -> str:
+    return array.tobytes().decode()
+
+
+def _receive_exactly(connection: socket.socket, nr_bytes: int) -> bytearray:
+    data = bytearray(nr_bytes)
+    view = memoryview(data)
+
+    while nr_bytes > 0:
+        nr_received = connection.recv_into(view, nr_bytes)
+        if nr_received == 0: raise ConnectionError('The connection has been closed.')
+
+        view = view[nr_received:]
+        nr_bytes -= nr_received
+
+    return data
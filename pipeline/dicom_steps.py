@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import zlib
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Generator, List
+
+import numpy as np
+
+from pipeline.lazy_modules import LazyModule
+from pipeline.pipeline_step import FirstPipelineStep
+
+pydicom = LazyModule('pydicom')
+
+
+class DicomSource(FirstPipelineStep):
+    """
+    A data source yielding the pixel data of all DICOM files in 'directory' (including subdirectories), ordered by
+    patient, series and instance number.
+
+    The directory is only scanned once: the headers are read without the pixel data and stored in an index at
+    'index_filepath' (by default 'dicom_index.json' in 'directory'), which is loaded instead of scanning again. Every
+    entry of the index contains the file path, the patient id, the series instance uid, the instance number, the
+    shape of the pixel data and the bin of the file. The bins are derived from the patient id, such that all images
+    of a patient are in the same of the 'n_bins' bins.
+
+    If the view argument 'bins_included' is provided, only the files in the given bins are used. This allows to split
+    the data (e.g. into a training and a test set) without opening any file.
+
+    The pixel data is decoded in a thread pool (the view argument 'thread_pool' if provided, otherwise a pool with
+    'nr_threads' threads, which is shut down at the end of every pass through the files or when the iteration is
+    abandoned), while up to 'read_ahead' files are decoded in advance.
+
+    After all files have been yielded, 'finished_iteration' is called if the view argument 'all_then_stop' is
+    provided, otherwise the files are yielded again. The position is kept separately for every 'bins_included', such
+    that views of different splits do not interfere.
+    """
+
+    def __init__(self, directory: str, index_filepath: str = None, n_bins=10, nr_threads=4, **arguments):
+        super().__init__(**arguments)
+
+        self.directory = directory
+        self.index_filepath = os.path.join(directory, 'dicom_index.json') if index_filepath is None \
+            else index_filepath
+        self.n_bins = n_bins
+        self.nr_threads = nr_threads
+
+        self.index = None
+        self.next_indices = dict()
+
+    def get_next(self, previous: Generator, bins_included: List[int] = None, thread_pool: Executor = None,
+                 read_ahead=8, all_then_stop=False, **arguments) -> Generator:
+        entries = self.get_entries(bins_included)
+        assert entries, f'No DICOM files found in {self.directory} for the bins {bins_included}.'
+
+        owned_thread_pool = None
+        if thread_pool is None:
+            thread_pool = owned_thread_pool = ThreadPoolExecutor(self.nr_threads, thread_name_prefix='DicomSource')
+
+        split = None if bins_included is None else tuple(sorted(bins_included))
+
+        # the files from the current position on are submitted in order, at most 'read_ahead' files are pending
+        pending = deque()
+        next_submitted = self.next_indices.get(split, 0)
+
+        try:
+            while self.next_indices.get(split, 0) < len(entries):
+                while next_submitted < len(entries) and len(pending) < max(read_ahead, 1):
+                    pending.append(thread_pool.submit(_read_pixel_data, entries[next_submitted]['filepath']))
+                    next_submitted += 1
+
+                pixel_data = pending.popleft().result()
+                self.next_indices[split] = self.next_indices.get(split, 0) + 1
+
+                yield [pixel_data]
+
+            self.next_indices[split] = 0
+            if all_then_stop: self.finished_iteration()
+
+        finally:
+            if owned_thread_pool is not None: owned_thread_pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_entries(self, bins_included: List[int] = None) -> List[dict]:
+        """Returns the index entries of all files in the bins 'bins_included' (all files if None)."""
+        if self.index is None:
+            self.index = self._load_or_build_index()
+            for entry in self.index: entry['filepath'] = os.path.join(self.directory, entry['filepath'])
+
+        return [e for e in self.index if bins_included is None or e['bin'] in bins_included]
+
+    def _load_or_build_index(self) -> List[dict]:
+        """Returns the entries of the index, with file paths relative to 'directory'."""
+        if os.path.isfile(self.index_filepath):
+            with open(self.index_filepath, 'r') as file:
+                index = json.load(file)
+
+            if index['n_bins'] == self.n_bins: return index['entries']
+
+        entries = []
+
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                filepath = os.path.join(root, filename)
+                if os.path.abspath(filepath) == os.path.abspath(self.index_filepath): continue
+
+                try:
+                    header = pydicom.dcmread(filepath, stop_before_pixels=True)
+                except pydicom.errors.InvalidDicomError:
+                    continue
+
+                entries.append(self._get_entry(os.path.relpath(filepath, self.directory), header))
+
+        entries.sort(key=lambda e: (e['patient_id'], e['series_uid'], e['instance_number'], e['filepath']))
+
+        temporary_filepath = f'{self.index_filepath}.{os.getpid()}.tmp'
+        with open(temporary_filepath, 'w') as file:
+            json.dump({'n_bins': self.n_bins, 'entries': entries}, file)
+        os.replace(temporary_filepath, self.index_filepath)
+
+        logging.info(f'Indexed {len(entries)} DICOM files in {self.directory}.')
+        return entries
+
+    def _get_entry(self, filepath: str, header) -> dict:
+        patient_id = str(header.get('PatientID', ''))
+
+        shape = [int(header.get('Rows', 0)), int(header.get('Columns', 0))]
+        if int(header.get('NumberOfFrames', 1) or 1) > 1: shape = [int(header.NumberOfFrames)] + shape
+        if int(header.get('SamplesPerPixel', 1)) > 1: shape.append(int(header.SamplesPerPixel))
+
+        return {
+            'filepath': filepath,
+            'patient_id': patient_id,
+            'series_uid': str(header.get('SeriesInstanceUID', '')),
+            'instance_number': int(header.get('InstanceNumber', 0) or 0),
+            'shape': shape,
+            # crc32 is stable across processes, as opposed to 'hash'
+            'bin': zlib.crc32(patient_id.encode()) % self.n_bins
+        }
+
+    def state_dict(self) -> dict:
+        return {'next_indices': dict(self.next_indices)}
+
+    def load_state_dict(self, state: dict):
+        self.next_indices = dict(state['next_indices'])
+
+
+def _read_pixel_data(filepath: str) -> np.ndarray:
+    return pydicom.dcmread(filepath).pixel_array
@@ -0,0 +1,130 @@
+"""
+The dtype policy of a pipeline is set with two view arguments, which are passed to every step:
+    - 'dtype': the dtype of all floating-point data produced by the steps (e.g. 'float32').
+    - 'storage_dtype': if 'uint8', image steps such as Rescale produce images quantized to [0, 255], so that caches
+      need a quarter of the memory of float32. The batch steps convert them to 'dtype' (in [0, 1]) while assembling
+      the batches.
+If they are not provided, the steps keep the dtypes they always produced.
+
+Quantized images are marked as QuantizedArray, so that only they are dequantized, whereas other uint8 data (e.g.
+masks or class ids) keeps its values. FunctionTransformers keep the mark for their uint8 results of quantized inputs
+(see FunctionTransformer.returns_quantized), the caches and the transports between processes keep it as well.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+_QUANTIZATION_SCALE = 255
+
+
+class QuantizedArray(np.ndarray):
+    """
+    A numpy array holding quantized values in [0, 255] (see 'storage_dtype'). The mark is kept by views (e.g. slices
+    and reshapes), but not by the results of arithmetic operations, as they usually change the meaning of the values.
+    """
+
+    def __array_wrap__(self, array, context=None, return_scalar=False):
+        array = array.view(np.ndarray)
+        return array[()] if return_scalar else array
+
+
+def quantized(array) -> QuantizedArray:
+    """Marks 'array' as holding quantized values (without copying it)."""
+    return np.asarray(array).view(QuantizedArray)
+
+
+def is_quantized_array(element) -> bool:
+    return isinstance(element, QuantizedArray)
+
+
+def encode_dtype(array: np.ndarray) -> bytes:
+    """Returns the dtype of 'array' as bytes, including its quantization mark (see 'decode_dtype')."""
+    return (('q' if is_quantized_array(array) else '') + array.dtype.str).encode()
+
+
+def decode_dtype(code: bytes) -> Tuple[np.dtype, bool]:
+    """Returns the dtype encoded by 'encode_dtype' and whether the array is quantized."""
+    code = code.decode()
+    return np.dtype(code.lstrip('q')), code.startswith('q')
+
+
+def get_dtype(dtype, default=None) -> np.dtype:
+    """Returns 'dtype' as a numpy dtype, or 'default' if 'dtype' is None."""
+    if dtype is None: return None if default is None else np.dtype(default)
+    return np.dtype(dtype)
+
+
+def is_quantized(storage_dtype) -> bool:
+    return storage_dtype is not None and np.dtype(storage_dtype) == np.uint8
+
+
+def get_batch_dtype(element_dtype, dtype=None, is_quantized_element=False) -> np.dtype:
+    """
+    Returns the dtype of a batch of elements of 'element_dtype'. The policy 'dtype' applies to floating-point
+    elements and to quantized elements (which are float32 by default), all other elements keep their dtype.
+    """
+    element_dtype = np.dtype(element_dtype)
+
+    if is_quantized_element: return get_dtype(dtype, np.float32)
+    if np.issubdtype(element_dtype, np.floating): return get_dtype(dtype, element_dtype)
+
+    return element_dtype
+
+
+def copy_into(out: np.ndarray, element):
+    """Copies 'element' into 'out', dequantizing it in the same pass if it is quantized (see QuantizedArray)."""
+    if is_quantized_array(element) and np.issubdtype(out.dtype, np.floating):
+        np.multiply(element, 1 / _QUANTIZATION_SCALE, out=out, dtype=out.dtype)
+    else:
+        out[...] = np.asarray(element)
+
+
+def stack(elements: List, dtype=None) -> np.ndarray:
+    """
+    Stacks 'elements' into a batch of the dtype given by the policy (see 'get_batch_dtype'). Every element is
+    converted while it is copied into the batch, without an additional pass over the batch.
+    """
+    first = elements[0]
+    if dtype is None and not is_quantized_array(first): return np.array(elements)
+
+    shape, element_dtype = np.shape(first), np.asarray(first).dtype
+    batch = np.empty((len(elements),) + shape, dtype=get_batch_dtype(element_dtype, dtype, is_quantized_array(first)))
+
+    for i, element in enumerate(elements):
+        copy_into(batch[i, ...], element)
+
+    return batch
+
+
+def get_normalized_dtype(element_dtype, dtype=None, storage_dtype=None) -> np.dtype:
+    """Returns the dtype of the result of 'normalize' for an array of 'element_dtype'."""
+    if is_quantized(storage_dtype): return np.dtype(np.uint8)
+
+    # without a policy, integers are normalized in float64 and floats keep their dtype
+    element_dtype = np.dtype(element_dtype)
+    return get_dtype(dtype, element_dtype if np.issubdtype(element_dtype, np.floating) else np.float64)
+
+
+def normalize(array: np.ndarray, minimum, maximum, dtype=None, storage_dtype=None, out: np.ndarray = None) \
+        -> np.ndarray:
+    """
+    Maps the values of 'array' from ['minimum', 'maximum'] to [0, 1], directly in the dtype of the policy. If
+    'storage_dtype' is 'uint8', the result is quantized to [0, 255] instead (and marked as QuantizedArray). If 'out'
+    is provided, the result is written into it.
+    """
+    array = np.asarray(array)
+
+    if is_quantized(storage_dtype):
+        result = np.subtract(array, minimum, dtype=np.float32)
+        if maximum > minimum: np.multiply(result, _QUANTIZATION_SCALE / (maximum - minimum), out=result)
+        np.rint(result, out=result)
+
+        if out is None: return quantized(result.astype(np.uint8))
+        out[...] = result
+        return out
+
+    result = np.subtract(array, minimum, out=out, dtype=get_normalized_dtype(array.dtype, dtype, storage_dtype))
+
+    if maximum > minimum: np.divide(result, maximum - minimum, out=result)
+    return result
@@ -1,2 +1,6 @@
 class IteratedThroughAll(Exception):
     pass
+
+
+class RemotePipelineError(Exception):
+    pass
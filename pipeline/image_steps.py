@@ -1,27 +1,43 @@
-from random import randint
-from typing import Generator
+from concurrent.futures import Executor
+from functools import lru_cache
+from typing import Generator, Callable, List, Tuple, Union
 from itertools import chain
 
-import matplotlib.pyplot as plt
 import numpy as np
-from cv2 import resize, INTER_AREA, fastNlMeansDenoising, erode, dilate
 
+from pipeline.control_flow import Filter, Identity
+from pipeline.dtypes import normalize, get_normalized_dtype, get_dtype, is_quantized
+from pipeline.lazy_modules import LazyModule
 from pipeline.pipeline_step import PipelineStep
 from pipeline.transformer import FunctionTransformer
 
-import cv2
+cv2 = LazyModule('cv2')
+plt = LazyModule('matplotlib.pyplot')
 
 class Rescale(FunctionTransformer):
+    """
+    Rescales the image to [0, 1]. The result is computed directly in the dtype of the policy given by the view
+    arguments 'dtype' and 'storage_dtype' (see pipeline.dtypes).
+    """
 
-    def transform(self, img, **arguments):
-        if np.max(img - np.min(img)) == 0: return img - np.min(img)
-        return (img - np.min(img)) / np.max(img - np.min(img))
+    supports_out = True
+
+    def transform(self, img, dtype=None, storage_dtype=None, out=None, **arguments):
+        return normalize(img, np.min(img), np.max(img), dtype, storage_dtype, out)
+
+    def get_output_spec(self, img, dtype=None, storage_dtype=None, **arguments):
+        return np.shape(img), get_normalized_dtype(np.asarray(img).dtype, dtype, storage_dtype)
+
+    def returns_quantized(self, img, storage_dtype=None, **arguments):
+        return is_quantized(storage_dtype)
 
 
 class Resize(FunctionTransformer):
 
+    releases_gil = True
+
     def transform(self, img, width=384, height=384, **arguments):
-        return resize(img, (width, height), interpolation=INTER_AREA)
+        return cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
 
 
 class AddChannel(FunctionTransformer):
@@ -43,54 +59,279 @@ class Reshape(FunctionTransformer):
 
 
 class RandomlyCrop(FunctionTransformer):
+    """
+    Crops a random region of size ('crop_height', 'crop_width'). If 'batched' is set, the input is a batch of images
+    and the positions of all crops are drawn at once.
+    """
+
+    def transform(self, image, crop_width=128, crop_height=128, rng=None, batched=False, **arguments):
+        rng = np.random.default_rng() if rng is None else rng
+
+        if batched: return self._crop_batch(image, crop_width, crop_height, rng)
 
-    def transform(self, image, crop_width=128, crop_height=128, **arguments):
         max_x = image.shape[1] - crop_width
         max_y = image.shape[0] - crop_height
 
-        x = np.random.randint(0, max_x)
-        y = np.random.randint(0, max_y)
+        x = rng.integers(0, max_x)
+        y = rng.integers(0, max_y)
 
         crop = image[y: y + crop_height, x: x + crop_width]
 
         return crop
 
+    def _crop_batch(self, images, crop_width, crop_height, rng):
+        max_x = images.shape[2] - crop_width
+        max_y = images.shape[1] - crop_height
+
+        x = rng.integers(0, max_x, size=len(images))
+        y = rng.integers(0, max_y, size=len(images))
+
+        rows = y[:, None] + np.arange(crop_height)
+        columns = x[:, None] + np.arange(crop_width)
+
+        return images[np.arange(len(images))[:, None, None], rows[:, :, None], columns[:, None, :]]
+
+
+class GeometricAugment(FunctionTransformer):
+    """
+    Applies a random crop, a resize and random flips, rotations, zooms and translations in a single warp, without
+    allocating any intermediate image. All transformations are composed into one affine matrix per image, which is
+    applied with cv2.warpAffine directly into the output size ('height', 'width').
+
+    The transformations are applied in the following order:
+        - a random crop of size ('crop_height', 'crop_width') (the whole image if not provided)
+        - a resize to ('height', 'width')
+        - a horizontal and vertical flip with the probabilities 'flip_horizontal' and 'flip_vertical'
+        - a rotation by up to 'max_rotation' degrees and a zoom by a factor in 'zoom_range' around the center
+        - a translation by up to 'max_translation' times the output size
+    Finally, the output is reshaped to 'output_shape' if provided.
+
+    If 'batched' is set, the input is a batch of images and every image gets its own transformation. 'interpolation'
+    and 'border_mode' are OpenCV flags (cv2.INTER_LINEAR and cv2.BORDER_REFLECT_101 by default).
+    """
+
+    releases_gil = True
+
+    def transform(self, image, width=384, height=384, crop_width=None, crop_height=None, flip_horizontal=0.0,
+                  flip_vertical=0.0, max_rotation=0.0, zoom_range=(1.0, 1.0), max_translation=0.0, output_shape=None,
+                  interpolation=None, border_mode=None, rng=None, batched=False, **arguments):
+        rng = np.random.default_rng() if rng is None else rng
+        interpolation = cv2.INTER_LINEAR if interpolation is None else interpolation
+        border_mode = cv2.BORDER_REFLECT_101 if border_mode is None else border_mode
+        images = image if batched else [image]
+
+        outputs = []
+        for image in images:
+            matrix = self._get_random_matrix(image.shape[:2], width, height, crop_width, crop_height, flip_horizontal,
+                                             flip_vertical, max_rotation, zoom_range, max_translation, rng)
+
+            output = cv2.warpAffine(image, matrix[:2], (width, height), flags=interpolation, borderMode=border_mode)
+            outputs.append(output if output_shape is None else output.reshape(output_shape))
+
+        return np.stack(outputs) if batched else outputs[0]
+
+    def _get_random_matrix(self, shape, width, height, crop_width, crop_height, flip_horizontal, flip_vertical,
+                           max_rotation, zoom_range, max_translation, rng) -> np.ndarray:
+        """Returns the 3x3 matrix mapping the pixel coordinates of the input to the ones of the output."""
+        crop_width = shape[1] if crop_width is None else crop_width
+        crop_height = shape[0] if crop_height is None else crop_height
+
+        # the positions are drawn like in RandomlyCrop, so that fused chains (see fuse_geometric_steps) crop the same
+        x = rng.integers(0, max(shape[1] - crop_width, 1))
+        y = rng.integers(0, max(shape[0] - crop_height, 1))
+
+        # pixel centers are at integer coordinates, the crop thus spans [-0.5, crop_size - 0.5]
+        matrix = _get_affine_matrix(translation=(-0.5, -0.5)) @ \
+            _get_affine_matrix(scale=(width / crop_width, height / crop_height)) @ \
+            _get_affine_matrix(translation=(0.5 - x, 0.5 - y))
+
+        # disabled transformations draw no random numbers
+        flip = (-1 if flip_horizontal > 0 and rng.random() < flip_horizontal else 1,
+                -1 if flip_vertical > 0 and rng.random() < flip_vertical else 1)
+        angle = np.deg2rad(rng.uniform(-max_rotation, max_rotation)) if max_rotation > 0 else 0.0
+        zoom = rng.uniform(*zoom_range) if zoom_range[0] != zoom_range[1] else zoom_range[0]
+        translation = rng.uniform(-max_translation, max_translation, size=2) * (width, height) \
+            if max_translation > 0 else np.zeros(2)
+
+        center = ((width - 1) / 2, (height - 1) / 2)
+
+        return _get_affine_matrix(translation=np.add(center, translation)) @ \
+            _get_affine_matrix(scale=(zoom, zoom), angle=angle) @ \
+            _get_affine_matrix(scale=flip) @ \
+            _get_affine_matrix(translation=(-center[0], -center[1])) @ matrix
+
+
+def _get_affine_matrix(translation=(0, 0), scale=(1, 1), angle=0.0) -> np.ndarray:
+    """Returns the 3x3 matrix of a rotation by 'angle' (in radians), followed by a scaling and a translation."""
+    cos, sin = np.cos(angle), np.sin(angle)
+
+    return np.array([[scale[0] * cos, -scale[0] * sin, translation[0]],
+                     [scale[1] * sin, scale[1] * cos, translation[1]],
+                     [0, 0, 1]])
+
+
+class AverageFilter(Filter):
+    """
+    Drops all elements where the mean of any incoming stream is not above 'min_avg'. The mean is not changed by
+    reshaping, thus the filter can be moved in front of these steps (but not in front of a resize, which changes the
+    mean slightly).
 
-class AverageFilter(PipelineStep):
+    To skip expensive steps such as Resize, Denoising or Rescale for rejected elements, a 'pre_check' estimating the
+    decision on the raw data has to be provided (see push_down_filters). There is no default, as the mean after these
+    steps depends on the data (e.g. on its value range for Rescale).
+    """
 
-    def get_next(self, previous: Generator, min_avg=0.1, **arguments) -> Generator:
-        for stream in previous:
-            if all([np.mean(image) > min_avg for image in stream]): yield stream
+    commutes_with = (Identity, Reshape, AddChannel, ToRGB)
+
+    def accept(self, inputs: List, min_avg=0.1, **arguments) -> bool:
+        return all([np.mean(image) > min_avg for image in inputs])
 
 
 class Denoising(FunctionTransformer):
+    """
+    Denoises images with fastNlMeansDenoising. Images with more than 3 channels are denoised channel by channel. If a
+    'thread_pool' is provided, all channels are denoised concurrently.
+    """
+
+    releases_gil = True
 
     def transform(self, img, h=10, template_window_size=3, search_window_size=7, **arguments):
         if img.shape[-1] <= 3:
-            return fastNlMeansDenoising(img, None, h, template_window_size, search_window_size)
+            return cv2.fastNlMeansDenoising(img, None, h, template_window_size, search_window_size)
 
         denoised_channels = list()
 
         for c in range(img.shape[-1]):
-            denoised_channels.append(
-                fastNlMeansDenoising(img[:, :, c], None, h, template_window_size, search_window_size))
-            denoised_channels[-1] = denoised_channels[-1].reshape(denoised_channels[-1].shape + (1,))
+            denoised_channels.append(self._denoise_channel(img, c, h, template_window_size, search_window_size))
 
         return np.concatenate(denoised_channels, axis=2)
 
+    def _denoise_channel(self, img, c, h, template_window_size, search_window_size):
+        denoised = cv2.fastNlMeansDenoising(np.ascontiguousarray(img[:, :, c]), None, h, template_window_size,
+                                            search_window_size)
+        return denoised.reshape(denoised.shape + (1,))
+
+    def _submit(self, thread_pool: Executor, img, arguments: dict) -> Callable:
+        if img.shape[-1] <= 3: return super()._submit(thread_pool, img, arguments)
+
+        h = arguments.get('h', 10)
+        template_window_size = arguments.get('template_window_size', 3)
+        search_window_size = arguments.get('search_window_size', 7)
+
+        channels = [thread_pool.submit(self._denoise_channel, img, c, h, template_window_size, search_window_size)
+                    for c in range(img.shape[-1])]
+
+        return lambda: np.concatenate([c.result() for c in channels], axis=2)
+
 
 class Dilation(FunctionTransformer):
 
-    def transform(self, img, kernel_size=3, iterations=1, **arguments):
-        kernel = np.ones((kernel_size, kernel_size), np.uint8)
-        return dilate(img, kernel, iterations=iterations)
+    releases_gil = True
+
+    def transform(self, img, kernel_size=3, iterations=1, kernel_shape='rect', **arguments):
+        return cv2.dilate(img, get_structuring_element(kernel_size, kernel_shape), iterations=iterations)
 
 
 class Erosion(FunctionTransformer):
 
-    def transform(self, img, kernel_size=3, iterations=1, **arguments):
-        kernel = np.ones((kernel_size, kernel_size), np.uint8)
-        return erode(img, kernel, iterations=iterations)
+    releases_gil = True
+
+    def transform(self, img, kernel_size=3, iterations=1, kernel_shape='rect', **arguments):
+        return cv2.erode(img, get_structuring_element(kernel_size, kernel_shape), iterations=iterations)
+
+
+# the names of the OpenCV constants, which are only looked up once OpenCV is needed
+_MORPHOLOGY_OPERATIONS = {
+    'erode': 'MORPH_ERODE', 'dilate': 'MORPH_DILATE', 'open': 'MORPH_OPEN', 'close': 'MORPH_CLOSE',
+    'gradient': 'MORPH_GRADIENT', 'tophat': 'MORPH_TOPHAT', 'blackhat': 'MORPH_BLACKHAT'
+}
+
+_KERNEL_SHAPES = {'rect': 'MORPH_RECT', 'ellipse': 'MORPH_ELLIPSE', 'cross': 'MORPH_CROSS'}
+
+
+def get_structuring_element(kernel_size: Union[int, Tuple[int, int]] = 3, kernel_shape='rect') -> np.ndarray:
+    """
+    Returns the structuring element of shape 'kernel_shape' ('rect', 'ellipse' or 'cross') and size 'kernel_size'
+    (an int or a tuple (width, height)). The elements are cached per configuration and thus read-only.
+    """
+    size = (kernel_size, kernel_size) if np.isscalar(kernel_size) else tuple(kernel_size)
+    return _get_structuring_element(size, kernel_shape)
+
+
+@lru_cache(maxsize=None)
+def _get_structuring_element(size: Tuple[int, int], kernel_shape: str) -> np.ndarray:
+    kernel = cv2.getStructuringElement(getattr(cv2, _KERNEL_SHAPES[kernel_shape]), size)
+    kernel.setflags(write=False)
+
+    return kernel
+
+
+class Morphology(FunctionTransformer):
+    """
+    Applies a sequence of morphological 'operations' to the image. Every operation is a tuple (name, kernel_size,
+    kernel_shape, iterations), where the last two entries are optional ('rect' and 1 by default). The names are
+    'erode', 'dilate', 'open', 'close', 'gradient', 'tophat' and 'blackhat', the kernel shapes are the ones of
+    get_structuring_element.
+
+    All operations are applied with cv2.morphologyEx, alternating between two buffers (or 'out' if provided), so that
+    no image is allocated per operation. Images (H, W, C) with any number of channels are processed with one call per
+    operation. If 'batched' is set, the input is a batch of images.
+
+    The shape of the images is kept, unless 'drop_single_channel' is set: then images (H, W, 1) result in (H, W), as
+    with cv2.dilate and cv2.erode (i.e. with Dilation and Erosion).
+
+    Chains of Dilation, Erosion and Morphology steps can be folded into one Morphology step with
+    pipeline.optimization.fuse_morphology.
+    """
+
+    releases_gil = True
+    supports_out = True
+
+    def transform(self, img, operations=(('dilate', 3),), batched=False, drop_single_channel=False, out=None,
+                  **arguments):
+        if drop_single_channel and _has_single_channel(img, batched): img = img[..., 0]
+        if out is None: out = np.empty_like(img)
+
+        images, outputs = (img, out) if batched else ([img], [out])
+        operations = [_get_morphology_operation(*operation) for operation in operations]
+
+        for image, output in zip(images, outputs):
+            self._apply(image, output, operations)
+
+        return out
+
+    def get_output_spec(self, img, batched=False, drop_single_channel=False, **arguments):
+        shape = np.shape(img)
+        if drop_single_channel and _has_single_channel(img, batched): shape = shape[:-1]
+
+        return shape, np.asarray(img).dtype
+
+    def _apply(self, image: np.ndarray, output: np.ndarray, operations: List):
+        # OpenCV can only write into contiguous arrays
+        target = output if output.flags.c_contiguous else np.empty(output.shape, output.dtype)
+
+        # OpenCV drops a single channel axis
+        if image.ndim == 3 and image.shape[-1] == 1:
+            self._apply(image[..., 0], target[..., 0], operations)
+        else:
+            # the buffers alternate such that the last operation writes into 'target'
+            buffers = [target, np.empty_like(target) if len(operations) > 1 else None]
+            source = image
+
+            for i, (operation, kernel, iterations) in enumerate(operations):
+                destination = buffers[(len(operations) - 1 - i) % 2]
+                cv2.morphologyEx(source, operation, kernel, dst=destination, iterations=iterations)
+                source = destination
+
+        if target is not output: output[...] = target
+
+
+def _has_single_channel(img: np.ndarray, batched: bool) -> bool:
+    return np.ndim(img) == (4 if batched else 3) and np.shape(img)[-1] == 1
+
+
+def _get_morphology_operation(name: str, kernel_size=3, kernel_shape='rect', iterations=1) -> Tuple:
+    return getattr(cv2, _MORPHOLOGY_OPERATIONS[name]), get_structuring_element(kernel_size, kernel_shape), iterations
 
 
 class ShowImage(FunctionTransformer):
@@ -102,30 +343,63 @@ class ShowImage(FunctionTransformer):
 
 
 class HideHalfImage(FunctionTransformer):
+    """
+    Sets the left or the right half of the image to zero. If 'batched' is set, the input is a batch of images and the
+    halves of all images are drawn at once.
+    """
+
+    def transform(self, img, rng=None, batched=False, **arguments):
+        rng = np.random.default_rng() if rng is None else rng
+
+        if batched:
+            nr_images, height, width = img.shape[:3]
+            left = rng.integers(0, 2, size=nr_images).astype(bool)
+
+            columns = (np.arange(width) < width // 2) == left[:, None]
+
+            covered = np.copy(img)
+            covered[np.broadcast_to(columns[:, None, :], (nr_images, height, width))] = 0
+            return covered
 
-    def transform(self, img, **arguments):
         covered = np.copy(img)
 
-        if randint(0, 1):
-            covered[:, :covered.shape[1] / 2] = 0
+        if rng.integers(0, 2):
+            covered[:, :covered.shape[1] // 2] = 0
         else:
-            covered[:, covered.shape[1] / 2:] = 0
+            covered[:, covered.shape[1] // 2:] = 0
 
         return covered
 
 
 class HideQuarterImage(FunctionTransformer):
+    """
+    Sets a random quarter of the image to zero. If 'batched' is set, the input is a batch of images and the quarters
+    of all images are drawn at once.
+    """
+
+    def transform(self, img, rng=None, batched=False, **arguments):
+        rng = np.random.default_rng() if rng is None else rng
+
+        if batched:
+            height, width = img.shape[1:3]
+            left, top = rng.integers(0, 2, size=(2, len(img))).astype(bool)
+
+            rows = (np.arange(height) < height // 2) == top[:, None]
+            columns = (np.arange(width) < width // 2) == left[:, None]
+
+            covered = np.copy(img)
+            covered[rows[:, :, None] & columns[:, None, :]] = 0
+            return covered
 
-    def transform(self, img, **arguments):
         covered = np.copy(img)
 
-        if randint(0, 1):
-            if randint(0, 1):
+        if rng.integers(0, 2):
+            if rng.integers(0, 2):
                 covered[:covered.shape[0] // 2, :covered.shape[1] // 2] = 0
             else:
                 covered[covered.shape[0] // 2:, :covered.shape[1] // 2] = 0
         else:
-            if randint(0, 1):
+            if rng.integers(0, 2):
                 covered[:covered.shape[0] // 2, covered.shape[1] // 2:] = 0
             else:
                 covered[covered.shape[0] // 2:, covered.shape[1] // 2:] = 0
@@ -134,71 +408,205 @@ class HideQuarterImage(FunctionTransformer):
 
 
 class HideRandomBlock(FunctionTransformer):
+    """
+    Sets a random block with a size between 'min_block_size' and 'max_block_size' to zero. If 'batched' is set, the
+    input is a batch of images and the sizes and positions of all blocks are drawn at once.
+    """
+
+    def transform(self, img, min_block_size=(0, 0), max_block_size=(0, 0), rng=None, batched=False, **arguments):
+        rng = np.random.default_rng() if rng is None else rng
+
+        if batched:
+            nr_images, height, width = img.shape[:3]
+
+            size_x = rng.integers(min_block_size[0], max_block_size[0], endpoint=True, size=nr_images)
+            size_y = rng.integers(min_block_size[1], max_block_size[1], endpoint=True, size=nr_images)
+
+            x = rng.integers(0, height - size_x)
+            y = rng.integers(0, width - size_y)
+
+            x, y, size_x, size_y = x[:, None], y[:, None], size_x[:, None], size_y[:, None]
+
+            covered = np.copy(img)
+            covered[_get_block_mask((height, width), x, x + size_x, y, y + size_y)] = 0
+            return covered
 
-    def transform(self, img, min_block_size=(0, 0), max_block_size=(0, 0), **arguments):
         covered = np.copy(img)
 
-        size = randint(min_block_size[0], max_block_size[0]), randint(min_block_size[1], max_block_size[1])
+        size = (rng.integers(min_block_size[0], max_block_size[0], endpoint=True),
+                rng.integers(min_block_size[1], max_block_size[1], endpoint=True))
 
-        x = randint(0, img.shape[0] - size[0] - 1)
-        y = randint(0, img.shape[1] - size[1] - 1)
+        x = rng.integers(0, img.shape[0] - size[0])
+        y = rng.integers(0, img.shape[1] - size[1])
 
         covered[x:x + size[0], y:y + size[1]] = 0
 
         return covered
 
 
+class RandomBlockMasking(PipelineStep):
+    """
+    Sets 'nr_blocks' random blocks per image to 'fill_value', for every incoming stream of image batches (N, H, W) or
+    (N, H, W, C). The block sizes lie between 'min_block_size' and 'max_block_size' (inclusive).
+
+    The sizes and positions of all blocks of a batch are drawn in one vectorized call and applied with a single
+    boolean mask. If 'in_place' is set, the incoming batches are overwritten, otherwise they are copied once.
+
+    If 'output_mask' is set, the boolean masks (N, H, W), true for all hidden pixels, are yielded as additional
+    streams after the masked batches.
+    """
+
+    def get_next(self, previous: Generator, min_block_size=(0, 0), max_block_size=(0, 0), nr_blocks=1, fill_value=0,
+                 in_place=False, output_mask=False, rng=None, **arguments) -> Generator:
+        rng = np.random.default_rng() if rng is None else rng
+
+        batches, masks = [], []
+
+        for batch in next(previous):
+            mask = self._get_random_mask(batch.shape[:3], min_block_size, max_block_size, nr_blocks, rng)
+
+            if not in_place: batch = np.copy(batch)
+            batch[mask] = fill_value
+
+            batches.append(batch)
+            masks.append(mask)
+
+        yield batches + masks if output_mask else batches
+
+    def _get_random_mask(self, shape, min_block_size, max_block_size, nr_blocks, rng):
+        nr_images, height, width = shape
+
+        size = rng.integers(min_block_size, max_block_size, endpoint=True, size=(nr_images, nr_blocks, 2))
+        position = rng.integers(0, np.array([height, width]) - size, endpoint=True)
+
+        start, end = position, position + size
+
+        return _get_block_mask((height, width), start[..., 0], end[..., 0], start[..., 1], end[..., 1])
+
+
+def _get_block_mask(shape, row_start, row_end, column_start, column_end):
+    """
+    Returns a boolean mask of shape (N,) + 'shape' which is true inside all blocks given by the arrays of (inclusive)
+    starts and (exclusive) ends. These arrays have shape (N, B) for B blocks per mask.
+    """
+    rows = np.arange(shape[0])
+    columns = np.arange(shape[1])
+
+    row_mask = (rows >= row_start[..., None]) & (rows < row_end[..., None])
+    column_mask = (columns >= column_start[..., None]) & (columns < column_end[..., None])
+
+    if row_mask.shape[1] == 1: return row_mask[:, 0, :, None] & column_mask[:, 0, None, :]
+
+    # the union over all blocks is the product (N, H, B) x (N, B, W) of the row and column masks
+    return np.matmul(row_mask.transpose(0, 2, 1).astype(np.float32), column_mask.astype(np.float32)) > 0
+
+
 class GetNormalizedAxis(FunctionTransformer):
+    """
+    Outputs an array of the shape of the first two axes of the image, containing the row index divided by the height
+    ('axis' x) or the column index divided by the width ('axis' y).
+    """
 
-    def transform(self, input, axis='x', **arguments):
-        if axis == 'x': return np.array([[i/input.shape[0]] * input.shape[1] for i in range(input.shape[0])])
-        if axis == 'y': return np.array([[i/input.shape[1] for i in range(input.shape[1])]] * input.shape[0])
+    supports_out = True
+
+    def transform(self, input, axis='x', dtype=None, out=None, **arguments):
+        assert axis in ('x', 'y'), f'Unknown axis {axis}.'
+        height, width = input.shape[:2]
+
+        if axis == 'x': values = (np.arange(height) / height)[:, None]
+        if axis == 'y': values = (np.arange(width) / width)[None, :]
+
+        if out is None: out = np.empty((height, width), dtype=get_dtype(dtype, np.float64))
+        out[...] = values
+
+        return out
+
+    def get_output_spec(self, input, dtype=None, **arguments):
+        return tuple(input.shape[:2]), get_dtype(dtype, np.float64)
 
 
 class GaussianPyramid(PipelineStep):
+    """
+    Outputs 'num_layers' layers of the gaussian pyramid per incoming stream. A 'thread_pool' is used per stream. Only
+    the layers up to the last needed one are computed.
+    """
 
-    def get_next(self, previous: Generator, num_layers=1, **arguments) -> Generator:
+    def get_next(self, previous: Generator, num_layers=1, thread_pool: Executor = None,
+                 needed_outputs: List[int] = None, **arguments) -> Generator:
         input_images = next(previous)
 
-        gaussians = [self._get_gaussian(image.copy(), num_layers) for image in input_images]
+        needed_layers = _get_needed_layers(needed_outputs, len(input_images), num_layers)
+        gaussians = _map(thread_pool, lambda i: self._get_gaussian(input_images[i].copy(), num_layers,
+                                                                   needed_layers[i]), range(len(input_images)))
         all_gaussians = list(chain.from_iterable(gaussians))
 
         yield all_gaussians
 
-    def _get_gaussian(self, image, num_layers):
+    def _get_gaussian(self, image, num_layers, needed_layers=None):
+        if needed_layers is None: needed_layers = range(num_layers)
+        if not needed_layers: return [None] * num_layers
+
         lower = image
         gaussian_pyr = [image]
-        for _ in range(num_layers - 1):
+        for _ in range(max(needed_layers)):
             lower = cv2.pyrDown(lower)
             gaussian_pyr.append(lower)
 
-        return gaussian_pyr
+        return [layer if i in needed_layers else None for i, layer in enumerate(gaussian_pyr)] + \
+            [None] * (num_layers - len(gaussian_pyr))
 
 
 class LaplacianPyramid(FunctionTransformer):
+    """
+    Outputs 'num_layers' layers of the laplacian pyramid per incoming stream. A 'thread_pool' is used per stream. Only
+    the needed layers are computed.
+    """
 
-    def get_next(self, previous: Generator, num_layers=1, **arguments) -> Generator:
+    def get_next(self, previous: Generator, num_layers=1, thread_pool: Executor = None,
+                 needed_outputs: List[int] = None, **arguments) -> Generator:
         input_images = next(previous)
 
-        laplacians = [self._get_laplacian(image.copy(), num_layers) for image in input_images]
+        needed_layers = _get_needed_layers(needed_outputs, len(input_images), num_layers)
+        laplacians = _map(thread_pool, lambda i: self._get_laplacian(input_images[i].copy(), num_layers,
+                                                                     needed_layers[i]), range(len(input_images)))
         all_laplacian = list(chain.from_iterable(laplacians))
 
         yield all_laplacian
 
-    def _get_laplacian(self, image, num_layers):
+    def _get_laplacian(self, image, num_layers, needed_layers=None):
+        if needed_layers is None: needed_layers = range(num_layers)
+        if not needed_layers: return [None] * num_layers
+
+        # layer i needs the gaussian layers i and i + 1 (except for the top layer)
+        nr_gaussians = min(max(needed_layers) + 2, num_layers)
+
         gaussian_pyr = [image]
         lower = image
-        for _ in range(num_layers - 1):
+        for _ in range(nr_gaussians - 1):
             lower = cv2.pyrDown(lower)
             gaussian_pyr.append(lower)
 
-        laplacian_top = gaussian_pyr[-1]
+        laplacian_pyr = [None] * num_layers
+
+        if num_layers - 1 in needed_layers: laplacian_pyr[-1] = gaussian_pyr[-1]
+
+        for i in needed_layers:
+            if i == num_layers - 1: continue
+
+            size = (gaussian_pyr[i].shape[1], gaussian_pyr[i].shape[0])
+            gaussian_expanded = cv2.pyrUp(gaussian_pyr[i + 1], dstsize=size)
+            laplacian_pyr[i] = gaussian_pyr[i] - gaussian_expanded
+
+        return laplacian_pyr
+
+
+def _get_needed_layers(needed_outputs: List[int], nr_images: int, num_layers: int) -> List:
+    """Returns the needed layers per image if the outputs are ordered by image first, or None for every image."""
+    if needed_outputs is None: return [None] * nr_images
+    return [[o - i * num_layers for o in needed_outputs if i * num_layers <= o < (i + 1) * num_layers]
+            for i in range(nr_images)]
 
-        laplacian_pyr = [laplacian_top]
-        for i in range(num_layers - 1, 0, -1):
-            size = (gaussian_pyr[i - 1].shape[1], gaussian_pyr[i - 1].shape[0])
-            gaussian_expanded = cv2.pyrUp(gaussian_pyr[i], dstsize=size)
-            laplacian = gaussian_pyr[i - 1] - gaussian_expanded
-            laplacian_pyr.append(laplacian)
 
-        return reversed(laplacian_pyr)
+def _map(thread_pool: Executor, function: Callable, inputs: List) -> List:
+    if thread_pool is None: return [function(i) for i in inputs]
+    return list(thread_pool.map(function, inputs))
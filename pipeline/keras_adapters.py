@@ -0,0 +1,156 @@
+import os
+import threading
+from typing import Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from pipeline.pipeline_step import FinalPipelineStep
+from pipeline.pipeline_step_view import PipelineStepView
+
+
+class PipelineSequence(tf.keras.utils.Sequence):
+    """
+    Exposes a finalized PipelineStepView (i.e. a view of a FinalPipelineStep such as KerasTrainingGenerator) as a
+    keras Sequence.
+
+    If every source of the view is behind a cached view, the sequence is indexable: the batch at 'index' is produced
+    from the cached elements [index * batch_size, (index + 1) * batch_size). Every worker (thread or process) then
+    gets its own clone of the view, which makes it safe to use 'workers' and 'use_multiprocessing' in 'model.fit'.
+    This requires that every cached element corresponds to exactly one element at the end of the pipeline (i.e. no
+    filters or duplicators after the cache). Sources which are not cached (e.g. a random stream merged with cached
+    data) can not be moved to an index, so the sequence then falls back to the sequential mode below.
+
+    If the view argument 'seed' is provided, the random number generators of a worker's view clone are reset for
+    every batch, depending only on the seed, the epoch and the batch index. The augmentations are thus reproducible,
+    independent of which worker produces which batch.
+
+    Otherwise, the batches are obtained one after another from a single view and 'steps_per_epoch' has to be provided.
+    All workers then share this view, guarded by a lock.
+    """
+
+    def __init__(self, view: PipelineStepView, steps_per_epoch: int = None, shuffle: bool = False,
+                 **keras_arguments):
+        super().__init__(**keras_arguments)
+
+        assert isinstance(view.step, FinalPipelineStep), 'A PipelineSequence has to wrap a FinalPipelineStep.'
+
+        self.view = view
+        self.batch_size = view.arguments.get('batch_size', 32)
+        self.shuffle = shuffle
+
+        cached_views = view.get_cached_views()
+        self.is_indexable = len(cached_views) > 0 and all([len(v.cache) > 0 for v in cached_views]) \
+            and not view.has_uncached_sources()
+
+        if self.is_indexable:
+            self.nr_batches = min([len(v.cache) for v in cached_views]) // self.batch_size
+        else:
+            assert steps_per_epoch is not None, 'steps_per_epoch is required if the pipeline is not cached.'
+            self.nr_batches = steps_per_epoch
+
+        if steps_per_epoch is not None: self.nr_batches = min(self.nr_batches, steps_per_epoch)
+
+        self.epoch = 0
+        self.rng = np.random.default_rng(view.seed_sequence.spawn(1)[0])
+
+        self.batch_order = np.arange(self.nr_batches)
+        if self.shuffle: self.rng.shuffle(self.batch_order)
+
+        # the workers add their states concurrently
+        self.worker_states = dict()
+        self.worker_states_lock = threading.Lock()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.nr_batches
+
+    def __getitem__(self, index):
+        if not self.is_indexable:
+            with self.lock:
+                generator, _, _ = self._get_worker_state(shared=True)
+                return next(generator)
+
+        generator, view, cached_views = self._get_worker_state()
+
+        if self.view.arguments.get('seed') is not None:
+            seed_sequence = self.view.seed_sequence
+            view.reseed(np.random.SeedSequence(seed_sequence.entropy,
+                                               spawn_key=seed_sequence.spawn_key + (self.epoch, int(index))))
+
+        position = int(self.batch_order[index]) * self.batch_size
+        for cached_view in cached_views:
+            cached_view.next_cache_index = position % len(cached_view.cache)
+
+        return next(generator)
+
+    def on_epoch_end(self):
+        self.epoch += 1
+        if self.shuffle: self.rng.shuffle(self.batch_order)
+
+    def _get_worker_state(self, shared=False) -> Tuple:
+        """
+        Returns the generator, the view and its cached views of the view clone belonging to the current worker.
+        Workers are identified by their process and thread, so that forked processes never continue a generator of
+        their parent.
+        """
+        worker = (os.getpid(), None if shared else threading.get_ident())
+
+        with self.worker_states_lock:
+            if worker not in self.worker_states:
+                # the cached views of the clone must only be moved by __getitem__
+                view = self.view.get_view(shuffle=False, all_then_stop=False) if self.is_indexable else self.view
+                self.worker_states[worker] = view.get_generator(), view, view.get_cached_views()
+
+            return self.worker_states[worker]
+
+    def _generate_batch(self, index):
+        yield _to_tuples(self[int(index)])
+
+
+def to_dataset(view: PipelineStepView, output_signature=None, steps_per_epoch: int = None, shuffle: bool = False,
+               num_parallel_calls: int = None) -> tf.data.Dataset:
+    """
+    Exposes a finalized PipelineStepView as a tf.data.Dataset with one element per batch. The lists in the batches
+    are turned into tuples.
+
+    If every source of the view is behind a cached view (see PipelineSequence), the batches are produced by
+    'num_parallel_calls' parallel workers, each with its own view clone. In this case, 'output_signature' is inferred
+    from the first batch if not provided. Otherwise, 'output_signature' is required and the batches are obtained
+    sequentially.
+    """
+    sequence = PipelineSequence(view, steps_per_epoch=steps_per_epoch)
+
+    if not sequence.is_indexable:
+        assert output_signature is not None, 'output_signature is required if the pipeline is not cached.'
+
+        def generate():
+            for _ in range(len(sequence)): yield _to_tuples(sequence[0])
+
+        return tf.data.Dataset.from_generator(generate, output_signature=output_signature)
+
+    if output_signature is None: output_signature = get_output_signature(sequence[0])
+
+    indices = tf.data.Dataset.range(len(sequence))
+    if shuffle: indices = indices.shuffle(len(sequence), reshuffle_each_iteration=True)
+
+    return indices.interleave(
+        lambda index: tf.data.Dataset.from_generator(sequence._generate_batch, args=(index,),
+                                                     output_signature=output_signature),
+        cycle_length=num_parallel_calls or 1,
+        num_parallel_calls=num_parallel_calls,
+        deterministic=True
+    )
+
+
+def get_output_signature(batch):
+    """Returns the tf.TensorSpec structure of 'batch' with an unknown batch dimension."""
+    if isinstance(batch, (tuple, list)): return tuple(get_output_signature(b) for b in batch)
+
+    batch = np.asarray(batch)
+    return tf.TensorSpec(shape=(None,) + batch.shape[1:], dtype=tf.as_dtype(batch.dtype))
+
+
+def _to_tuples(batch):
+    if isinstance(batch, (tuple, list)): return tuple(_to_tuples(b) for b in batch)
+    return batch
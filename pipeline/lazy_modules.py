@@ -0,0 +1,18 @@
+import importlib
+
+
+class LazyModule:
+    """
+    A placeholder for the module 'name', which is only imported when one of its attributes is accessed for the first
+    time. This keeps heavy dependencies (OpenCV, matplotlib, pydicom) out of the import of the pipeline modules, so
+    that they are only loaded once a step needing them runs (e.g. in every spawned worker process).
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attribute: str):
+        return getattr(importlib.import_module(self._name), attribute)
+
+    def __repr__(self):
+        return f'<lazy module {self._name}>'
@@ -0,0 +1,228 @@
+import logging
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+from pipeline.control_flow import Filter, FunctionFilter
+from pipeline.image_steps import GeometricAugment, RandomlyCrop, Resize, Reshape, Dilation, Erosion, Morphology
+from pipeline.lazy_modules import LazyModule
+from pipeline.pipeline_step import PipelineStep
+from pipeline.pipeline_step_view import PipelineStepView
+from pipeline.transformer import FunctionTransformer
+
+cv2 = LazyModule('cv2')
+
+
+class FilterPushdownReport:
+    """
+    Describes the changes made by 'push_down_filters'. Every entry in 'moved_filters' and 'pre_checks' is a tuple of
+    a filter step and the list of steps which rejected elements no longer pass through.
+    """
+
+    def __init__(self):
+        self.moved_filters: List[Tuple[Filter, List[PipelineStep]]] = []
+        self.pre_checks: List[Tuple[Filter, List[PipelineStep]]] = []
+
+    @property
+    def nr_avoided_steps(self) -> int:
+        """The number of step executions avoided so far, i.e. the rejected elements times the steps they skip."""
+        return sum([f.nr_rejected * len(steps) for f, steps in self.moved_filters + self.pre_checks])
+
+    def __str__(self):
+        lines = [f'{_name(f)} moved in front of {[_name(s) for s in steps]}' for f, steps in self.moved_filters]
+        lines += [f'Pre-check of {_name(f)} inserted in front of {[_name(s) for s in steps]}'
+                  for f, steps in self.pre_checks]
+        return '\n'.join(lines + [f'{self.nr_avoided_steps} step executions avoided.'])
+
+
+def push_down_filters(view: PipelineStepView) -> Tuple[PipelineStepView, FilterPushdownReport]:
+    """
+    Returns a new view graph, equivalent to the one of 'view', in which every filter (see Filter) is moved as early as
+    possible, so that rejected elements skip the work of the steps in between.
+
+    Only filters with a single incoming view are moved. A filter is moved in front of the preceding view if the filter
+    takes all of its output streams, the view has no other consumers, is neither cached nor a cache point, has a
+    single incoming view and its step is an instance of one of the filter's 'commutes_with' classes.
+
+    If a filter provides a 'pre_check', a FunctionFilter applying it is additionally inserted in front of all
+    preceding FunctionTransformer's (with the same restrictions, except for 'commutes_with'). The original filter is
+    kept, as the pre-check is only an estimate.
+    """
+    consumers = Counter([p for v in view.get_all_views() for p in v.previous] + [view])
+    report = FilterPushdownReport()
+
+    new_view = _rebuild(view, dict(), consumers, report)
+    logging.info(str(report))
+
+    return new_view, report
+
+
+def _rebuild(view: PipelineStepView, references: Dict, consumers: Counter, report: FilterPushdownReport) \
+        -> PipelineStepView:
+    if view in references: return references[view]
+
+    if isinstance(view.step, Filter) and not view.is_cached and len(view.previous) == 1:
+        references[view] = _rebuild_filter(view, references, consumers, report)
+    else:
+        previous = [_rebuild(p, references, consumers, report) for p in view.previous]
+        references[view] = _copy_view(view, previous, view.previous_indices)
+
+    return references[view]
+
+
+def _rebuild_filter(view: PipelineStepView, references: Dict, consumers: Counter, report: FilterPushdownReport) \
+        -> PipelineStepView:
+    chain = _get_passable_chain(view, consumers, lambda v: isinstance(v.step, view.step.commutes_with))
+
+    pre_chain = []
+    if view.step.pre_check is not None:
+        pre_chain = _get_passable_chain(chain[-1] if chain else view, consumers,
+                                        lambda v: isinstance(v.step, FunctionTransformer))
+
+    top = (chain + pre_chain)[-1] if chain + pre_chain else view
+
+    current = _rebuild(top.previous[0], references, consumers, report)
+    indices = top.previous_indices
+
+    if pre_chain:
+        pre_check = FunctionFilter(function=view.step.pre_check)
+        current = PipelineStepView(pre_check, [current], indices, **view.arguments)
+
+        for v in reversed(pre_chain): current = _copy_view(v, [current], [None])
+        report.pre_checks.append((pre_check, [v.step for v in chain + pre_chain]))
+        indices = [None]
+
+    current = _copy_view(view, [current], indices)
+    for v in reversed(chain): current = _copy_view(v, [current], [None])
+
+    if chain: report.moved_filters.append((view.step, [v.step for v in chain]))
+
+    return current
+
+
+def fuse_geometric_steps(view: PipelineStepView) -> PipelineStepView:
+    """
+    Returns a new view graph, equivalent to the one of 'view', in which every RandomlyCrop followed by a Resize (and
+    optionally a Reshape) is replaced by a single GeometricAugment, which crops and resizes in one warp without
+    allocating the intermediate crop.
+
+    The views are only fused if each of the following views is the only consumer of the preceding one and takes all
+    of its output streams, and if no view is cached, a cache point or batched.
+
+    The results are the ones of Resize with bilinear interpolation (instead of INTER_AREA), which only differs when
+    downscaling.
+    """
+    consumers = Counter([p for v in view.get_all_views() for p in v.previous] + [view])
+    references = dict()
+
+    new_view = _rebuild_fused(view, references, consumers)
+    fused = [v for v, new in references.items() if type(new.step) is GeometricAugment and new.step is not v.step]
+    logging.info(f'Fused {len(fused)} chains of geometric steps.')
+
+    return new_view
+
+
+def _rebuild_fused(view: PipelineStepView, references: Dict, consumers: Counter) -> PipelineStepView:
+    if view in references: return references[view]
+
+    chain = [view] + _get_passable_chain(view, consumers, lambda v: isinstance(v.step, (Resize, RandomlyCrop)))
+    steps = [type(v.step) for v in chain]
+
+    if steps[:3] in ([Reshape, Resize, RandomlyCrop], [Resize, RandomlyCrop]) and not view.is_cached \
+            and not any([v.arguments.get('batched', False) for v in chain[:len(steps[:3])]]):
+        chain = chain[:len(steps[:3])]
+        top = chain[-1]
+
+        arguments = {'crop_width': 128, 'crop_height': 128, 'border_mode': cv2.BORDER_REPLICATE}
+        for v in reversed(chain): arguments.update(v.arguments)
+        if steps[0] is Reshape: arguments['output_shape'] = arguments.get('shape', (1,))
+
+        previous = [_rebuild_fused(p, references, consumers) for p in top.previous]
+        references[view] = PipelineStepView(GeometricAugment(), previous, top.previous_indices, **arguments)
+
+    else:
+        previous = [_rebuild_fused(p, references, consumers) for p in view.previous]
+        references[view] = _copy_view(view, previous, view.previous_indices)
+
+    return references[view]
+
+
+def fuse_morphology(view: PipelineStepView) -> PipelineStepView:
+    """
+    Returns a new view graph, equivalent to the one of 'view', in which every chain of consecutive Dilation, Erosion
+    and Morphology views is replaced by a single Morphology view applying all operations, without allocating an
+    intermediate image per step. As with the fused steps, images (H, W, 1) result in (H, W) if the chain contains a
+    Dilation or Erosion.
+
+    The views are only fused under the same conditions as in 'fuse_geometric_steps'.
+    """
+    consumers = Counter([p for v in view.get_all_views() for p in v.previous] + [view])
+    references = dict()
+
+    new_view = _rebuild_morphology(view, references, consumers)
+    fused = [v for v, new in references.items() if type(new.step) is Morphology and new.step is not v.step]
+    logging.info(f'Fused {len(fused)} chains of morphological steps.')
+
+    return new_view
+
+
+def _rebuild_morphology(view: PipelineStepView, references: Dict, consumers: Counter) -> PipelineStepView:
+    if view in references: return references[view]
+
+    is_morphological = lambda v: isinstance(v.step, (Dilation, Erosion, Morphology))
+    chain = [view] + _get_passable_chain(view, consumers, is_morphological) if is_morphological(view) else [view]
+
+    if len(chain) > 1 and not view.is_cached and not any([v.arguments.get('batched', False) for v in chain]):
+        top = chain[-1]
+
+        arguments = dict()
+        for v in reversed(chain): arguments.update(v.arguments)
+        arguments['operations'] = [o for v in reversed(chain) for o in _get_morphology_operations(v)]
+        # OpenCV drops a single channel axis in Dilation and Erosion
+        arguments['drop_single_channel'] = any([not isinstance(v.step, Morphology) or
+                                                v.arguments.get('drop_single_channel', False) for v in chain])
+
+        previous = [_rebuild_morphology(p, references, consumers) for p in top.previous]
+        references[view] = PipelineStepView(Morphology(), previous, top.previous_indices, **arguments)
+
+    else:
+        previous = [_rebuild_morphology(p, references, consumers) for p in view.previous]
+        references[view] = _copy_view(view, previous, view.previous_indices)
+
+    return references[view]
+
+
+def _get_morphology_operations(view: PipelineStepView) -> List[Tuple]:
+    """Returns the operations (see Morphology) applied by a view of a Dilation, Erosion or Morphology step."""
+    if isinstance(view.step, Morphology): return list(view.arguments.get('operations', (('dilate', 3),)))
+
+    name = 'dilate' if isinstance(view.step, Dilation) else 'erode'
+    return [(name, view.arguments.get('kernel_size', 3), view.arguments.get('kernel_shape', 'rect'),
+             view.arguments.get('iterations', 1))]
+
+
+def _get_passable_chain(view: PipelineStepView, consumers: Counter, can_pass: Callable) -> List[PipelineStepView]:
+    """
+    Returns the views preceding 'view' which an element filter can be moved in front of, ordered from 'view' upwards.
+    """
+    chain, link = [], view
+
+    while len(link.previous) == 1 and link.previous_indices[0] is None:
+        candidate = link.previous[0]
+
+        if consumers[candidate] != 1 or len(candidate.previous) != 1: break
+        if candidate.is_cached or candidate.step.is_cache_point or not can_pass(candidate): break
+
+        chain.append(candidate)
+        link = candidate
+
+    return chain
+
+
+def _copy_view(view: PipelineStepView, previous: List[PipelineStepView], previous_indices: List) \
+        -> PipelineStepView:
+    return PipelineStepView(view.step, previous, previous_indices,
+                            view.is_cached, view.cache, view.next_cache_index, **view.arguments)
+
+
+def _name(step: PipelineStep) -> str:
+    return type(step).__name__
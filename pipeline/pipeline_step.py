@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Generator, Union
+from typing import List, Generator, Union, Tuple
 
 from pipeline.exceptions import IteratedThroughAll
 from pipeline.pipeline_step_view import PipelineStepView
@@ -17,6 +17,12 @@ class PipelineStep(ABC):
     of the same underlying PipelineStep's with different parameters passed to the 'get_next' methods.
     """
 
+    # if true, the views of this step cache all incoming data (see CachePoint)
+    is_cache_point = False
+
+    # if true, 'previous' is a list with a separate generator for every incoming view (see WeightedInterleave)
+    separate_inputs = False
+
     def __init__(self, **arguments):
         """The 'arguments' passed are meant to correspond to all views of this PipelineStep."""
         self.arguments = arguments
@@ -32,9 +38,24 @@ class PipelineStep(ABC):
 
         'get_next' does not necessarily have to run infinitely, it is simply called again after its termination (this
         is important to consider when 'get_next' itself holds some state).
+
+        Besides the view arguments, 'get_next' receives the random number generator of the view ('rng') and the
+        sorted output indices read by any consumer ('needed_outputs', None if all outputs are read). Outputs which
+        are not needed can be replaced by None instead of being computed.
         """
         pass
 
+    def state_dict(self) -> dict:
+        """
+        Returns the internal state of this step which is needed to resume an iteration (e.g. the position of a data
+        source), see PipelineStepView.state_dict. Steps without such state return an empty dict.
+        """
+        return dict()
+
+    def load_state_dict(self, state: dict):
+        """Restores a state returned by 'state_dict'."""
+        pass
+
     def connect_to(self, previous: Union[PipelineStepView, List[PipelineStepView]] = None,
                    previous_indices: Union[int, List[int], List[List[int]]] = None) \
             -> PipelineStepView:
@@ -54,6 +75,13 @@ class PipelineStep(ABC):
         If 'previous' is a list of views, 'previous_indices' can be Null, a single int, a list of ints or a list of lists
         of int. In the second or third case, from all input views the given indices (or the given index) are taken.
         """
+        previous, previous_indices = self._get_incoming(previous, previous_indices)
+        return PipelineStepView(self, previous, previous_indices)
+
+    def _get_incoming(self, previous: Union[PipelineStepView, List[PipelineStepView]] = None,
+                      previous_indices: Union[int, List[int], List[List[int]]] = None) \
+            -> Tuple[List[PipelineStepView], List[List[int]]]:
+        """Returns the incoming views and indices passed to 'connect_to' as lists with one entry per incoming view."""
 
         if previous is None:
             assert previous_indices is None, 'Declaration of an input stream index for a non-existing input step.'
@@ -89,7 +117,7 @@ class PipelineStep(ABC):
         if any([isinstance(view.step, FinalPipelineStep) for view in previous]):
             raise AssertionError(f'{self} binds to a FinalPipelineStep which has to be at the end of a pipeline.')
 
-        return PipelineStepView(self, previous, previous_indices)
+        return previous, previous_indices
 
     def __call__(self, previous: Union[PipelineStepView, List[PipelineStepView]] = None,
                    previous_index: Union[int, List[int], List[List[int]]] = None):
@@ -2,12 +2,20 @@ from __future__ import annotations
 
 import logging
 import pickle
+import threading
+import weakref
+from collections import Counter
 from os.path import isfile
 from queue import Queue
-from random import shuffle
-from typing import List, Generator
+from typing import List, Generator, Union
+
+import numpy as np
 
 from pipeline.exceptions import IteratedThroughAll
+from pipeline.shared_cache import SharedCache, write_shared_cache
+
+# view arguments which only apply to the view they are set on (see 'get_view')
+_LOCAL_VIEW_ARGUMENTS = ('prefetch',)
 
 
 class PipelineStepView:
@@ -19,6 +27,15 @@ class PipelineStepView:
     requested
 
     A PipelineStepView can be cached in order to speed up the process.
+
+    Every PipelineStepView has its own random number generator, which is passed as the argument 'rng' to the
+    'get_next' method of its step. The generators are derived from the view argument 'seed' using
+    numpy.random.SeedSequence.spawn, such that every view of a graph gets an independent stream.
+
+    If the view argument 'prefetch' is provided, a background thread computes up to 'prefetch' elements of this view
+    in advance (see 'stop_prefetching'). Unlike the other view arguments, 'prefetch' is not passed on to the preceding
+    views in 'get_view', such that only the view it is set on starts a thread. The generators of a view can be used
+    from several threads, as every view is guarded by a lock.
     """
 
     def __init__(self, step: PipelineStep, previous: List[PipelineStepView], previous_indices: List[List[int]],
@@ -30,53 +47,211 @@ class PipelineStepView:
         self.previous = previous
         self.previous_indices = previous_indices
 
-        self.incoming_generators = [p.get_generator(i) for p, i in zip(self.previous, self.previous_indices)]
-        self.outgoing_generator = self.step.get_next(self._collect_incoming_data(), **self.arguments)
+        self.seed_sequence = self._get_seed_sequence()
+        self.rng = np.random.default_rng(self.seed_sequence)
+
+        # the number of consumers per read output indices (None for all outputs), registered in 'get_generator'
+        self.readers = Counter()
+
+        self.incoming_generators = None
+        self._attach()
+        self.outgoing_generator = None
 
-        self.outgoing_data_queues = []
+        self.lock = threading.RLock()
+
+        # the prefetched elements (or the exception which ended the prefetching) and the thread computing them
+        self.prefetch_queue = None
+        self.prefetch_thread = None
+        self.prefetch_slots = None
+        self.prefetch_stopped = None
+
+        # only outputs read by some consumer get a queue
+        self.outgoing_data_queues = dict()
 
         self.is_cached = is_cached
         self.cache = [] if cache is None else cache
         self.next_cache_index = next_cache_index
+        # every view shuffles its own order of the cached elements, as the cache is shared between views
+        self.cache_order = None
         if self.is_cached: self.outgoing_generator = self._cache_generator()
 
     def get_generator(self, indices: List[int] = None) -> Generator:
         """
-        Yields the output streams of this PipelineStepView, specified by 'indices'. New data is requested from the
-        incoming streams only once an index is requested for the second time since the last retrieval.
+        Returns a generator yielding the output streams of this PipelineStepView, specified by 'indices'. New data is
+        requested from the incoming streams only once an index is requested for the second time since the last
+        retrieval.
+
+        The requested indices are registered when this method is called (i.e. when the consumer is wired), so that
+        the step only has to compute outputs which are actually read (see 'get_needed_outputs').
+
+        If this view wraps a cache point (see CachePoint), all incoming data is cached before the first element is
+        yielded, unless the view iterates through the data only once ('all_then_stop').
+        """
+        if self.incoming_generators is None: self._attach()
+        self.readers[_get_reader_key(indices)] += 1
+
+        return self._generate(indices)
+
+    def release_generator(self, indices: List[int] = None):
+        """
+        Unregisters a consumer which read 'indices' (see 'get_generator'), e.g. a view which is bypassed. Outputs no
+        longer read by any consumer are not queued anymore.
         """
+        with self.lock:
+            key = _get_reader_key(indices)
+
+            self.readers[key] -= 1
+            if self.readers[key] <= 0: del self.readers[key]
+
+            for i in list(self.outgoing_data_queues):
+                if not self._is_read(i): del self.outgoing_data_queues[i]
+
+    def detach(self):
+        """
+        Unregisters this view from its incoming views, so that they no longer queue the data read by it. The view is
+        attached again once a consumer requests a generator of it.
+        """
+        if self.incoming_generators is None: return
+
+        for p, i in zip(self.previous, self.previous_indices): p.release_generator(i)
+        self.incoming_generators = None
+
+    def _attach(self):
+        self.incoming_generators = [p.get_generator(i) for p, i in zip(self.previous, self.previous_indices)]
+
+    @property
+    def all_outputs_read(self) -> bool:
+        return None in self.readers
+
+    @property
+    def read_outputs(self) -> set:
+        return {i for key in self.readers if key is not None for i in key}
+
+    def _is_read(self, index: int) -> bool:
+        return self.all_outputs_read or index in self.read_outputs
+
+    def get_needed_outputs(self) -> Union[List[int], None]:
+        """Returns the sorted output indices read by any consumer, or None if all outputs are read."""
+        return None if self.all_outputs_read else sorted(self.read_outputs)
+
+    def _generate(self, indices: Union[List[int], None]) -> Generator:
+        if self.step.is_cache_point and not self.is_cached and not self.arguments.get('all_then_stop', False):
+            self._materialize_cache_point()
+
+        while True:
+            # the lock is not held while yielding, as the consumer might only continue much later
+            with self.lock:
+                element = self._next_element(indices)
+
+            yield element
+
+    def _next_element(self, indices: Union[List[int], None]) -> List:
         while True:
             try:
 
                 if indices is None:     # load all outgoing data
-                    outgoing_data = next(self.outgoing_generator)
-                    self._extend_queues_if_necessary(len(outgoing_data))
+                    outgoing_data = self._next_outgoing_data()
 
-                    if all([queue.empty() for queue in self.outgoing_data_queues]):
-                        yield outgoing_data
+                    if all([queue.empty() for queue in self.outgoing_data_queues.values()]):
+                        return outgoing_data
 
-                    else:
-                        for i, data in enumerate(outgoing_data): self.outgoing_data_queues[i].put(data)
-                        yield [queue.get() for queue in self.outgoing_data_queues]
+                    self._put_into_queues(outgoing_data)
+                    return [self._get_queue(i).get() for i in range(len(outgoing_data))]
 
                 else:
-                    self._extend_queues_if_necessary(max(indices) + 1)
+                    if any([self._get_queue(i).empty() for i in indices]):
+                        self._put_into_queues(self._next_outgoing_data())
 
-                    if any([queue.empty() for i, queue in enumerate(self.outgoing_data_queues) if i in indices]):
-                        outgoing_data = next(self.outgoing_generator)
-                        self._extend_queues_if_necessary(len(outgoing_data))
-                        for i, data in enumerate(outgoing_data): self.outgoing_data_queues[i].put(data)
-
-                    yield [queue.get() for i, queue in enumerate(self.outgoing_data_queues) if i in indices]
+                    return [self._get_queue(i).get() for i in sorted(set(indices))]
 
             except StopIteration:
                 # once the get_next method of the PipelineStep corresponding to this instance has finished,
-                # create a new generator yielding from it
-                self.outgoing_generator = self.step.get_next(self._collect_incoming_data(), **self.arguments)
+                # a new generator yielding from it is created
+                self.outgoing_generator = None
+
+    def _next_outgoing_data(self) -> List:
+        if self.arguments.get('prefetch'): return self._next_prefetched_data()
+        return self._compute_outgoing_data()
+
+    def _compute_outgoing_data(self) -> List:
+        if self.outgoing_generator is None: self.outgoing_generator = self._create_outgoing_generator()
+        return next(self.outgoing_generator)
+
+    def _next_prefetched_data(self) -> List:
+        if self.prefetch_queue is None: self.prefetch_queue = Queue()
+
+        # no elements are prefetched beyond an exception (e.g. IteratedThroughAll) which is still queued
+        if self.prefetch_thread is None and all([e is None for _, e in self.prefetch_queue.queue]):
+            self._start_prefetching()
+
+        outgoing_data, exception = self.prefetch_queue.get()
+        if self.prefetch_slots is not None: self.prefetch_slots.release()
+
+        if exception is not None:
+            self.stop_prefetching()
+            raise exception
+
+        return outgoing_data
+
+    def _start_prefetching(self):
+        self.prefetch_slots = threading.Semaphore(max(self.arguments['prefetch'] - self.prefetch_queue.qsize(), 0))
+        self.prefetch_stopped = threading.Event()
+
+        # the thread only holds a weak reference, so that it ends once the view is no longer used
+        self.prefetch_thread = threading.Thread(target=_prefetch, daemon=True, args=(
+            weakref.ref(self), self.prefetch_queue, self.prefetch_slots, self.prefetch_stopped))
+        self.prefetch_thread.start()
+
+    def stop_prefetching(self):
+        """
+        Stops the thread computing elements in advance (see the view argument 'prefetch') and waits until it has
+        ended. The elements it has already computed are kept and yielded first once the view is read again, which then
+        restarts the prefetching.
+        """
+        if self.prefetch_thread is None: return
+
+        self.prefetch_stopped.set()
+        if self.prefetch_thread is not threading.current_thread(): self.prefetch_thread.join()
+
+        self.prefetch_thread = None
+        self.prefetch_slots = None
+
+    def _create_outgoing_generator(self) -> Generator:
+        step_arguments = {**self.arguments, 'rng': self.rng, 'needed_outputs': self.get_needed_outputs()}
+        previous = list(self.incoming_generators) if self.step.separate_inputs else self._collect_incoming_data()
+
+        return self.step.get_next(previous, **step_arguments)
+
+    def _get_seed_sequence(self) -> np.random.SeedSequence:
+        """
+        Views without incoming views derive their seed sequence from the view argument 'seed', all other views spawn
+        it from their first incoming view.
+        """
+        if self.previous: return self.previous[0].seed_sequence.spawn(1)[0]
+
+        seed = self.arguments.get('seed')
+        return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+    def reseed(self, seed):
+        """
+        Resets the random number generators of this view and all preceding views. Every view gets a generator
+        spawned from 'seed', which can be anything accepted by numpy.random.SeedSequence (or a SeedSequence itself).
+        The generators are reset in-place, such that running 'get_next' methods use the new state as well.
+        """
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        views = self.get_all_views()
+
+        for view, child in zip(views, seed_sequence.spawn(len(views))):
+            view.seed_sequence = child
+            view.rng.bit_generator.state = np.random.default_rng(child).bit_generator.state
 
-    def _extend_queues_if_necessary(self, num_queues):
-        if len(self.outgoing_data_queues) < num_queues:
-            self.outgoing_data_queues += [Queue() for _ in range(num_queues - len(self.outgoing_data_queues))]
+    def _get_queue(self, index: int) -> Queue:
+        if index not in self.outgoing_data_queues: self.outgoing_data_queues[index] = Queue()
+        return self.outgoing_data_queues[index]
+
+    def _put_into_queues(self, outgoing_data: List):
+        for i, data in enumerate(outgoing_data):
+            if self._is_read(i): self._get_queue(i).put(data)
 
     def _collect_incoming_data(self) -> Generator:
         """
@@ -93,9 +268,15 @@ class PipelineStepView:
     def get_view(self, **view_arguments) -> PipelineStepView:
         """
         Returns a new view with the same wiring as this PipelineStepView instance. The view arguments are also
-        identical expect the ones provided in 'view_arguments'.
+        identical expect the ones provided in 'view_arguments'. The ones in '_LOCAL_VIEW_ARGUMENTS' (i.e. 'prefetch')
+        only change the returned view.
         """
-        return self._change_view_references(dict(), **view_arguments)
+        local_arguments = {a: view_arguments.pop(a) for a in _LOCAL_VIEW_ARGUMENTS if a in view_arguments}
+
+        view = self._change_view_references(dict(), **view_arguments)
+        view.arguments.update(local_arguments)
+
+        return view
 
     def _change_view_references(self, references: dict,  **view_arguments) -> PipelineStepView:
         """
@@ -115,6 +296,101 @@ class PipelineStepView:
 
         return references[self]
 
+    def get_all_views(self) -> List[PipelineStepView]:
+        """
+        Returns all views in the graph preceding (and including) this view. The order is deterministic for identically
+        wired graphs (depth-first, incoming views before the views they feed).
+        """
+        return self._collect_views([])
+
+    def _collect_views(self, views: List[PipelineStepView]) -> List[PipelineStepView]:
+        for p in self.previous:
+            if p not in views: p._collect_views(views)
+
+        views.append(self)
+        return views
+
+    def state_dict(self) -> dict:
+        """
+        Returns the state of this view and all preceding views, from which the iteration can be resumed with
+        'load_state_dict' without replaying any data. The state contains the random number generator states, the
+        cache cursors and shuffle orders, the queued elements and the states of the steps (see
+        PipelineStep.state_dict).
+
+        Only the state between two elements is captured: a step which buffers elements within a single call of
+        'get_next' starts anew after restoring.
+        """
+        views = self.get_all_views()
+
+        # the prefetching threads are stopped first, as they would change the states while they are captured
+        for view in views: view.stop_prefetching()
+
+        return {'views': [view._get_state() for view in views]}
+
+    def load_state_dict(self, state: dict):
+        """
+        Restores a state returned by 'state_dict' of an identically wired view graph. The generators already
+        returned by 'get_generator' continue from the restored state.
+        """
+        views = self.get_all_views()
+        assert len(views) == len(state['views']), 'The state belongs to a differently wired view graph.'
+
+        for view in views: view.stop_prefetching()
+
+        # cache points are filled before restoring, as filling them later would reset the restored cursors
+        for view in views:
+            if view.step.is_cache_point and not view.is_cached and not view.arguments.get('all_then_stop', False):
+                view._materialize_cache_point()
+
+        for view, view_state in zip(views, state['views']): view._set_state(view_state)
+
+    def _get_state(self) -> dict:
+        return {
+            'step': self.step.state_dict(),
+            'rng': self.rng.bit_generator.state,
+            'next_cache_index': self.next_cache_index,
+            'cache_order': self.cache_order,
+            'queues': {i: list(queue.queue) for i, queue in self.outgoing_data_queues.items()},
+            'prefetched': [] if self.prefetch_queue is None else list(self.prefetch_queue.queue)
+        }
+
+    def _set_state(self, state: dict):
+        self.prefetch_queue = Queue()
+        for item in state['prefetched']: self.prefetch_queue.put(item)
+
+        self.step.load_state_dict(state['step'])
+        self.rng.bit_generator.state = state['rng']
+
+        self.next_cache_index = state['next_cache_index']
+        self.cache_order = state['cache_order']
+
+        self.outgoing_data_queues = dict()
+        for i, elements in state['queues'].items():
+            for element in elements: self._get_queue(i).put(element)
+
+        # a running 'get_next' call of the step would continue from its old state
+        self.outgoing_generator = self._cache_generator() if self.is_cached else None
+
+    def get_cached_views(self) -> List[PipelineStepView]:
+        """
+        Returns all cached views in the graph preceding (and including) this view. The search does not go beyond
+        cached views, as everything preceding them is never executed.
+        """
+        if self.is_cached: return [self]
+
+        cached_views = []
+        for p in self.previous:
+            cached_views += [v for v in p.get_cached_views() if v not in cached_views]
+
+        return cached_views
+
+    def has_uncached_sources(self) -> bool:
+        """Returns whether a source (a view without incoming views) preceding this view is not behind a cached view."""
+        if self.is_cached: return False
+        if not self.previous: return True
+
+        return any([p.has_uncached_sources() for p in self.previous])
+
     def generate_all_data(self) -> List:
         """
         Generates all data until the data source is exhausted. Returns a list of all data which would have been
@@ -134,24 +410,45 @@ class PipelineStepView:
 
         return data
 
-    def cache_or_load(self, filepath: str):
+    def cache_or_load(self, filepath: str, shared=False):
         """
         Loads data from 'filepath'. If 'filepath' does not exist, the data is first cached using 'generate_all_data'.
 
+        If 'shared' is true, the cache is not loaded but memory-mapped (see SharedCache), so that all processes using
+        the same file share one copy of the data.
+
         After loading the data, this PipelineStepView acts identically to before. The outgoing data however is not
         produced on demand by the entire preceding pipeline, but directly obtained from the cache.
 
         If, on a cached view, the argument 'shuffle' is provided (using the view arguments) and set to true, then a
-        cached PipelineStepView simply returns random elements in its cache. Otherwise, it simply loops through all
-        elements in the cache.
+        cached PipelineStepView loops through its cache in a random order, which is drawn anew for every pass.
+        Otherwise, it simply loops through all elements in the cache.
 
         If, on a cached view, the argument 'all_then_stop' is provided (using the view arguments) and set to true,
         then the view iterates through the cache once and then raises a IteratedThroughAll exception.
         """
-        if not isfile(filepath): self._cache_to_file(filepath)
-        self._load_from_cache(filepath)
+        if shared:
+            if not isfile(filepath): write_shared_cache(filepath, self.generate_all_data())
+            self.cache = SharedCache(filepath)
+            self._use_cache()
+        else:
+            if not isfile(filepath): self._cache_to_file(filepath)
+            self._load_from_cache(filepath)
+
         logging.info(f'Loaded {len(self.cache)} elements in cache.')
 
+    def _materialize_cache_point(self):
+        """
+        Caches all incoming data of this view. The cache is stored at the view argument 'cache_filepath' if provided
+        (memory-mapped if the view argument 'shared_cache' is true), otherwise it is only kept in memory.
+        """
+        if self.arguments.get('cache_filepath') is not None:
+            self.cache_or_load(self.arguments['cache_filepath'], self.arguments.get('shared_cache', False))
+        else:
+            self.cache = self.generate_all_data()
+            self._use_cache()
+            logging.info(f'Cached {len(self.cache)} elements in memory.')
+
     def _cache_to_file(self, filepath: str):
         self.cache = self.generate_all_data()
 
@@ -164,18 +461,56 @@ class PipelineStepView:
         with open(filepath, 'rb') as file:
             self.cache = pickle.load(file)
 
+        self._use_cache()
+
+    def _use_cache(self):
         self.is_cached = True
         self.next_cache_index = 0
+        self.cache_order = None
 
         self.outgoing_generator = self._cache_generator()
 
     def _cache_generator(self):
         while True:
             if self.next_cache_index == 0 and 'shuffle' in self.arguments and self.arguments['shuffle']:
-                shuffle(self.cache)
+                self.cache_order = self.rng.permutation(len(self.cache))
 
-            yield self.cache[self.next_cache_index]
+            # the cursor is moved before yielding so that it always points to the next element to be outputted
+            index = self.next_cache_index if self.cache_order is None else self.cache_order[self.next_cache_index]
+            element = self.cache[index]
             self.next_cache_index = (self.next_cache_index + 1) % len(self.cache)
+            yield element
 
             if 'all_then_stop' in self.arguments and self.arguments['all_then_stop'] and self.next_cache_index == 0:
                 raise IteratedThroughAll()
+
+
+def _prefetch(view_reference: weakref.ref, prefetch_queue: Queue, slots: threading.Semaphore,
+              is_stopped: threading.Event):
+    """
+    Computes the elements of the referenced view into 'prefetch_queue' while a slot is free, until 'is_stopped' is set,
+    the view is no longer referenced or the step raises an exception (which is queued as well).
+    """
+    while True:
+        while not slots.acquire(timeout=0.1):
+            if is_stopped.is_set() or view_reference() is None: return
+
+        view = view_reference()
+        if is_stopped.is_set() or view is None: return
+
+        try:
+            prefetch_queue.put((view._compute_outgoing_data(), None))
+
+        except StopIteration:
+            view.outgoing_generator = None
+            slots.release()
+
+        except Exception as e:
+            prefetch_queue.put((None, e))
+            return
+
+        del view
+
+
+def _get_reader_key(indices: Union[List[int], None]) -> Union[tuple, None]:
+    return None if indices is None else tuple(sorted(set(indices)))
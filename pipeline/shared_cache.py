@@ -0,0 +1,130 @@
+import os
+import pickle
+import struct
+from typing import List
+
+import numpy as np
+
+from pipeline.dtypes import quantized, is_quantized_array
+
+_MAGIC = b'PIPECACHE2'
+_PREFIX = struct.Struct(f'!{len(_MAGIC)}sQ')
+_ALIGNMENT = 64
+
+
+class SharedCache:
+    """
+    A read-only cache stored in a file which is memory-mapped instead of loaded (see 'write_shared_cache'). All
+    processes mapping the same file share its pages, so that the memory needed per node does not grow with the number
+    of processes using the cache. For a cache which is never written to disk, the file can be placed in /dev/shm.
+
+    Elements are returned as lists of read-only numpy arrays pointing into the mapped file. Outputs which were no
+    numpy arrays are returned as python scalars (e.g. python numbers) or lists (e.g. lists or tuples of numbers),
+    quantized arrays keep their mark (see pipeline.dtypes).
+
+    A SharedCache can be pickled (e.g. to be sent to worker processes), the file is then mapped again.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._open()
+
+    def _open(self):
+        with open(self.filepath, 'rb') as file:
+            magic, index_size = _PREFIX.unpack(file.read(_PREFIX.size))
+            assert magic == _MAGIC, f'{self.filepath} is not a shared cache.'
+
+            # every element is a list of (dtype, shape, offset, python_type) per output, see '_get_python_type'
+            self.index = pickle.loads(file.read(index_size))
+
+        data_offset = _get_data_offset(index_size)
+
+        if os.path.getsize(self.filepath) > data_offset:
+            self.data = np.memmap(self.filepath, dtype=np.uint8, mode='r', offset=data_offset)
+        else:
+            # empty files can not be mapped
+            self.data = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, index) -> List:
+        element = []
+
+        for dtype, shape, offset, python_type in self.index[index]:
+            size = dtype.itemsize * int(np.prod(shape))
+            output = self.data[offset:offset + size].view(dtype).reshape(shape)
+
+            if python_type == 'scalar': output = output.item()
+            if python_type == 'sequence': output = output.tolist()
+            if python_type == 'quantized': output = quantized(output)
+
+            element.append(output)
+
+        return element
+
+    def __getstate__(self):
+        return {'filepath': self.filepath}
+
+    def __setstate__(self, state):
+        self.filepath = state['filepath']
+        self._open()
+
+
+def write_shared_cache(filepath: str, cache: List[List]):
+    """
+    Writes 'cache' (a list of elements, each a list of outputs) such that it can be memory-mapped by SharedCache.
+    Every output has to be convertible to a numpy array of a non-object dtype.
+
+    The file starts with a pickled index of the dtypes, shapes and offsets of all outputs, followed by the raw data.
+    It is written to a temporary file first and then moved to 'filepath', so that other processes never map an
+    incomplete cache.
+    """
+    index, offset = [], 0
+
+    for element in cache:
+        index.append([])
+
+        for output in element:
+            array = np.asarray(output)
+            assert array.dtype != object, 'Only outputs convertible to numpy arrays can be cached in a shared cache.'
+
+            index[-1].append((array.dtype, array.shape, offset, _get_python_type(output, array)))
+            offset += (array.nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+    serialized_index = pickle.dumps(index)
+    data_offset = _get_data_offset(len(serialized_index))
+
+    temporary_filepath = f'{filepath}.{os.getpid()}.tmp'
+
+    with open(temporary_filepath, 'wb') as file:
+        file.write(_PREFIX.pack(_MAGIC, len(serialized_index)))
+        file.write(serialized_index)
+        file.truncate(data_offset + offset)
+
+    if offset > 0:
+        data = np.memmap(temporary_filepath, dtype=np.uint8, mode='r+', offset=data_offset, shape=(offset,))
+
+        for element, element_index in zip(cache, index):
+            for output, (dtype, shape, output_offset, _) in zip(element, element_index):
+                data[output_offset:output_offset + dtype.itemsize * int(np.prod(shape))] = \
+                    np.ascontiguousarray(output, dtype=dtype).reshape(-1).view(np.uint8)
+
+        data.flush()
+        del data
+
+    os.replace(temporary_filepath, filepath)
+
+
+def _get_python_type(output, array: np.ndarray):
+    """
+    Returns 'scalar' or 'sequence' for outputs which are restored as python objects, 'quantized' for quantized arrays
+    and None for all other numpy outputs.
+    """
+    if is_quantized_array(output): return 'quantized'
+    if isinstance(output, (np.ndarray, np.generic)): return None
+    return 'scalar' if array.ndim == 0 else 'sequence'
+
+
+def _get_data_offset(index_size: int) -> int:
+    return (_PREFIX.size + index_size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
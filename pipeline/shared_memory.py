@@ -0,0 +1,254 @@
+import multiprocessing as mp
+import os
+import struct
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty
+from threading import BrokenBarrierError
+from typing import Callable, Generator, List
+
+import numpy as np
+
+from pipeline.dtypes import encode_dtype, decode_dtype, quantized
+from pipeline.exceptions import IteratedThroughAll, RemotePipelineError
+from pipeline.pipeline_step import FirstPipelineStep
+from pipeline.pipeline_step_view import PipelineStepView
+
+_HEADER_SIZE = 512
+_ALIGNMENT = 64
+
+# marks the end of the data of one producer
+_END = -1
+
+
+class SharedMemoryRing:
+    """
+    Transports elements (lists of numpy arrays) between processes without pickling the arrays. The ring consists
+    of 'nr_slots' slots of 'slot_size' bytes in one block of shared memory. Every slot starts with a small header
+    holding the number of arrays and their dtypes and shapes.
+
+    'put' copies an element into a free slot, 'get' returns numpy views into a filled slot. The slot is released
+    as soon as all arrays returned by 'get' (and all views of them) are garbage collected. Arrays which are needed
+    for longer thus have to be copied, as the ring otherwise runs out of free slots.
+
+    A ring can be passed to other processes (e.g. as an argument of multiprocessing.Process), which then attach to
+    the same shared memory. Only the process which created the ring unlinks the memory in 'close'.
+    """
+
+    def __init__(self, nr_slots=8, slot_size=2 ** 20):
+        self.nr_slots = nr_slots
+        self.slot_size = slot_size
+
+        self.memory = SharedMemory(create=True, size=nr_slots * (_HEADER_SIZE + slot_size))
+        self.owner_pid = os.getpid()
+
+        self.free_slots = mp.Queue()
+        # written synchronously, such that the order of the slots from different processes is preserved
+        self.filled_slots = mp.SimpleQueue()
+        for i in range(nr_slots): self.free_slots.put(i)
+
+    def put(self, arrays: List, timeout: float = None):
+        """Copies 'arrays' into a free slot. Blocks until a slot is free (raises queue.Empty after 'timeout')."""
+        arrays = [np.asanyarray(a) for a in arrays]
+
+        header = struct.pack('!I', len(arrays))
+        for array in arrays:
+            dtype = encode_dtype(array)
+            header += struct.pack(f'!B{len(dtype)}sB{array.ndim}Q', len(dtype), dtype, array.ndim, *array.shape)
+
+        assert len(header) <= _HEADER_SIZE, 'The element has too many arrays or dimensions for the slot header.'
+        assert _get_offsets(arrays)[-1] <= self.slot_size, f'The element does not fit into a slot of ' \
+                                                           f'{self.slot_size} bytes.'
+
+        slot = self.free_slots.get(timeout=timeout)
+        start = slot * (_HEADER_SIZE + self.slot_size)
+
+        self.memory.buf[start:start + len(header)] = header
+        data = np.frombuffer(self.memory.buf, np.uint8, count=self.slot_size, offset=start + _HEADER_SIZE)
+
+        for array, offset in zip(arrays, _get_offsets(arrays)):
+            data[offset:offset + array.nbytes].view(array.dtype).reshape(array.shape)[...] = array
+
+        del data
+        self.filled_slots.put(slot)
+
+    def put_end(self):
+        """Signals the consumer that a producer has put all its elements."""
+        self.filled_slots.put(_END)
+
+    def put_error(self, message: str):
+        """Signals the consumer that a producer failed with 'message' (see 'get')."""
+        self.filled_slots.put(message)
+
+    def get(self) -> List[np.ndarray]:
+        """
+        Returns the arrays of the next filled slot as views into the shared memory, or None if a producer has
+        signaled its end (see 'put_end'). Raises a RemotePipelineError if a producer has failed (see 'put_error').
+        Blocks until a slot is filled.
+        """
+        slot = self.filled_slots.get()
+        if isinstance(slot, str): raise RemotePipelineError(slot)
+        if slot == _END: return None
+
+        start = slot * (_HEADER_SIZE + self.slot_size)
+        header = self.memory.buf[start:start + _HEADER_SIZE]
+
+        nr_arrays, = struct.unpack_from('!I', header)
+        position = 4
+
+        dtypes, shapes, are_quantized = [], [], []
+        for _ in range(nr_arrays):
+            dtype_length, = struct.unpack_from('!B', header, position)
+            dtype, is_quantized = decode_dtype(bytes(header[position + 1:position + 1 + dtype_length]))
+            dtypes.append(dtype)
+            are_quantized.append(is_quantized)
+            position += 1 + dtype_length
+
+            ndim, = struct.unpack_from('!B', header, position)
+            shapes.append(struct.unpack_from(f'!{ndim}Q', header, position + 1))
+            position += 1 + 8 * ndim
+
+        header.release()
+
+        data = np.frombuffer(self.memory.buf, np.uint8, count=self.slot_size, offset=start + _HEADER_SIZE)
+        data.flags.writeable = False
+
+        # all returned arrays keep 'data' alive, the slot is thus released once none of them is used anymore
+        weakref.finalize(data, self.free_slots.put, slot)
+
+        sizes = [d.itemsize * int(np.prod(s)) for d, s in zip(dtypes, shapes)]
+        offsets = _get_offsets(sizes)
+
+        arrays = [data[o:o + n].view(d).reshape(s) for o, n, d, s in zip(offsets, sizes, dtypes, shapes)]
+        return [quantized(a) if q else a for a, q in zip(arrays, are_quantized)]
+
+    def close(self):
+        try:
+            self.memory.close()
+        except BufferError:
+            # arrays returned by 'get' are still in use, the memory is unmapped once they are garbage collected
+            pass
+
+        if os.getpid() == self.owner_pid: self.memory.unlink()
+
+
+class SharedMemorySource(FirstPipelineStep):
+    """
+    A data source yielding the elements of a SharedMemoryRing, filled by 'nr_producers' producers (see
+    SharedMemoryProducers). Once every producer has signaled its end, 'finished_iteration' is called if the view
+    argument 'all_then_stop' is provided.
+
+    The outputs are read-only views into the shared memory (see SharedMemoryRing.get). If a producer fails, its
+    exception is raised as a RemotePipelineError.
+    """
+
+    def __init__(self, ring: SharedMemoryRing, nr_producers=1, **arguments):
+        super().__init__(**arguments)
+        self.ring = ring
+        self.nr_producers = nr_producers
+        self.nr_ended = 0
+
+    def get_next(self, previous: Generator, all_then_stop=False, **arguments) -> Generator:
+        element = self.ring.get()
+
+        while element is None:
+            self.nr_ended += 1
+
+            if self.nr_ended == self.nr_producers:
+                self.nr_ended = 0
+                if all_then_stop: self.finished_iteration()
+
+            element = self.ring.get()
+
+        yield element
+
+
+class SharedMemoryProducers:
+    """
+    Runs 'nr_producers' processes, each iterating a view and putting its elements into 'ring'.
+
+    'view_factory' is called in every producer process with the index of the producer and has to return the view to
+    iterate (it has to be picklable, e.g. a module-level function, unless processes are forked). Every producer
+    iterates its view epoch by epoch (using 'all_then_stop') and signals the end of every epoch to the ring. The
+    producers only start the next epoch once all of them have finished the current one, such that the epochs seen
+    by a SharedMemorySource are not mixed up.
+
+    If the view of a producer raises an exception, it is sent through the ring and the epoch barrier is aborted, so
+    that all producers end instead of waiting for the failed one.
+    """
+
+    def __init__(self, view_factory: Callable[[int], PipelineStepView], ring: SharedMemoryRing, nr_producers=1):
+        self.view_factory = view_factory
+        self.ring = ring
+        self.nr_producers = nr_producers
+
+        self.is_stopped = mp.Event()
+        self.epoch_barrier = mp.Barrier(nr_producers)
+        self.processes = []
+
+    def start(self):
+        self.processes = [mp.Process(target=_produce, args=(self.view_factory, self.ring, i, self.is_stopped,
+                                                              self.epoch_barrier),
+                                     daemon=True)
+                          for i in range(self.nr_producers)]
+        for p in self.processes: p.start()
+
+        return self
+
+    def stop(self):
+        self.is_stopped.set()
+        self.epoch_barrier.abort()
+
+        for p in self.processes:
+            p.join(5)
+            if p.is_alive(): p.terminate()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def _produce(view_factory: Callable, ring: SharedMemoryRing, producer_index: int, is_stopped, epoch_barrier):
+    view = view_factory(producer_index)
+    # the barrier is aborted if any producer fails
+    is_ended = lambda: is_stopped.is_set() or epoch_barrier.broken
+
+    while not is_ended():
+        generator = view.get_view(all_then_stop=True).get_generator()
+
+        try:
+            while not is_ended():
+                element = next(generator)
+
+                while not is_ended():
+                    try:
+                        ring.put(element, timeout=0.1)
+                        break
+                    except Empty:
+                        pass
+        except IteratedThroughAll:
+            ring.put_end()
+
+            try:
+                epoch_barrier.wait()
+            except BrokenBarrierError:
+                break
+        except Exception as e:
+            ring.put_error(f'{type(e).__name__}: {e}')
+            epoch_barrier.abort()
+            break
+
+    ring.close()
+
+
+def _get_offsets(arrays: List) -> List[int]:
+    """Returns the aligned offsets of the arrays (or sizes in bytes) in a slot, followed by the end of the last one."""
+    offsets = [0]
+
+    for a in arrays:
+        size = a.nbytes if isinstance(a, np.ndarray) else a
+        offsets.append(offsets[-1] + (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT)
+
+    return offsets
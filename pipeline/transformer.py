@@ -1,25 +1,83 @@
 import itertools
-from collections import Iterable
-from typing import Generator, Callable
+from collections.abc import Iterable
+from concurrent.futures import Executor
+from typing import Generator, Callable, List, Tuple, Union
 
 import numpy as np
 
+from pipeline.dtypes import copy_into, get_batch_dtype, is_quantized_array, quantized
+from pipeline.exceptions import IteratedThroughAll
 from pipeline.pipeline_step import PipelineStep, FinalPipelineStep
+from pipeline.pipeline_step_view import PipelineStepView
 
 
 class FunctionTransformer(PipelineStep):
+    """
+    A pipeline step which applies 'transform' to every incoming element of every stream.
+
+    If the step releases the GIL in 'transform' ('releases_gil', e.g. for OpenCV-based steps) and a
+    concurrent.futures.ThreadPoolExecutor is provided as the view argument 'thread_pool', up to 'nr_parallel_elements'
+    incoming elements are read at once and all of their streams are transformed concurrently in this pool. As view
+    arguments are passed to every step, all steps in a view share the same pool.
+
+    uint8 results are marked as quantized (see pipeline.dtypes) if 'returns_quantized' is true for their input.
+    """
+
+    releases_gil = False
+
+    # if true, 'transform' writes its result into the argument 'out' if provided (see StackChannels), and the step
+    # has to implement 'get_output_spec(input, **arguments)', returning the shape and the dtype of the result
+    supports_out = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if cls.supports_out and not callable(getattr(cls, 'get_output_spec', None)):
+            raise TypeError(f'{cls.__name__} supports out but does not implement get_output_spec.')
 
     def __init__(self, function: Callable = None, **arguments):
         super().__init__(**arguments)
         self.function = function
 
-    def get_next(self, previous: Generator, **arguments) -> Generator:
-        inputs = next(previous)
-        yield [self.transform(i, **arguments) for i in inputs]
+    def get_next(self, previous: Generator, thread_pool: Executor = None, nr_parallel_elements=1, **arguments) \
+            -> Generator:
+        if thread_pool is None or not self.releases_gil:
+            inputs = next(previous)
+            yield [self._transform(i, arguments) for i in inputs]
+            return
+
+        elements, is_exhausted = [], False
+        try:
+            while len(elements) < nr_parallel_elements: elements.append(next(previous))
+        except IteratedThroughAll:
+            if not elements: raise
+            is_exhausted = True
+
+        results = [[self._submit(thread_pool, i, arguments) for i in inputs] for inputs in elements]
+        for result in results: yield [get_result() for get_result in result]
+
+        if is_exhausted: raise IteratedThroughAll()
 
     def transform(self, input, **arguments):
         return self.function(input, **arguments)
 
+    def returns_quantized(self, input, **arguments) -> bool:
+        """Returns whether the uint8 result for 'input' holds quantized values, by default if 'input' does."""
+        return is_quantized_array(input)
+
+    def _transform(self, input, arguments: dict):
+        output = self.transform(input, **arguments)
+
+        if isinstance(output, np.ndarray) and output.dtype == np.uint8 and not is_quantized_array(output) \
+                and self.returns_quantized(input, **arguments):
+            return quantized(output)
+
+        return output
+
+    def _submit(self, thread_pool: Executor, input, arguments: dict) -> Callable:
+        """Submits the transformation of 'input' to 'thread_pool' and returns a function waiting for the result."""
+        return thread_pool.submit(self._transform, input, arguments).result
+
 
 class StreamsToList(PipelineStep):
 
@@ -48,6 +106,109 @@ class StackIncomingStreams(PipelineStep):
         yield [np.stack(next(previous), axis=-1)]
 
 
+class StackChannels(PipelineStep):
+    """
+    A pipeline step which stacks the incoming streams (which all have to have the same shape) along a new last axis,
+    like StackIncomingStreams, e.g. an image (H, W) and further channels into an (H, W, C) array. If 'batch_size' is
+    provided, 'batch_size' elements are stacked into one (N, H, W, C) batch instead, where the last batch of an
+    iteration (see 'all_then_stop') can be smaller.
+
+    The result is allocated once and every channel is written directly into its slot. Incoming views of
+    FunctionTransformer's which support it ('supports_out') are bypassed when connecting: their inputs are connected
+    instead and 'transform' is called with the slot as 'out', so that the channel is not stored separately and copied
+    again. Views which are already consumed elsewhere are not bypassed. All other channels (and the ones whose dtype
+    differs from the one of the result) are copied into their slot.
+
+    The dtype of the result follows the policy given by the view argument 'dtype' and quantized channels are
+    dequantized (see pipeline.dtypes), otherwise it is the common dtype of all channels.
+    """
+
+    separate_inputs = True
+
+    def connect_to(self, previous: Union[PipelineStepView, List[PipelineStepView]] = None,
+                   previous_indices: Union[int, List[int], List[List[int]]] = None) \
+            -> PipelineStepView:
+        previous, previous_indices = self._get_incoming(previous, previous_indices)
+
+        # the transformer applied to every stream of an incoming view, None if the streams are simply copied
+        channel_steps = []
+        incoming, incoming_indices = [], []
+
+        for view, indices in zip(previous, previous_indices):
+            if isinstance(view.step, FunctionTransformer) and view.step.supports_out and len(view.previous) == 1 \
+                    and not view.is_cached and not view.step.is_cache_point and not view.readers:
+                # the bypassed view no longer reads from its incoming view
+                view.detach()
+
+                channel_steps.append(view.step)
+                incoming.append(view.previous[0])
+                incoming_indices.append(_compose_indices(view.previous_indices[0], indices))
+            else:
+                channel_steps.append(None)
+                incoming.append(view)
+                incoming_indices.append(indices)
+
+        return PipelineStepView(self, incoming, incoming_indices, channel_steps=channel_steps)
+
+    def get_next(self, previous: List[Generator], channel_steps: List[FunctionTransformer] = None, batch_size=None,
+                 **arguments) -> Generator:
+        if channel_steps is None: channel_steps = [None] * len(previous)
+
+        elements, is_exhausted = [], False
+        try:
+            while len(elements) < (1 if batch_size is None else batch_size):
+                elements.append([(step, i) for step, g in zip(channel_steps, previous) for i in next(g)])
+        except IteratedThroughAll:
+            if not elements: raise
+            is_exhausted = True
+
+        specs = [[self._get_spec(step, i, arguments) for step, i in channels] for channels in elements]
+
+        shape = specs[0][0][0]
+        assert all([s == shape for channel_specs in specs for s, _ in channel_specs]), \
+            'All stacked streams need to have the same shape.'
+
+        is_quantized = any([self._is_quantized(step, input, spec[1], arguments)
+                            for (step, input), spec in zip(elements[0], specs[0])])
+        dtype = get_batch_dtype(np.result_type(*[d for _, d in specs[0]]), arguments.get('dtype'), is_quantized)
+        output = np.empty((len(elements),) + shape + (len(specs[0]),), dtype=dtype)
+
+        for n, channels in enumerate(elements):
+            for c, (step, input) in enumerate(channels):
+                slot = output[n, ..., c]
+
+                if step is None:
+                    copy_into(slot, input)
+                elif specs[n][c][1] == dtype:
+                    step.transform(input, out=slot, **_get_step_arguments(step, arguments))
+                else:
+                    copy_into(slot, step._transform(input, _get_step_arguments(step, arguments)))
+
+        yield [output if batch_size is not None else output[0]]
+
+        if is_exhausted: raise IteratedThroughAll()
+
+    def _get_spec(self, step: FunctionTransformer, input, arguments: dict) -> Tuple[tuple, np.dtype]:
+        if step is None: return np.shape(input), np.asarray(input).dtype
+        return step.get_output_spec(input, **_get_step_arguments(step, arguments))
+
+    def _is_quantized(self, step: FunctionTransformer, input, dtype: np.dtype, arguments: dict) -> bool:
+        if step is None: return is_quantized_array(input)
+        return dtype == np.uint8 and step.returns_quantized(input, **_get_step_arguments(step, arguments))
+
+
+def _get_step_arguments(step: PipelineStep, arguments: dict) -> dict:
+    """Returns the arguments of a bypassed view of 'step', i.e. its step arguments overridden by 'arguments'."""
+    return {**step.arguments, **arguments}
+
+
+def _compose_indices(inner: List[int], outer: List[int]) -> List[int]:
+    """Returns the indices of the streams selected by 'outer' from the streams selected by 'inner'."""
+    if outer is None: return inner
+    if inner is None: return outer
+    return [inner[i] for i in outer]
+
+
 class DictToValue(FunctionTransformer):
 
     def transform(self, dict, key='', **arguments):
@@ -16,6 +16,37 @@ class IntegerStream(FirstPipelineStep):
         self.next_number += 1
         yield [self.next_number] * self.nr_outgoing_streams
 
+    def state_dict(self) -> dict:
+        return {'next_number': self.next_number}
+
+    def load_state_dict(self, state: dict):
+        self.next_number = state['next_number']
+
+
+class FiniteIntegerStream(FirstPipelineStep):
+    """Yields the numbers 0, ..., 'nr_elements' - 1 and then starts again from 0."""
+
+    def __init__(self, nr_elements=10, nr_outgoing_streams=1, **arguments):
+        super().__init__(**arguments)
+
+        self.nr_elements = nr_elements
+        self.nr_outgoing_streams = nr_outgoing_streams
+        self.next_number = 0
+
+    def get_next(self, previous: Generator, all_then_stop=False, **arguments) -> Generator:
+        if self.next_number == self.nr_elements:
+            self.next_number = 0
+            if all_then_stop: self.finished_iteration()
+
+        self.next_number += 1
+        yield [self.next_number - 1] * self.nr_outgoing_streams
+
+    def state_dict(self) -> dict:
+        return {'next_number': self.next_number}
+
+    def load_state_dict(self, state: dict):
+        self.next_number = state['next_number']
+
 
 class Adder(FunctionTransformer):
 
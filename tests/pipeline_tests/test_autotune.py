@@ -0,0 +1,110 @@
+import json
+import time
+from unittest import TestCase
+
+from pipeline.autotune import Autotuner, ExecutionConfig
+from pipeline.control_flow import Identity
+from pipeline.transformer import FunctionTransformer
+from tests.helper import IntegerStream, FiniteIntegerStream, Adder
+
+
+class SlowAdder(Adder):
+
+    releases_gil = True
+
+    def transform(self, number, increment=0, **arguments):
+        # sleeping releases the GIL
+        time.sleep(0.005)
+        return super().transform(number, increment, **arguments)
+
+
+class TestPrefetch(TestCase):
+
+    def test_prefetch(self):
+        output = Adder(increment=1)(FiniteIntegerStream(nr_elements=5)())
+
+        generator = output.get_view(prefetch=2).get_generator()
+        self.assertListEqual([next(generator) for _ in range(7)], [[1], [2], [3], [4], [5], [1], [2]])
+
+    def test_prefetch_single_pass(self):
+        output = Adder(increment=1)(FiniteIntegerStream(nr_elements=5)())
+        self.assertListEqual(output.get_view(prefetch=3).generate_all_data(), [[1], [2], [3], [4], [5]])
+
+
+    def test_prefetch_only_on_view(self):
+        view = Adder(increment=1)(Adder(increment=1)(IntegerStream()())).get_view(prefetch=2)
+        next(view.get_generator())
+
+        self.assertEqual([v.prefetch_thread is not None for v in view.get_all_views()], [False, False, True])
+        view.stop_prefetching()
+
+class TestAutotune(TestCase):
+
+    def _get_pipeline(self):
+        return Identity()(SlowAdder(increment=10)(Adder(increment=1)(IntegerStream()())))
+
+    def test_tuning(self):
+        tuner = Autotuner(self._get_pipeline(), nr_warmup_elements=10, cpu_budget=8)
+
+        data = []
+        for element in tuner:
+            data.append(element[0])
+            if len(data) == 40: break
+
+        tuner.close()
+
+        self.assertListEqual(data, list(range(12, 52)))
+
+        self.assertEqual(tuner.config.view_arguments[3], {'prefetch': tuner.config.view_arguments[3]['prefetch']})
+        self.assertGreater(tuner.config.view_arguments[2]['nr_parallel_elements'], 1)
+        self.assertLessEqual(tuner.config.nr_threads, 7)
+        self.assertGreater(tuner.latencies[2], tuner.latencies[1])
+
+    def test_prefetched_elements_are_kept(self):
+        tuner = Autotuner(Identity()(Adder(increment=1, prefetch=4)(IntegerStream()())), nr_warmup_elements=10)
+
+        data = []
+        for element in tuner:
+            data.append(element[0])
+
+            # the measured view has prefetched elements when the tuned view takes over
+            if len(data) == 10:
+                prefetching = tuner.measured_view.get_all_views()[1]
+                while prefetching.prefetch_queue.qsize() < 4: time.sleep(0.01)
+
+            if len(data) == 20: break
+
+        tuner.close()
+
+        self.assertListEqual(data, list(range(2, 22)))
+
+    def test_thread_budget(self):
+        pipeline = Identity()(SlowAdder(increment=1)(SlowAdder(increment=1)(IntegerStream()())))
+        tuner = Autotuner(pipeline, nr_warmup_elements=5, cpu_budget=4)
+
+        for _ in zip(range(10), tuner): pass
+        tuner.close()
+
+        # the final view prefetches with one thread, the parallel views share the remaining ones
+        parallel = [a.get('nr_parallel_elements', 0) for a in tuner.config.view_arguments.values()]
+        self.assertEqual(tuner.config.nr_threads, sum(parallel))
+        self.assertLessEqual(tuner.config.nr_threads, 2)
+
+    def test_budgets(self):
+        tuner = Autotuner(self._get_pipeline(), nr_warmup_elements=5, cpu_budget=1)
+
+        for _ in zip(range(10), tuner): pass
+        self.assertEqual(tuner.config.view_arguments, dict())
+
+    def test_frozen_config(self):
+        config = ExecutionConfig(nr_threads=2, view_arguments={2: {'nr_parallel_elements': 2}, 3: {'prefetch': 4}})
+        config = ExecutionConfig.from_dict(json.loads(json.dumps(config.to_dict())))
+
+        tuner = Autotuner(self._get_pipeline(), config=config)
+        generator = iter(tuner)
+
+        self.assertListEqual([next(generator)[0] for _ in range(5)], [12, 13, 14, 15, 16])
+        self.assertEqual(tuner.latencies, dict())
+        self.assertEqual(tuner.thread_pool._max_workers, 2)
+
+        tuner.close()
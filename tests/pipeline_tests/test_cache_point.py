@@ -0,0 +1,57 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from pipeline.control_flow import CachePoint, Identity
+from tests.helper import FiniteIntegerStream, Adder
+
+
+class CountingAdder(Adder):
+
+    def __init__(self, **arguments):
+        super().__init__(**arguments)
+        self.nr_calls = 0
+
+    def transform(self, number, increment=0, **arguments):
+        self.nr_calls += 1
+        return super().transform(number, increment, **arguments)
+
+
+class TestCachePoint(TestCase):
+
+    def test_upstream_executed_once(self):
+        upstream = CountingAdder(increment=1)
+        downstream = CountingAdder(increment=10)
+
+        stream = upstream(FiniteIntegerStream(nr_elements=5)())
+        stream = CachePoint()(stream)
+        output = Identity()(downstream(stream))
+
+        generator = output.get_view().get_generator()
+        data = [next(generator)[0] for _ in range(15)]
+
+        self.assertListEqual(data, [11, 12, 13, 14, 15] * 3)
+        self.assertEqual(upstream.nr_calls, 5)
+        self.assertEqual(downstream.nr_calls, 15)
+
+    def test_cache_filepath(self):
+        with TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'point.cache')
+
+            upstream = CountingAdder()
+            output = CachePoint()(upstream(FiniteIntegerStream(nr_elements=4)()))
+
+            generator = output.get_view(cache_filepath=filepath).get_generator()
+            self.assertListEqual([next(generator)[0] for _ in range(6)], [0, 1, 2, 3, 0, 1])
+            self.assertTrue(os.path.isfile(filepath))
+
+            generator = output.get_view(cache_filepath=filepath).get_generator()
+            self.assertListEqual([next(generator)[0] for _ in range(2)], [0, 1])
+            self.assertEqual(upstream.nr_calls, 4)
+
+    def test_single_pass_is_not_cached(self):
+        upstream = CountingAdder()
+        output = CachePoint()(upstream(FiniteIntegerStream(nr_elements=4)()))
+
+        self.assertEqual(len(output.generate_all_data()), 4)
+        self.assertFalse(output.is_cached)
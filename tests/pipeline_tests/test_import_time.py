@@ -0,0 +1,53 @@
+import json
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+# the cold-start import time of the core modules in seconds (the import of numpy takes most of it)
+CORE_IMPORT_BUDGET = 1.0
+
+CORE_MODULES = ['pipeline.pipeline_step', 'pipeline.pipeline_step_view', 'pipeline.control_flow',
+                'pipeline.transformer']
+
+HEAVY_MODULES = ['cv2', 'matplotlib', 'pydicom', 'tensorflow']
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _import_in_new_process(statement: str) -> dict:
+    """Runs 'statement' in a new interpreter and returns its duration and the heavy modules loaded by it."""
+    code = f'''
+import json, sys, time
+start = time.perf_counter()
+{statement}
+duration = time.perf_counter() - start
+print(json.dumps({{'duration': duration, 'loaded': [m for m in {HEAVY_MODULES} if m in sys.modules]}}))
+'''
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPOSITORY, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+class TestImportTime(TestCase):
+
+    def test_core_budget(self):
+        result = _import_in_new_process('; '.join([f'import {m}' for m in CORE_MODULES]))
+
+        self.assertListEqual(result['loaded'], [])
+        self.assertLess(result['duration'], CORE_IMPORT_BUDGET)
+
+    def test_heavy_dependencies_are_lazy(self):
+        result = _import_in_new_process('import pipeline, pipeline.image_steps, pipeline.optimization, '
+                                        'pipeline.dicom_steps, pipeline.ML_steps')
+        self.assertListEqual(result['loaded'], [])
+
+        result = _import_in_new_process('import numpy as np, pipeline; pipeline.Dilation().transform(np.zeros((4, 4)))')
+        self.assertListEqual(result['loaded'], ['cv2'])
+
+    def test_lazy_attributes(self):
+        import pipeline
+        from pipeline.control_flow import WeightedInterleave
+
+        self.assertIs(pipeline.WeightedInterleave, WeightedInterleave)
+        self.assertIn('Morphology', dir(pipeline))
+        self.assertRaises(AttributeError, lambda: pipeline.NotAStep)
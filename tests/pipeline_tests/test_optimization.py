@@ -0,0 +1,191 @@
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.control_flow import Filter, Identity
+from pipeline.image_steps import GeometricAugment, RandomlyCrop, Resize, Reshape, Dilation, Erosion, Morphology, \
+    AverageFilter
+from pipeline.optimization import push_down_filters, fuse_geometric_steps, fuse_morphology
+from pipeline.transformer import FunctionTransformer
+from tests.helper import IntegerStream, Adder
+
+
+class Square(FunctionTransformer):
+
+    def __init__(self, **arguments):
+        super().__init__(**arguments)
+        self.nr_calls = 0
+
+    def transform(self, number, **arguments):
+        self.nr_calls += 1
+        return number ** 2
+
+
+class EvenFilter(Filter):
+
+    commutes_with = (Square,)
+
+    def accept(self, inputs, **arguments):
+        return all([i % 2 == 0 for i in inputs])
+
+
+class TestFilterPushdown(TestCase):
+
+    def _get_data(self, view, nr_elements=5):
+        generator = view.get_generator()
+        return [next(generator) for _ in range(nr_elements)]
+
+    def test_move_filter(self):
+        square_1, square_2 = Square(), Square()
+        output = Identity()(EvenFilter()(square_2(square_1(IntegerStream()()))))
+
+        optimized, report = push_down_filters(output)
+
+        self.assertListEqual(self._get_data(optimized), [[16], [256], [1296], [4096], [10000]])
+        self.assertEqual(square_1.nr_calls, 5)
+        self.assertEqual(square_2.nr_calls, 5)
+        self.assertEqual(len(report.moved_filters), 1)
+        self.assertEqual(report.nr_avoided_steps, 10)
+
+        self.assertListEqual(self._get_data(output), [[n ** 4] for n in range(12, 21, 2)])
+
+    def test_shared_views_are_not_passed(self):
+        def get_pipeline():
+            stream = Square()(IntegerStream()())
+            return Identity()([EvenFilter()(stream), Identity()(stream)])
+
+        optimized, report = push_down_filters(get_pipeline())
+
+        self.assertListEqual(self._get_data(optimized), self._get_data(get_pipeline()))
+        self.assertEqual(len(report.moved_filters), 0)
+
+    def test_pre_check(self):
+        stream = Adder(increment=1)(IntegerStream()())
+        adder = Adder(increment=1)
+        output = EvenFilter(pre_check=lambda inputs, **arguments: inputs[0] % 2 == 0)(adder(stream))
+
+        optimized, report = push_down_filters(output)
+
+        self.assertListEqual(self._get_data(optimized, 3), [[4], [6], [8]])
+        self.assertEqual(len(report.pre_checks), 1)
+        self.assertEqual(report.nr_avoided_steps, 2 * report.pre_checks[0][0].nr_rejected)
+        self.assertEqual(report.pre_checks[0][0].nr_rejected, 3)
+
+    def test_average_filter_stays_behind_resize(self):
+        output = AverageFilter(min_avg=0.5)(Resize(width=8, height=8)(Reshape(shape=(16, 16))(IntegerStream()())))
+
+        optimized, report = push_down_filters(output)
+
+        self.assertIsInstance(optimized.step, AverageFilter)
+        self.assertIsInstance(optimized.previous[0].step, Resize)
+        self.assertEqual(len(report.moved_filters), 0)
+
+
+    def test_several_incoming_views(self):
+        def get_pipeline():
+            return EvenFilter()([Square()(IntegerStream()()), Adder(increment=100)(IntegerStream()())])
+
+        optimized, report = push_down_filters(get_pipeline())
+
+        self.assertEqual(len(optimized.previous), 2)
+        self.assertListEqual(self._get_data(optimized), self._get_data(get_pipeline()))
+        self.assertEqual(len(report.moved_filters), 0)
+
+    def test_average_filter_pre_check(self):
+        pre_check = lambda inputs, min_avg=0.5, **arguments: np.mean(inputs[0]) > min_avg
+        resized = Resize(width=8, height=8)(ToImage()(IntegerStream()()))
+        output = AverageFilter(min_avg=0.5, pre_check=pre_check)(resized)
+
+        optimized, report = push_down_filters(output)
+
+        # the resize is skipped for the elements rejected by the pre-check
+        self.assertEqual(report.pre_checks[0][1], [output.previous[0].step, output.previous[0].previous[0].step])
+        self.assertIsInstance(optimized.previous[0].previous[0].previous[0].step, type(report.pre_checks[0][0]))
+        self.assertEqual(len(self._get_data(optimized)), 5)
+
+
+class ToImage(FunctionTransformer):
+
+    def transform(self, number, **arguments):
+        return np.full((64, 48, 3), number, dtype=np.float32)
+
+
+class ToGradient(FunctionTransformer):
+
+    def transform(self, number, **arguments):
+        rows, columns = np.mgrid[:64, :48]
+        return np.stack([rows, 100 * columns, number * rows + columns], axis=-1).astype(np.float32)
+
+
+class TestGeometricFusion(TestCase):
+
+    def _get_output(self):
+        stream = ToGradient()(IntegerStream()())
+        stream = Resize(width=16, height=8)(RandomlyCrop(crop_width=32, crop_height=40)(stream))
+        return Reshape(shape=(8, 16, 3, 1))(stream).get_view(seed=7)
+
+    def test_fuse(self):
+        fused = fuse_geometric_steps(self._get_output())
+
+        self.assertIsInstance(fused.step, GeometricAugment)
+        self.assertIsInstance(fused.previous[0].step, ToGradient)
+
+        # on linear gradients, the bilinear warp matches the resize exactly (also if scaled by an integer factor)
+        expected, fused_generator = self._get_output().get_generator(), fused.get_generator()
+        for _ in range(5):
+            image, expected_image = next(fused_generator)[0], next(expected)[0]
+
+            self.assertEqual(image.shape, (8, 16, 3, 1))
+            np.testing.assert_allclose(image, expected_image, atol=1e-3)
+
+    def test_shared_views_are_not_fused(self):
+        crop = RandomlyCrop(crop_width=32, crop_height=32)(ToImage()(IntegerStream()()))
+        output = Identity()([Resize(width=16, height=16)(crop), Identity()(crop)])
+
+        fused = fuse_geometric_steps(output)
+
+        self.assertFalse(any([isinstance(v.step, GeometricAugment) for v in fused.get_all_views()]))
+
+
+class ToNoise(FunctionTransformer):
+
+    def transform(self, number, shape=(32, 24), **arguments):
+        return np.random.default_rng(number).integers(0, 255, size=shape, dtype=np.uint8)
+
+
+class TestMorphologyFusion(TestCase):
+
+    def _get_output(self, shape=(32, 24)):
+        stream = ToNoise(shape=shape)(IntegerStream()())
+        stream = Dilation(kernel_size=5, kernel_shape='ellipse')(Erosion(kernel_size=3)(stream))
+        return Morphology(operations=[('tophat', 3, 'cross')])(stream)
+
+    def test_fuse(self):
+        fused = fuse_morphology(self._get_output())
+
+        self.assertIsInstance(fused.step, Morphology)
+        self.assertIsInstance(fused.previous[0].step, ToNoise)
+        self.assertListEqual(fused.arguments['operations'],
+                             [('erode', 3, 'rect', 1), ('dilate', 5, 'ellipse', 1), ('tophat', 3, 'cross')])
+
+        expected, fused_generator = self._get_output().get_generator(), fused.get_generator()
+        for _ in range(3):
+            np.testing.assert_array_equal(next(fused_generator)[0], next(expected)[0])
+
+    def test_single_channel(self):
+        fused, expected = fuse_morphology(self._get_output((32, 24, 1))), self._get_output((32, 24, 1))
+
+        image, expected_image = next(fused.get_generator())[0], next(expected.get_generator())[0]
+        self.assertEqual(image.shape, (32, 24))
+        np.testing.assert_array_equal(image, expected_image)
+
+        morphology = Morphology(operations=[('open', 3)])(ToNoise(shape=(32, 24, 1))(IntegerStream()()))
+        self.assertEqual(next(fuse_morphology(morphology).get_generator())[0].shape, (32, 24, 1))
+
+    def test_shared_views_are_not_fused(self):
+        erosion = Erosion()(ToNoise()(IntegerStream()()))
+        output = Identity()([Dilation()(erosion), Identity()(erosion)])
+
+        fused = fuse_morphology(output)
+
+        self.assertFalse(any([isinstance(v.step, Morphology) for v in fused.get_all_views()]))
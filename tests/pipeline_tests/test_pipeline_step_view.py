@@ -1,9 +1,23 @@
 from unittest import TestCase
 
+from typing import Generator
+
 from pipeline.control_flow import Identity
+from pipeline.pipeline_step import PipelineStep
 from tests.helper import IntegerStream, Adder
 
 
+class NeededOutputsRecorder(PipelineStep):
+
+    def __init__(self, **arguments):
+        super().__init__(**arguments)
+        self.needed_outputs = []
+
+    def get_next(self, previous: Generator, needed_outputs=None, **arguments) -> Generator:
+        self.needed_outputs.append(needed_outputs)
+        for inputs in previous: yield inputs
+
+
 class TestPipelineStepView(TestCase):
 
     def test_sequential(self):
@@ -80,3 +94,23 @@ class TestPipelineStepView(TestCase):
         self.assertListEqual(next(generator3), [12, 10])
         self.assertListEqual(next(generator2), [10, 9])
         self.assertListEqual(next(generator2), [11, 10])
+
+    def test_needed_outputs(self):
+        input_stream = IntegerStream(nr_outgoing_streams=4)()
+        recorder = NeededOutputsRecorder()(input_stream)
+        a = Identity()(recorder, [0])
+        b = Identity()(recorder, [2])
+        output = Identity()([a, b])
+
+        view = output.get_view()
+        generator = view.get_generator()
+
+        self.assertListEqual(next(generator), [1, 1])
+        self.assertListEqual(next(generator), [2, 2])
+        self.assertListEqual(recorder.step.needed_outputs, [[0, 2]])
+
+        recorder_view = view.previous[0].previous[0]
+        self.assertSetEqual(set(recorder_view.outgoing_data_queues.keys()), {0, 2})
+        self.assertTrue(all([q.empty() for q in recorder_view.outgoing_data_queues.values()]))
+        self.assertIsNone(view.get_needed_outputs())
+        self.assertListEqual(recorder.get_needed_outputs(), [0, 2])
@@ -0,0 +1,86 @@
+import os
+import pickle
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.control_flow import CachePoint
+from pipeline.shared_cache import SharedCache, write_shared_cache
+from pipeline.transformer import FunctionTransformer
+from tests.helper import FiniteIntegerStream
+
+
+class ToImage(FunctionTransformer):
+
+    def transform(self, number, **arguments):
+        return np.full((4, 4, 2), number, dtype=np.uint8)
+
+
+class TestSharedCache(TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.filepath = os.path.join(self.directory.name, 'test.cache')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_and_read(self):
+        cache = [[np.arange(6, dtype=np.float32).reshape(2, 3), 3, np.float64(1.5)],
+                 [np.zeros((0, 4)), 4, np.float64(2.5)]]
+        write_shared_cache(self.filepath, cache)
+
+        shared_cache = SharedCache(self.filepath)
+        self.assertEqual(len(shared_cache), 2)
+
+        for element in [shared_cache[0], pickle.loads(pickle.dumps(shared_cache))[0]]:
+            np.testing.assert_array_equal(element[0], cache[0][0])
+            self.assertEqual(element[0].dtype, np.float32)
+            self.assertFalse(element[0].flags.writeable)
+            self.assertEqual(element[1], 3)
+            self.assertIsInstance(element[1], int)
+            self.assertEqual(element[2], 1.5)
+
+        self.assertEqual(shared_cache[1][0].shape, (0, 4))
+
+    def test_sequences(self):
+        write_shared_cache(self.filepath, [[[1, 2], 3, (0.5, 1.5)]])
+
+        self.assertListEqual(SharedCache(self.filepath)[0], [[1, 2], 3, [0.5, 1.5]])
+
+    def test_cache_or_load(self):
+        stream = ToImage()(FiniteIntegerStream(nr_elements=5)())
+        stream.cache_or_load(self.filepath, shared=True)
+
+        self.assertIsInstance(stream.cache, SharedCache)
+
+        other = ToImage()(FiniteIntegerStream(nr_elements=5)())
+        other.cache_or_load(self.filepath, shared=True)
+
+        generator = other.get_generator()
+        self.assertListEqual([int(next(generator)[0][0, 0, 0]) for _ in range(7)], [0, 1, 2, 3, 4, 0, 1])
+
+    def test_independent_shuffling(self):
+        stream = ToImage()(FiniteIntegerStream(nr_elements=20)())
+        stream.cache_or_load(self.filepath, shared=True)
+
+        first = stream.get_view(shuffle=True, seed=1).get_generator()
+        second = stream.get_view(shuffle=True, seed=2).get_generator()
+        ordered = stream.get_view().get_generator()
+
+        first_data = [int(next(first)[0][0, 0, 0]) for _ in range(20)]
+        second_data = [int(next(second)[0][0, 0, 0]) for _ in range(20)]
+
+        self.assertListEqual(sorted(first_data), list(range(20)))
+        self.assertListEqual(sorted(second_data), list(range(20)))
+        self.assertNotEqual(first_data, second_data)
+
+        self.assertListEqual([int(next(ordered)[0][0, 0, 0]) for _ in range(20)], list(range(20)))
+
+    def test_cache_point(self):
+        output = CachePoint()(FiniteIntegerStream(nr_elements=3)())
+
+        generator = output.get_view(cache_filepath=self.filepath, shared_cache=True).get_generator()
+        self.assertListEqual([next(generator)[0] for _ in range(4)], [0, 1, 2, 0])
+        self.assertIsInstance(SharedCache(self.filepath)[0][0], int)
@@ -0,0 +1,126 @@
+import gc
+import os
+import pickle
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from pipeline.control_flow import Identity, CachePoint
+from pipeline.transformer import FunctionTransformer
+from tests.helper import IntegerStream, FiniteIntegerStream, Adder
+
+
+class RandomNoise(FunctionTransformer):
+
+    def transform(self, number, rng=None, **arguments):
+        return number + rng.random()
+
+
+class TestStateDict(TestCase):
+
+    def _get_data(self, generator, nr_elements):
+        return [next(generator) for _ in range(nr_elements)]
+
+    def test_resume(self):
+        def get_pipeline():
+            return RandomNoise()(Adder(increment=10)(IntegerStream()())).get_view(seed=3)
+
+        view = get_pipeline()
+        generator = view.get_generator()
+        self._get_data(generator, 5)
+
+        state = pickle.loads(pickle.dumps(view.state_dict()))
+        expected = self._get_data(generator, 5)
+
+        restored = get_pipeline()
+        restored.load_state_dict(state)
+
+        self.assertListEqual(self._get_data(restored.get_generator(), 5), expected)
+
+    def test_queued_elements(self):
+        stream = IntegerStream(nr_outgoing_streams=2)()
+        first, second = Identity()(stream, 0), Identity()(stream, 1)
+
+        first_generator = first.get_generator()
+        second.get_generator()
+        self._get_data(first_generator, 3)
+
+        state = second.state_dict()
+
+        other_stream = IntegerStream(nr_outgoing_streams=2)()
+        other_first, other_second = Identity()(other_stream, 0), Identity()(other_stream, 1)
+        other_first.get_generator()
+        other_second.load_state_dict(state)
+
+        self.assertListEqual(self._get_data(other_second.get_generator(), 4), [[1], [2], [3], [4]])
+
+    def test_shuffled_cache(self):
+        with TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'test.cache')
+
+            def get_pipeline():
+                stream = FiniteIntegerStream(nr_elements=10)()
+                stream.cache_or_load(filepath)
+                return Adder(increment=1)(stream).get_view(shuffle=True, seed=1)
+
+            view = get_pipeline()
+            generator = view.get_generator()
+            self._get_data(generator, 7)
+
+            state = view.state_dict()
+            expected = self._get_data(generator, 8)
+
+            restored = get_pipeline()
+            restored.load_state_dict(state)
+
+            self.assertListEqual(self._get_data(restored.get_generator(), 8), expected)
+
+    def test_cache_point_in_fresh_graph(self):
+        def get_pipeline():
+            return Adder(increment=1)(CachePoint()(Adder(increment=100)(FiniteIntegerStream(nr_elements=10)())))
+
+        view = get_pipeline()
+        generator = view.get_generator()
+        self._get_data(generator, 4)
+
+        state = view.state_dict()
+
+        restored = get_pipeline()
+        restored.load_state_dict(state)
+
+        self.assertListEqual(self._get_data(restored.get_generator(), 3), [[105], [106], [107]])
+
+    def test_prefetch(self):
+        def get_pipeline():
+            return RandomNoise()(Adder(increment=10)(IntegerStream()())).get_view(seed=3, prefetch=4)
+
+        view = get_pipeline()
+        generator = view.get_generator()
+        self._get_data(generator, 3)
+
+        # the state is captured while the prefetched elements are queued
+        while view.prefetch_queue.qsize() < 4: time.sleep(0.01)
+
+        state = pickle.loads(pickle.dumps(view.state_dict()))
+        self.assertIsNone(view.prefetch_thread)
+        expected = self._get_data(generator, 6)
+
+        restored = get_pipeline()
+        restored.load_state_dict(state)
+
+        self.assertListEqual(self._get_data(restored.get_generator(), 6), expected)
+
+    def test_prefetching_ends_with_view(self):
+        view = Adder(increment=1)(IntegerStream()()).get_view(prefetch=2)
+        next(view.get_generator())
+
+        thread = view.prefetch_thread
+        del view
+        gc.collect()
+
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+
+    def test_different_wiring(self):
+        state = Identity()(IntegerStream()()).state_dict()
+        self.assertRaises(AssertionError, lambda: IntegerStream()().load_state_dict(state))
@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.ML_steps import BucketBatchGenerator
+from pipeline.exceptions import IteratedThroughAll
+from pipeline.transformer import FunctionTransformer
+from tests.helper import IntegerStream, FiniteIntegerStream
+
+
+class ToVariableImage(FunctionTransformer):
+
+    def transform(self, number, **arguments):
+        return np.full((number % 3 + 1, 2), number)
+
+
+class TestBucketBatchGenerator(TestCase):
+
+    def test_exact_buckets(self):
+        stream = ToVariableImage()(IntegerStream()())
+        batches = BucketBatchGenerator(batch_size=2, output_masks=False)(stream)
+
+        generator = batches.get_generator()
+
+        batch = next(generator)
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(batch[0].shape, (2, 2, 2))
+        self.assertListEqual(batch[0][:, 0, 0].tolist(), [1, 4])
+
+        batch = next(generator)
+        self.assertEqual(batch[0].shape, (2, 3, 2))
+        self.assertListEqual(batch[0][:, 0, 0].tolist(), [2, 5])
+
+    def test_padding_and_masks(self):
+        stream = ToVariableImage()(IntegerStream()())
+        step = BucketBatchGenerator(batch_size=3, bucket_boundaries=[[2, 4]], padding_value=-1)
+        batches = step(stream)
+
+        generator = batches.get_generator()
+
+        batch, mask = next(generator)
+        self.assertEqual(batch.shape, (3, 2, 2))
+        self.assertListEqual(batch[:, 0, 0].tolist(), [1, 3, 4])
+        self.assertListEqual(batch[1, :, 0].tolist(), [3, -1])
+        self.assertListEqual(mask[:, :, 0].tolist(), [[True, True], [True, False], [True, True]])
+
+        self.assertAlmostEqual(step.padding_overhead, 2 / 12)
+
+    def test_bounded_buffer(self):
+        stream = ToVariableImage()(IntegerStream()())
+        batches = BucketBatchGenerator(batch_size=10, max_buffered_elements=4, output_masks=False)(stream)
+
+        batch = next(batches.get_generator())
+        self.assertEqual(batch[0].shape, (2, 2, 2))
+
+    def test_remaining_buckets(self):
+        stream = ToVariableImage()(FiniteIntegerStream(nr_elements=7)())
+        batches = BucketBatchGenerator(batch_size=3, output_masks=False)(stream)
+
+        generator = batches.get_view(all_then_stop=True).get_generator()
+
+        numbers = []
+        for _ in range(3):
+            batch, = next(generator)
+            numbers.append(batch[:, 0, 0].tolist())
+
+        self.assertRaises(IteratedThroughAll, lambda: next(generator))
+
+        # the buckets which are not full yet are yielded at the end of the data
+        self.assertListEqual(numbers, [[0, 3, 6], [1, 4], [2, 5]])
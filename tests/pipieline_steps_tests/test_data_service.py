@@ -0,0 +1,107 @@
+import os
+import socket
+import tempfile
+import threading
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.data_service import PipelineServer, RemoteSource, write_frame, read_frame
+from pipeline.exceptions import RemotePipelineError
+from pipeline.transformer import FunctionTransformer
+from tests.helper import FiniteIntegerStream
+
+
+class ToImage(FunctionTransformer):
+
+    def transform(self, number, **arguments):
+        return np.full((4, 3, 2), number, dtype=np.uint8)
+
+
+class FailAt(FunctionTransformer):
+
+    def transform(self, number, fail_at=0, **arguments):
+        if number == fail_at: raise ValueError(f'Failed at {number}.')
+        return number
+
+
+class TestDataService(TestCase):
+
+    def _get_all_data(self, address, nr_clients):
+        clients = [RemoteSource(address, shard_index=i)() for i in range(nr_clients)]
+        data = [None] * nr_clients
+
+        def read(i): data[i] = clients[i].generate_all_data()
+
+        threads = [threading.Thread(target=read, args=(i,)) for i in range(nr_clients)]
+        for t in threads: t.start()
+        for t in threads: t.join(10)
+
+        for c in clients: c.step.close()
+        return data
+
+    def test_framing(self):
+        a, b = socket.socketpair()
+        arrays = [np.arange(12, dtype=np.float32).reshape(3, 4), np.asarray(7), np.zeros((0, 2), dtype=np.int64)]
+
+        write_frame(a, 0, arrays)
+        kind, received = read_frame(b)
+
+        self.assertEqual(kind, 0)
+        for array, received_array in zip(arrays, received):
+            self.assertEqual(array.dtype, received_array.dtype)
+            np.testing.assert_array_equal(array, received_array)
+
+        a.close()
+        b.close()
+
+    def test_sharding(self):
+        view = ToImage()(FiniteIntegerStream(nr_elements=10)())
+
+        with PipelineServer(view, nr_clients=2) as server:
+            shards = self._get_all_data(server.address, 2)
+
+        self.assertEqual([[int(e[0][0, 0, 0]) for e in shard] for shard in shards], [[0, 2, 4, 6, 8], [1, 3, 5, 7, 9]])
+        self.assertEqual(shards[0][0][0].shape, (4, 3, 2))
+
+    def test_several_epochs(self):
+        view = FiniteIntegerStream(nr_elements=3)()
+
+        with PipelineServer(view, nr_clients=1, prefetch=2) as server:
+            generator = RemoteSource(server.address)().get_generator()
+            data = [int(next(generator)[0]) for _ in range(7)]
+
+        self.assertEqual(data, [0, 1, 2, 0, 1, 2, 0])
+
+    def test_unix_socket(self):
+        view = FiniteIntegerStream(nr_elements=4)()
+
+        with tempfile.TemporaryDirectory() as directory:
+            with PipelineServer(view, nr_clients=1, address=os.path.join(directory, 'pipeline.sock')) as server:
+                data, = self._get_all_data(server.address, 1)
+
+        self.assertEqual([int(e[0]) for e in data], [0, 1, 2, 3])
+
+    def test_invalid_shard_index(self):
+        view = FiniteIntegerStream(nr_elements=4)()
+
+        with PipelineServer(view, nr_clients=2) as server:
+            client = RemoteSource(server.address, shard_index=2)()
+
+            with self.assertRaisesRegex(RemotePipelineError, 'out of range'):
+                next(client.get_generator())
+
+            client.step.close()
+
+    def test_producer_exception(self):
+        view = FailAt(fail_at=2)(FiniteIntegerStream(nr_elements=4)())
+
+        with PipelineServer(view, nr_clients=1) as server:
+            client = RemoteSource(server.address)()
+            generator = client.get_generator()
+
+            self.assertEqual([int(next(generator)[0]) for _ in range(2)], [0, 1])
+            with self.assertRaisesRegex(RemotePipelineError, 'ValueError: Failed at 2.'):
+                next(generator)
+
+            client.step.close()
@@ -0,0 +1,122 @@
+import gc
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, MRImageStorage, generate_uid
+
+from pipeline import dicom_steps
+from pipeline.dicom_steps import DicomSource
+
+
+def write_dicom(filepath, pixels, patient_id, series_uid, instance_number):
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = MRImageStorage
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    dataset = Dataset()
+    dataset.file_meta = file_meta
+    dataset.SOPClassUID = MRImageStorage
+    dataset.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    dataset.PatientID = patient_id
+    dataset.SeriesInstanceUID = series_uid
+    dataset.InstanceNumber = instance_number
+
+    dataset.Rows, dataset.Columns = pixels.shape
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = 'MONOCHROME2'
+    dataset.BitsAllocated, dataset.BitsStored, dataset.HighBit = 16, 16, 15
+    dataset.PixelRepresentation = 0
+    dataset.PixelData = pixels.astype(np.uint16).tobytes()
+
+    try:
+        dataset.save_as(filepath, enforce_file_format=True)
+    except TypeError:
+        # pydicom < 3
+        dataset.save_as(filepath, write_like_original=False)
+
+
+class TestDicomSource(TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+
+        # instance numbers in reverse order of the filenames, 3 slices for each of 4 patients
+        for patient in range(4):
+            os.makedirs(os.path.join(self.directory.name, f'patient_{patient}'))
+
+            for instance in range(3):
+                pixels = np.full((4, 5), 10 * patient + instance)
+                filepath = os.path.join(self.directory.name, f'patient_{patient}', f'{2 - instance}.dcm')
+                write_dicom(filepath, pixels, f'P{patient}', f'1.2.{patient}', instance)
+
+        with open(os.path.join(self.directory.name, 'notes.txt'), 'w') as file:
+            file.write('not a DICOM file')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _get_values(self, source, **view_arguments):
+        return [int(e[0][0, 0]) for e in source().get_view(**view_arguments).generate_all_data()]
+
+    def test_order(self):
+        source = DicomSource(self.directory.name, read_ahead=2)
+
+        self.assertListEqual(self._get_values(source), [0, 1, 2, 10, 11, 12, 20, 21, 22, 30, 31, 32])
+        self.assertEqual(source.get_entries()[0]['shape'], [4, 5])
+
+    def test_persisted_index(self):
+        DicomSource(self.directory.name).get_entries()
+        self.assertTrue(os.path.isfile(os.path.join(self.directory.name, 'dicom_index.json')))
+
+        with patch.object(dicom_steps.pydicom, 'dcmread', side_effect=AssertionError('headers are read again')):
+            entries = DicomSource(self.directory.name).get_entries()
+
+        self.assertEqual(len(entries), 12)
+
+    def test_bins(self):
+        source = DicomSource(self.directory.name, n_bins=3)
+        bins = {e['patient_id']: e['bin'] for e in source.get_entries()}
+
+        values = [self._get_values(source, bins_included=[b]) if b in bins.values() else [] for b in range(3)]
+        self.assertListEqual(sorted(sum(values, [])), [0, 1, 2, 10, 11, 12, 20, 21, 22, 30, 31, 32])
+
+        # all images of a patient are in the same bin
+        for b in range(3):
+            for value in values[b]: self.assertEqual(bins[f'P{value // 10}'], b)
+
+    def test_thread_pool_and_state(self):
+        source = DicomSource(self.directory.name)
+
+        with ThreadPoolExecutor(2) as thread_pool:
+            view = source().get_view(thread_pool=thread_pool)
+            generator = view.get_generator()
+
+            self.assertListEqual([int(next(generator)[0][0, 0]) for _ in range(4)], [0, 1, 2, 10])
+
+            state = view.state_dict()
+            restored = DicomSource(self.directory.name)().get_view(thread_pool=thread_pool)
+            restored.load_state_dict(state)
+
+            self.assertListEqual([int(next(restored.get_generator())[0][0, 0]) for _ in range(2)], [11, 12])
+
+    def test_own_thread_pool_is_shut_down(self):
+        self._get_values(DicomSource(self.directory.name))
+
+        generator = DicomSource(self.directory.name)().get_generator()
+        next(generator)
+
+        # the abandoned iteration shuts its pool down once it is collected
+        del generator
+        gc.collect()
+
+        threads = [t for t in threading.enumerate() if t.name.startswith('DicomSource')]
+        for thread in threads: thread.join(5)
+
+        self.assertFalse(any([t.is_alive() for t in threads]))
@@ -0,0 +1,92 @@
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.ML_steps import BatchGenerator, BucketBatchGenerator, KerasTrainingGenerator, OneHotEncoder
+from pipeline.image_steps import Rescale
+from pipeline.transformer import FunctionTransformer
+from tests.helper import IntegerStream
+
+
+class ToImage(FunctionTransformer):
+
+    def transform(self, number, **arguments):
+        return np.arange(number, number + 12, dtype=np.uint8).reshape(3, 4)
+
+
+class TestDtypes(TestCase):
+
+    def test_default_dtypes(self):
+        self.assertEqual(Rescale().transform(np.arange(4, dtype=np.uint8)).dtype, np.float64)
+        self.assertEqual(Rescale().transform(np.arange(4, dtype=np.float32)).dtype, np.float32)
+        self.assertEqual(OneHotEncoder().transform(1, num_classes=3).dtype, np.float64)
+
+    def test_policy(self):
+        rescaled = Rescale().transform(np.arange(5, dtype=np.uint8), dtype='float32')
+
+        self.assertEqual(rescaled.dtype, np.float32)
+        np.testing.assert_allclose(rescaled, [0, 0.25, 0.5, 0.75, 1])
+
+        self.assertEqual(OneHotEncoder().transform(1, num_classes=3, dtype='float16').dtype, np.float16)
+
+    def test_batches(self):
+        stream = IntegerStream()()
+        images = Rescale()(ToImage()(stream))
+        classes = OneHotEncoder(num_classes=20)(stream)
+
+        generator = BatchGenerator(batch_size=4)([images, stream, classes]).get_view(dtype='float32').get_generator()
+        image_batch, number_batch, class_batch = next(generator)
+
+        self.assertEqual(image_batch.dtype, np.float32)
+        self.assertEqual(image_batch.shape, (4, 3, 4))
+        self.assertEqual(class_batch.dtype, np.float32)
+
+        # integer streams are not affected by the policy
+        self.assertTrue(np.issubdtype(number_batch.dtype, np.integer))
+
+    def test_quantized_storage(self):
+        images = Rescale()(ToImage()(IntegerStream()()))
+
+        quantized = images.get_view(storage_dtype='uint8').get_generator()
+        image, = next(quantized)
+
+        self.assertEqual(image.dtype, np.uint8)
+        self.assertEqual((image.min(), image.max()), (0, 255))
+
+        batches = KerasTrainingGenerator(batch_size=2, input_indices=[0], output_indices=[])(images)
+        inputs, _ = next(batches.get_view(storage_dtype='uint8', dtype='float32').get_generator())
+
+        self.assertEqual(inputs[0].dtype, np.float32)
+        np.testing.assert_allclose(inputs[0][0], np.linspace(0, 1, 12).reshape(3, 4), atol=1 / 255)
+
+    def test_quantized_bucket_batches(self):
+        images = Rescale()(ToImage()(IntegerStream()()))
+        batches = BucketBatchGenerator(batch_size=2, output_masks=False)(images)
+
+        batch, = next(batches.get_view(storage_dtype='uint8', dtype='float16').get_generator())
+
+        self.assertEqual(batch.dtype, np.float16)
+        self.assertAlmostEqual(float(batch.max()), 1.0)
+
+    def test_unquantized_uint8_streams(self):
+        masks = ToImage()(IntegerStream()())
+        images = Rescale()(masks)
+
+        batches = BatchGenerator(batch_size=2)([images, masks])
+        image_batch, mask_batch = next(batches.get_view(storage_dtype='uint8', dtype='float32').get_generator())
+
+        # only the quantized images are dequantized, masks (or class ids) keep their values
+        self.assertEqual(image_batch.dtype, np.float32)
+        self.assertAlmostEqual(float(image_batch.max()), 1.0)
+
+        self.assertEqual(mask_batch.dtype, np.uint8)
+        np.testing.assert_array_equal(mask_batch[1] - mask_batch[1, 0, 0], np.arange(12).reshape(3, 4))
+
+    def test_quantized_through_transformers(self):
+        images = FunctionTransformer(function=lambda img, **arguments: np.flip(img, axis=0).copy())(
+            Rescale()(ToImage()(IntegerStream()())))
+
+        batch, = next(BatchGenerator(batch_size=2)(images).get_view(storage_dtype='uint8').get_generator())
+
+        self.assertEqual(batch.dtype, np.float32)
+        np.testing.assert_allclose(batch[0], np.linspace(1, 0, 12).reshape(3, 4)[:, ::-1], atol=1 / 255)
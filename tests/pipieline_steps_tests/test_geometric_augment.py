@@ -0,0 +1,79 @@
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from pipeline.image_steps import GeometricAugment
+
+
+class TestGeometricAugment(TestCase):
+
+    def setUp(self):
+        self.image = np.random.default_rng(0).random((48, 64, 3)).astype(np.float32)
+
+    def test_identity(self):
+        output = GeometricAugment().transform(self.image, width=64, height=48)
+        np.testing.assert_allclose(output, self.image, atol=1e-6)
+
+    def test_resize(self):
+        output = GeometricAugment().transform(self.image, width=96, height=80, border_mode=cv2.BORDER_REPLICATE)
+        expected = cv2.resize(self.image, (96, 80), interpolation=cv2.INTER_LINEAR)
+
+        np.testing.assert_allclose(output, expected, atol=1e-5)
+
+    def test_crop(self):
+        rng = np.random.default_rng(1)
+        output = GeometricAugment().transform(self.image, width=16, height=16, crop_width=16, crop_height=16, rng=rng)
+
+        # without resizing, the crop has to be an exact sub-image
+        matches = [np.allclose(output, self.image[y:y + 16, x:x + 16], atol=1e-6)
+                   for y in range(48 - 15) for x in range(64 - 15)]
+        self.assertEqual(sum(matches), 1)
+
+    def test_flips(self):
+        output = GeometricAugment().transform(self.image, width=64, height=48, flip_horizontal=1.0)
+        np.testing.assert_allclose(output, self.image[:, ::-1], atol=1e-6)
+
+        output = GeometricAugment().transform(self.image, width=64, height=48, flip_vertical=1.0)
+        np.testing.assert_allclose(output, self.image[::-1], atol=1e-6)
+
+    def test_rotation(self):
+        image = np.random.default_rng(0).random((32, 32)).astype(np.float32)
+
+        # rotations by 90 degrees are exact
+        output = GeometricAugment().transform(image, width=32, height=32, max_rotation=90.0,
+                                              rng=_FixedRotation(90.0))
+        np.testing.assert_allclose(output, np.rot90(image, k=-1), atol=1e-5)
+
+    def test_batched(self):
+        images = np.stack([self.image] * 4)
+        outputs = GeometricAugment().transform(images, width=20, height=10, crop_width=32, crop_height=32,
+                                               output_shape=(10, 20, 3, 1), rng=np.random.default_rng(2),
+                                               batched=True)
+
+        self.assertEqual(outputs.shape, (4, 10, 20, 3, 1))
+        self.assertFalse(all([np.allclose(outputs[0], o) for o in outputs[1:]]))
+
+    def test_reproducible(self):
+        arguments = dict(width=32, height=32, crop_width=40, crop_height=40, flip_horizontal=0.5, max_rotation=20.0,
+                         zoom_range=(0.8, 1.2), max_translation=0.1)
+
+        first = GeometricAugment().transform(self.image, rng=np.random.default_rng(3), **arguments)
+        second = GeometricAugment().transform(self.image, rng=np.random.default_rng(3), **arguments)
+
+        np.testing.assert_array_equal(first, second)
+
+
+class _FixedRotation:
+    """Imitates a random number generator which always rotates by the maximum angle."""
+
+    def __init__(self, angle):
+        self.angle = angle
+        self.rng = np.random.default_rng(0)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        if (low, high) == (-self.angle, self.angle): return self.angle
+        return self.rng.uniform(low, high, size)
+
+    def __getattr__(self, name):
+        return getattr(self.rng, name)
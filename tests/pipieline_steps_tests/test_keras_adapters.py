@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+import tensorflow as tf
+
+from pipeline.ML_steps import KerasTrainingGenerator
+from pipeline.keras_adapters import PipelineSequence, to_dataset
+from pipeline.transformer import ToNumpyArray
+from pipeline.transformer import FunctionTransformer
+from tests.helper import FiniteIntegerStream, IntegerStream, Adder
+
+
+class RandomAdder(FunctionTransformer):
+
+    def transform(self, number, rng=None, **arguments):
+        return number + rng.integers(1000)
+
+
+class TestKerasAdapters(TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _get_cached_pipeline(self):
+        stream = FiniteIntegerStream(nr_elements=10, nr_outgoing_streams=2)()
+        stream = ToNumpyArray()(stream)
+        stream.cache_or_load(os.path.join(self.directory.name, 'test.cache'))
+
+        x = Adder(increment=1)(stream, 0)
+        return KerasTrainingGenerator(batch_size=3)([x, stream], [None, [1]])
+
+    def test_indexable_sequence(self):
+        sequence = PipelineSequence(self._get_cached_pipeline())
+
+        self.assertTrue(sequence.is_indexable)
+        self.assertEqual(len(sequence), 3)
+
+        x, y = sequence[1]
+        self.assertListEqual(x[0].flatten().tolist(), [4, 5, 6])
+        self.assertListEqual(y[0].flatten().tolist(), [3, 4, 5])
+
+        x, y = sequence[0]
+        self.assertListEqual(y[0].flatten().tolist(), [0, 1, 2])
+
+    def test_sequence_with_multiple_workers(self):
+        sequence = PipelineSequence(self._get_cached_pipeline())
+
+        with ThreadPoolExecutor(4) as executor:
+            batches = list(executor.map(lambda i: sequence[i % 3], range(30)))
+
+        for i, (x, y) in enumerate(batches):
+            self.assertListEqual(y[0].flatten().tolist(), [3 * (i % 3), 3 * (i % 3) + 1, 3 * (i % 3) + 2])
+
+    def test_reproducible_batches(self):
+        stream = FiniteIntegerStream(nr_elements=10, nr_outgoing_streams=2)()
+        stream = ToNumpyArray()(stream)
+        stream.cache_or_load(os.path.join(self.directory.name, 'test.cache'))
+
+        pipeline = KerasTrainingGenerator(batch_size=3)([RandomAdder()(stream, 0), stream], [None, [1]])
+        sequence = PipelineSequence(pipeline.get_view(seed=3))
+
+        with ThreadPoolExecutor(4) as executor:
+            batches = list(executor.map(lambda i: sequence[i % 3][0][0].tolist(), range(12)))
+
+        for i, batch in enumerate(batches):
+            self.assertListEqual(batch, batches[i % 3])
+
+    def test_not_indexable_sequence(self):
+        stream = ToNumpyArray()(IntegerStream(nr_outgoing_streams=2)())
+        pipeline = KerasTrainingGenerator(batch_size=2)(stream)
+
+        self.assertRaises(AssertionError, lambda: PipelineSequence(pipeline))
+
+        sequence = PipelineSequence(pipeline, steps_per_epoch=5)
+        self.assertFalse(sequence.is_indexable)
+        self.assertEqual(len(sequence), 5)
+        self.assertListEqual(sequence[3][0][0].flatten().tolist(), [1, 2])
+        self.assertListEqual(sequence[3][0][0].flatten().tolist(), [3, 4])
+
+    def test_partially_cached_sequence(self):
+        stream = FiniteIntegerStream(nr_elements=10)()
+        stream.cache_or_load(os.path.join(self.directory.name, 'test.cache'))
+
+        pipeline = KerasTrainingGenerator(batch_size=2)(ToNumpyArray()([stream, IntegerStream()()]))
+
+        # the uncached source can not be moved to an index
+        self.assertRaises(AssertionError, lambda: PipelineSequence(pipeline))
+
+        sequence = PipelineSequence(pipeline, steps_per_epoch=5)
+        self.assertFalse(sequence.is_indexable)
+        self.assertListEqual(sequence[0][1][0].flatten().tolist(), [1, 2])
+        self.assertListEqual(sequence[0][1][0].flatten().tolist(), [3, 4])
+
+    def test_dataset(self):
+        dataset = to_dataset(self._get_cached_pipeline(), num_parallel_calls=2)
+
+        self.assertEqual(dataset.element_spec[0][0], tf.TensorSpec(shape=(None, 1), dtype=tf.int64))
+
+        batches = list(dataset.as_numpy_iterator())
+        self.assertEqual(len(batches), 3)
+        self.assertListEqual(np.concatenate([y[0] for _, y in batches]).flatten().tolist(), list(range(9)))
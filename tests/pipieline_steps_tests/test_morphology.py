@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from pipeline.image_steps import Morphology, Dilation, Erosion, get_structuring_element
+
+
+class TestMorphology(TestCase):
+
+    def setUp(self):
+        self.image = np.random.default_rng(0).integers(0, 255, size=(32, 24, 3), dtype=np.uint8)
+
+    def test_structuring_elements(self):
+        self.assertIs(get_structuring_element(5, 'ellipse'), get_structuring_element((5, 5), 'ellipse'))
+        self.assertFalse(get_structuring_element(3).flags.writeable)
+
+        np.testing.assert_array_equal(get_structuring_element(3), np.ones((3, 3)))
+        np.testing.assert_array_equal(get_structuring_element(3, 'cross'), [[0, 1, 0], [1, 1, 1], [0, 1, 0]])
+
+    def test_dilation_and_erosion(self):
+        kernel = np.ones((3, 3), np.uint8)
+
+        np.testing.assert_array_equal(Dilation().transform(self.image, iterations=2),
+                                      cv2.dilate(self.image, kernel, iterations=2))
+        np.testing.assert_array_equal(Erosion().transform(self.image), cv2.erode(self.image, kernel))
+
+    def test_sequence(self):
+        kernel = get_structuring_element(5, 'ellipse')
+
+        opened = Morphology().transform(self.image, operations=[('erode', 5, 'ellipse'), ('dilate', 5, 'ellipse')])
+        np.testing.assert_array_equal(opened, cv2.morphologyEx(self.image, cv2.MORPH_OPEN, kernel))
+
+        top_hat = Morphology().transform(self.image, operations=[('open', 3), ('tophat', 3, 'cross', 2)])
+        expected = cv2.morphologyEx(cv2.morphologyEx(self.image, cv2.MORPH_OPEN, get_structuring_element(3)),
+                                    cv2.MORPH_TOPHAT, get_structuring_element(3, 'cross'), iterations=2)
+        np.testing.assert_array_equal(top_hat, expected)
+
+    def test_out(self):
+        operations = [('close', 3), ('gradient', 3)]
+        expected = Morphology().transform(self.image, operations=operations)
+
+        out = np.zeros_like(self.image)
+        self.assertIs(Morphology().transform(self.image, operations=operations, out=out), out)
+        np.testing.assert_array_equal(out, expected)
+
+        # e.g. a channel slot of a stacked array
+        stacked = np.zeros((32, 24, 2), np.uint8)
+        Morphology().transform(self.image[..., 0], operations=operations, out=stacked[..., 1])
+        np.testing.assert_array_equal(stacked[..., 1], expected[..., 0])
+
+    def test_channels_and_batches(self):
+        stack = np.random.default_rng(1).integers(0, 255, size=(4, 32, 24, 7), dtype=np.uint8)
+        dilated = Morphology().transform(stack, operations=[('dilate', 3)], batched=True)
+
+        self.assertEqual(dilated.shape, stack.shape)
+        for n, c in [(0, 0), (3, 6)]:
+            np.testing.assert_array_equal(dilated[n, ..., c], cv2.dilate(np.ascontiguousarray(stack[n, ..., c]),
+                                                                         np.ones((3, 3))))
+
+        single = Morphology().transform(stack[0, ..., :1], operations=[('dilate', 3)])
+        np.testing.assert_array_equal(single, dilated[0, ..., :1])
+
+    def test_drop_single_channel(self):
+        image = self.image[..., :1]
+
+        self.assertEqual(Morphology().transform(image).shape, (32, 24, 1))
+        np.testing.assert_array_equal(Morphology().transform(image, drop_single_channel=True),
+                                      Dilation().transform(image))
@@ -0,0 +1,123 @@
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.control_flow import Identity
+from pipeline.image_steps import RandomlyCrop, HideRandomBlock, HideQuarterImage, HideHalfImage, RandomBlockMasking
+from pipeline.transformer import FunctionTransformer
+from tests.helper import IntegerStream
+
+
+class ToImage(FunctionTransformer):
+
+    def transform(self, number, batched=False, **arguments):
+        shape = (4, 16, 16) if batched else (16, 16)
+        return np.full(shape, number, dtype=float) + np.arange(16)
+
+
+class TestRandomSteps(TestCase):
+
+    def _get_data(self, view, nr_elements=5):
+        generator = view.get_generator()
+        return [next(generator)[0] for _ in range(nr_elements)]
+
+    def test_seeded_views_are_reproducible(self):
+        output = HideRandomBlock(min_block_size=(1, 1), max_block_size=(8, 8))(ToImage()(IntegerStream()()))
+
+        data_1 = self._get_data(output.get_view(seed=42))
+        data_2 = self._get_data(output.get_view(seed=42))
+        data_3 = self._get_data(output.get_view(seed=43))
+
+        for a, b in zip(data_1, data_2):
+            self.assertTrue(np.array_equal(a == 0, b == 0))
+
+        self.assertFalse(all([np.array_equal(a == 0, b == 0) for a, b in zip(data_1, data_3)]))
+
+    def test_views_of_a_graph_get_independent_streams(self):
+        stream = ToImage()(IntegerStream(nr_outgoing_streams=2)())
+        crop_1 = RandomlyCrop(crop_width=4, crop_height=16)(stream, 0)
+        crop_2 = RandomlyCrop(crop_width=4, crop_height=16)(stream, 1)
+
+        view = Identity()([crop_1, crop_2]).get_view(seed=0)
+        view_1, view_2 = view.previous
+        self.assertNotEqual(view_1.rng.integers(1 << 30), view_2.rng.integers(1 << 30))
+
+    def test_reseed(self):
+        output = RandomlyCrop(crop_width=4, crop_height=8)(ToImage()(IntegerStream()()))
+        view = output.get_view()
+
+        view.reseed(7)
+        offsets_1 = [c[0, 0] - n for n, c in zip(range(1, 6), self._get_data(view))]
+        view.reseed(7)
+        offsets_2 = [c[0, 0] - n for n, c in zip(range(6, 11), self._get_data(view))]
+
+        self.assertListEqual(offsets_1, offsets_2)
+
+    def test_batched_crop(self):
+        output = RandomlyCrop(crop_width=4, crop_height=3, batched=True)(ToImage(batched=True)(IntegerStream()()))
+        crops = self._get_data(output.get_view(seed=1), 1)[0]
+
+        self.assertEqual(crops.shape, (4, 3, 4))
+        self.assertTrue(np.all(np.diff(crops, axis=-1) == 1))
+
+    def test_batched_hiding(self):
+        images = np.ones((8, 16, 16))
+        rng = np.random.default_rng(0)
+
+        covered = HideQuarterImage().transform(images, rng=rng, batched=True)
+        self.assertListEqual(np.sum(covered == 0, axis=(1, 2)).tolist(), [64] * 8)
+
+        covered = HideRandomBlock().transform(images, min_block_size=(2, 3), max_block_size=(2, 3), rng=rng,
+                                              batched=True)
+        self.assertListEqual(np.sum(covered == 0, axis=(1, 2)).tolist(), [6] * 8)
+
+    def test_hide_half_image(self):
+        rng = np.random.default_rng(0)
+
+        covered = HideHalfImage().transform(np.ones((4, 6)), rng=rng)
+        self.assertEqual(np.sum(covered == 0), 12)
+
+        covered = HideHalfImage().transform(np.ones((8, 4, 6)), rng=rng, batched=True)
+        self.assertListEqual(np.sum(covered == 0, axis=(1, 2)).tolist(), [12] * 8)
+        self.assertTrue(np.all((covered[:, :, 0] == 0) != (covered[:, :, -1] == 0)))
+
+
+class ToBatch(FunctionTransformer):
+
+    def transform(self, number, **arguments):
+        return np.full((8, 16, 16, 2), number, dtype=float)
+
+
+class TestRandomBlockMasking(TestCase):
+
+    def test_masks(self):
+        stream = ToBatch()(IntegerStream()())
+        output = RandomBlockMasking(min_block_size=(2, 3), max_block_size=(4, 5), nr_blocks=3, output_mask=True)\
+            (stream)
+
+        batch, mask = next(output.get_view(seed=0).get_generator())
+
+        self.assertEqual(batch.shape, (8, 16, 16, 2))
+        self.assertEqual(mask.shape, (8, 16, 16))
+        self.assertTrue(np.array_equal(batch[..., 0] == 0, mask))
+        self.assertTrue(np.array_equal(batch[..., 1] == 0, mask))
+        self.assertTrue(np.all(np.sum(mask, axis=(1, 2)) >= 6))
+        self.assertTrue(np.all(np.sum(mask, axis=(1, 2)) <= 60))
+
+    def test_single_block(self):
+        images = np.ones((50, 10, 12))
+
+        masked = next(RandomBlockMasking().get_next(iter([[images]]), min_block_size=(3, 4), max_block_size=(3, 4),
+                                                    rng=np.random.default_rng(1)))[0]
+
+        self.assertListEqual(np.sum(masked == 0, axis=(1, 2)).tolist(), [12] * 50)
+        self.assertEqual(np.sum(images == 0), 0)
+
+    def test_in_place(self):
+        images = np.ones((4, 10, 10))
+
+        masked = next(RandomBlockMasking().get_next(iter([[images]]), min_block_size=(2, 2), max_block_size=(2, 2),
+                                                    in_place=True))[0]
+
+        self.assertIs(masked, images)
+        self.assertEqual(np.sum(images == 0), 16)
@@ -0,0 +1,96 @@
+from queue import Empty
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.exceptions import RemotePipelineError
+from pipeline.shared_memory import SharedMemoryRing, SharedMemorySource, SharedMemoryProducers
+from pipeline.transformer import FunctionTransformer
+from tests.helper import FiniteIntegerStream, Adder
+
+
+class ToImage(FunctionTransformer):
+
+    def transform(self, number, **arguments):
+        return np.full((32, 32, 3), number, dtype=np.float32)
+
+
+def get_producer_view(producer_index):
+    return ToImage()(Adder(increment=100 * producer_index)(FiniteIntegerStream(nr_elements=5, nr_outgoing_streams=2)()))
+
+
+class FailAt(FunctionTransformer):
+
+    def transform(self, number, fail_at=0, **arguments):
+        if number == fail_at: raise ValueError(f'Failed at {number}.')
+        return number
+
+
+def get_failing_producer_view(producer_index):
+    # only the first producer fails, the second one has to end as well
+    return ToImage()(FailAt(fail_at=2 if producer_index == 0 else -1)(FiniteIntegerStream(nr_elements=5)()))
+
+
+class TestSharedMemory(TestCase):
+
+    def setUp(self):
+        self.ring = SharedMemoryRing(nr_slots=2, slot_size=2 ** 16)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_put_and_get(self):
+        element = [np.arange(6, dtype=np.int16).reshape(2, 3), np.asarray(1.5), np.ones((3, 1, 2), dtype=bool)]
+        self.ring.put(element)
+
+        received = self.ring.get()
+
+        for array, received_array in zip(element, received):
+            self.assertEqual(array.dtype, received_array.dtype)
+            np.testing.assert_array_equal(array, received_array)
+
+        self.assertFalse(received[0].flags.writeable)
+
+    def test_release_slots(self):
+        self.ring.put([np.zeros(10)])
+        self.ring.put([np.zeros(10)])
+        self.assertRaises(Empty, lambda: self.ring.put([np.zeros(10)], timeout=0.1))
+
+        first = self.ring.get()[0]
+        second = self.ring.get()[0][2:]
+        self.assertRaises(Empty, lambda: self.ring.put([np.zeros(10)], timeout=0.1))
+
+        # the slot is only released once also views of the received arrays are not used anymore
+        del first
+        self.ring.put([np.ones(10)], timeout=1)
+        self.assertRaises(Empty, lambda: self.ring.put([np.zeros(10)], timeout=0.1))
+
+        del second
+        self.ring.put([np.ones(10)], timeout=1)
+
+    def test_too_large_element(self):
+        self.assertRaises(AssertionError, lambda: self.ring.put([np.zeros(2 ** 16 + 1, dtype=np.uint8)]))
+
+    def test_producers(self):
+        source = SharedMemorySource(self.ring, nr_producers=2)()
+        view = FunctionTransformer(function=lambda x, **arguments: float(x[0, 0, 0]))(source)
+
+        with SharedMemoryProducers(get_producer_view, self.ring, nr_producers=2):
+            data = view.generate_all_data()
+
+        self.assertEqual(sorted([e[0] for e in data]), [0, 1, 2, 3, 4, 100, 101, 102, 103, 104])
+        self.assertTrue(all([e[0] == e[1] for e in data]))
+
+    def test_failing_producer(self):
+        source = SharedMemorySource(self.ring, nr_producers=2)()
+        view = FunctionTransformer(function=lambda x, **arguments: float(x[0, 0, 0]))(source)
+
+        producers = SharedMemoryProducers(get_failing_producer_view, self.ring, nr_producers=2).start()
+
+        with self.assertRaisesRegex(RemotePipelineError, 'ValueError: Failed at 2.'):
+            view.generate_all_data()
+
+        for p in producers.processes: p.join(10)
+        self.assertFalse(any([p.is_alive() for p in producers.processes]))
+
+        producers.stop()
@@ -0,0 +1,125 @@
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.exceptions import IteratedThroughAll
+from pipeline.image_steps import GetNormalizedAxis, Rescale
+from pipeline.transformer import FunctionTransformer, StackChannels, StackIncomingStreams
+from tests.helper import FiniteIntegerStream, Adder
+
+
+class ToImage(FunctionTransformer):
+
+    def transform(self, number, **arguments):
+        return np.arange(number, number + 12, dtype=np.uint8).reshape(3, 4)
+
+
+class Negate(FunctionTransformer):
+    """Records the 'out' arrays it writes into."""
+
+    supports_out = True
+
+    def __init__(self, **arguments):
+        super().__init__(**arguments)
+        self.outs = []
+
+    def transform(self, image, out=None, **arguments):
+        self.outs.append(out)
+        return np.negative(image, out=out)
+
+    def get_output_spec(self, image, **arguments):
+        return image.shape, image.dtype
+
+
+class TestStackChannels(TestCase):
+
+    def _get_images(self, nr_elements=10):
+        return ToImage()(FiniteIntegerStream(nr_elements=nr_elements, nr_outgoing_streams=3)())
+
+    def test_same_as_stack(self):
+        def get_stacked(stack_step):
+            images = self._get_images()
+            channels = [images, GetNormalizedAxis(axis='x')(images, 1), GetNormalizedAxis(axis='y')(images, 2)]
+
+            return next(stack_step(channels, [[0], None, None]).get_generator())[0]
+
+        stacked, expected = get_stacked(StackChannels()), get_stacked(StackIncomingStreams())
+
+        self.assertEqual(stacked.shape, (3, 4, 3))
+        self.assertEqual(stacked.dtype, expected.dtype)
+        np.testing.assert_array_equal(stacked, expected)
+
+    def test_normalized_axis(self):
+        image = np.zeros((3, 4))
+
+        x = GetNormalizedAxis().transform(image, axis='x')
+        y = GetNormalizedAxis().transform(image, axis='y')
+
+        np.testing.assert_array_equal(x, [[i / 3] * 4 for i in range(3)])
+        np.testing.assert_array_equal(y, [[i / 4 for i in range(4)]] * 3)
+
+    def test_writes_into_slots(self):
+        negate = Negate()
+        images = ToImage()(FiniteIntegerStream(nr_outgoing_streams=2)())
+        view = StackChannels()([images, negate(images, 1)], [[0], None])
+
+        # the view of the transformer is bypassed
+        self.assertNotIn(negate, [p.step for p in view.previous])
+
+        stacked = next(view.get_generator())[0]
+
+        self.assertTrue(np.shares_memory(negate.outs[0], stacked))
+        np.testing.assert_array_equal(stacked[..., 1], -stacked[..., 0].astype(np.int8).astype(np.uint8))
+
+    def test_copies_other_steps(self):
+        numbers = FiniteIntegerStream(nr_outgoing_streams=2)()
+        stacked = next(StackChannels()([numbers, Adder(increment=10)(numbers, 1)], [[0], None]).get_generator())[0]
+
+        np.testing.assert_array_equal(stacked, [0, 10])
+
+    def test_dtype_policy(self):
+        images = self._get_images()
+        view = StackChannels()([images, Rescale()(images, 1)], [[0], None]).get_view(storage_dtype='uint8')
+
+        stacked = next(view.get_generator())[0]
+
+        # the quantized channels are dequantized while they are copied
+        self.assertEqual(stacked.dtype, np.float32)
+        np.testing.assert_allclose(stacked[..., 1], Rescale().transform(stacked[..., 0]), atol=1 / 255)
+
+    def test_batches(self):
+        images = self._get_images(nr_elements=5)
+        view = StackChannels(batch_size=3)([images, GetNormalizedAxis(axis='y')(images, 1)], [[0], None])
+        generator = view.get_view(all_then_stop=True).get_generator()
+
+        first, second = next(generator)[0], next(generator)[0]
+        self.assertRaises(IteratedThroughAll, lambda: next(generator))
+
+        self.assertEqual(first.shape, (3, 3, 4, 2))
+        self.assertEqual(second.shape, (2, 3, 4, 2))
+        np.testing.assert_array_equal(second[1, ..., 0], np.arange(4, 16).reshape(3, 4))
+        np.testing.assert_array_equal(second[1, ..., 1], np.broadcast_to(np.arange(4) / 4, (3, 4)))
+
+    def test_bypassed_views_are_detached(self):
+        images = ToImage()(FiniteIntegerStream(nr_outgoing_streams=3)())
+        rescaled = Rescale()(images)
+        generator = StackChannels()([images, rescaled], [[0], [1]]).get_generator()
+
+        for _ in range(100): next(generator)
+
+        # the streams read by the bypassed view are no longer queued
+        self.assertTrue(all([q.qsize() <= 1 for q in images.outgoing_data_queues.values()]))
+        self.assertNotIn(2, images.outgoing_data_queues)
+
+    def test_shared_views_are_not_bypassed(self):
+        images = ToImage()(FiniteIntegerStream(nr_outgoing_streams=2)())
+        negated = Negate()(images, 1)
+        negated.get_generator()
+
+        view = StackChannels()([images, negated], [[0], None])
+        self.assertIn(negated, view.previous)
+
+    def test_output_spec_is_required(self):
+        with self.assertRaises(TypeError):
+            class WithoutSpec(FunctionTransformer):
+                supports_out = True
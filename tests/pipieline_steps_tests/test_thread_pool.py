@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.control_flow import Identity
+from pipeline.image_steps import Denoising, Resize, GaussianPyramid, LaplacianPyramid
+from pipeline.transformer import FunctionTransformer
+from tests.helper import IntegerStream, FiniteIntegerStream
+
+
+class ToImage(FunctionTransformer):
+
+    def transform(self, number, nr_channels=5, **arguments):
+        rng = np.random.default_rng(number)
+        return rng.integers(0, 255, size=(32, 32, nr_channels), dtype=np.uint8)
+
+
+class TestThreadPool(TestCase):
+
+    def setUp(self):
+        self.thread_pool = ThreadPoolExecutor(4)
+
+    def tearDown(self):
+        self.thread_pool.shutdown()
+
+    def _get_data(self, view, nr_elements):
+        generator = view.get_generator()
+        return [next(generator) for _ in range(nr_elements)]
+
+    def _get_pipeline(self):
+        stream = ToImage()(IntegerStream(nr_outgoing_streams=2)())
+        return Resize(width=16, height=8)(Denoising()(stream))
+
+    def test_equal_to_sequential(self):
+        sequential = self._get_data(self._get_pipeline().get_view(), 6)
+        threaded = self._get_data(
+            self._get_pipeline().get_view(thread_pool=self.thread_pool, nr_parallel_elements=4), 6)
+
+        for s, t in zip(sequential, threaded):
+            self.assertEqual(len(t), 2)
+            self.assertEqual(t[0].shape, (8, 16, 5))
+            self.assertTrue(np.array_equal(s[0], t[0]))
+            self.assertTrue(np.array_equal(s[1], t[1]))
+
+    def test_finite_source(self):
+        stream = ToImage(nr_channels=1)(FiniteIntegerStream(nr_elements=7)())
+        output = Resize(width=4, height=4)(stream)
+
+        data = output.get_view(thread_pool=self.thread_pool, nr_parallel_elements=3).generate_all_data()
+        self.assertEqual(len(data), 7)
+
+    def test_pyramid(self):
+        stream = ToImage(nr_channels=1)(IntegerStream(nr_outgoing_streams=2)())
+        output = GaussianPyramid(num_layers=3)(stream)
+
+        threaded = self._get_data(output.get_view(thread_pool=self.thread_pool), 1)[0]
+        sequential = [image for i in [1, 1] for image in GaussianPyramid()._get_gaussian(
+            ToImage().transform(i, nr_channels=1), 3)]
+
+        self.assertEqual(len(threaded), 6)
+        for s, t in zip(sequential, threaded): self.assertTrue(np.array_equal(s, t))
+
+    def test_pyramid_needed_outputs(self):
+        stream = ToImage(nr_channels=1)(IntegerStream()())
+        pyramid = GaussianPyramid(num_layers=4)(stream)
+        output = Identity()(pyramid, [1])
+
+        layer = self._get_data(output.get_view(), 1)[0][0]
+        self.assertEqual(layer.shape, (16, 16))
+
+        full = next(Identity()(pyramid).get_view().get_generator())
+        self.assertEqual(len(full), 4)
+        self.assertEqual(full[3].shape, (4, 4))
+
+    def test_laplacian_needed_outputs(self):
+        image = ToImage().transform(1, nr_channels=1).astype(np.float32)
+
+        full = LaplacianPyramid()._get_laplacian(image, 4)
+        partial = LaplacianPyramid()._get_laplacian(image, 4, [1, 3])
+
+        self.assertIsNone(partial[0])
+        self.assertIsNone(partial[2])
+        self.assertTrue(np.array_equal(full[1], partial[1]))
+        self.assertTrue(np.array_equal(full[3], partial[3]))
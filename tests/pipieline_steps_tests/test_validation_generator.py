@@ -0,0 +1,72 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from pipeline.ML_steps import KerasValidationGenerator, SinglePassData
+from tests.helper import FiniteIntegerStream, Adder
+
+
+class TestValidationGenerator(TestCase):
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _get_view(self, cached=True):
+        stream = FiniteIntegerStream(nr_elements=10, nr_outgoing_streams=2)()
+        if cached: stream.cache_or_load(os.path.join(self.directory.name, 'test.cache'))
+
+        return KerasValidationGenerator(batch_size=4)([stream, Adder(increment=100)(stream, 1)], [[0], None])
+
+    def test_batches(self):
+        data = SinglePassData(self._get_view())
+
+        self.assertEqual(len(data), 3)
+
+        batches = list(data)
+        self.assertEqual([len(inputs[0]) for inputs, _ in batches], [4, 4, 2])
+
+        np.testing.assert_array_equal(np.concatenate([inputs[0] for inputs, _ in batches]), np.arange(10))
+        np.testing.assert_array_equal(np.concatenate([outputs[0] for _, outputs in batches]), np.arange(100, 110))
+
+    def test_repeated_passes(self):
+        view = self._get_view()
+
+        # moving the cache of the original view does not change the passes
+        generator = view.get_generator()
+        next(generator)
+
+        data = SinglePassData(view)
+        first = [inputs[0].tolist() for inputs, _ in data]
+        second = [inputs[0].tolist() for inputs, _ in data]
+
+        self.assertListEqual(first, [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        self.assertListEqual(first, second)
+
+    def test_not_cached(self):
+        data = SinglePassData(self._get_view(cached=False))
+
+        self.assertIsNone(data.nr_batches)
+        self.assertRaises(TypeError, lambda: len(data))
+        self.assertEqual([len(inputs[0]) for inputs, _ in data], [4, 4, 2])
+
+    def test_partially_cached(self):
+        stream = FiniteIntegerStream(nr_elements=10)()
+        stream.cache_or_load(os.path.join(self.directory.name, 'test.cache'))
+
+        view = KerasValidationGenerator(batch_size=4)([stream, FiniteIntegerStream(nr_elements=6)()])
+        data = SinglePassData(view)
+
+        # the number of batches depends on the uncached source as well
+        self.assertIsNone(data.nr_batches)
+        self.assertEqual([len(inputs[0]) for inputs, _ in data], [4, 2])
+
+    def test_stop_early(self):
+        for inputs, _ in SinglePassData(self._get_view(), prefetch=1):
+            break
+
+        self.assertListEqual(inputs[0].tolist(), [0, 1, 2, 3])
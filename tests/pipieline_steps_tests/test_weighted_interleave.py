@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import Counter
+from unittest import TestCase
+
+from pipeline.control_flow import WeightedInterleave
+from pipeline.exceptions import IteratedThroughAll
+from pipeline.transformer import FunctionTransformer
+from tests.helper import IntegerStream, FiniteIntegerStream, Adder
+
+
+class Blocking(FunctionTransformer):
+    """Blocks every element until 'is_released' is set, a source which is as slow as the test needs it to be."""
+
+    def __init__(self, **arguments):
+        super().__init__(**arguments)
+        self.is_released = threading.Event()
+        self.nr_transformed = 0
+
+    def transform(self, number, **arguments):
+        self.is_released.wait()
+        self.nr_transformed += 1
+        return number
+
+
+class TestWeightedInterleave(TestCase):
+
+    def test_weights(self):
+        view = WeightedInterleave(weights=[3, 1], read_ahead=64, output_source=True)([IntegerStream()(),
+                                                                                      IntegerStream()()])
+        generator = view.get_generator()
+
+        counts = Counter([next(generator)[1] for _ in range(2000)])
+        self.assertAlmostEqual(counts[0] / 2000, 0.75, delta=0.05)
+
+    def test_order_within_source(self):
+        view = WeightedInterleave(output_source=True)([FiniteIntegerStream(nr_elements=100)(),
+                                                       Adder(increment=1000)(IntegerStream()())])
+        generator = view.get_generator()
+
+        elements = [next(generator) for _ in range(100)]
+        first = [e for e, source in elements if source == 0]
+        second = [e for e, source in elements if source == 1]
+
+        self.assertListEqual(first, list(range(len(first))))
+        self.assertListEqual(second, list(range(1001, 1001 + len(second))))
+
+    def test_exhaustion(self):
+        view = WeightedInterleave(weights=[1, 1])([FiniteIntegerStream(nr_elements=3)(),
+                                                   Adder(increment=100)(FiniteIntegerStream(nr_elements=20)())])
+        generator = view.get_view(all_then_stop=True).get_generator()
+
+        elements = []
+        with self.assertRaises(IteratedThroughAll):
+            while True: elements.append(next(generator)[0])
+
+        self.assertListEqual(sorted(elements), list(range(3)) + list(range(100, 120)))
+
+    def test_slow_source(self):
+        blocking = Blocking()
+        view = WeightedInterleave(weights=[1, 100], read_ahead=2, output_source=True)([IntegerStream()(),
+                                                                                       blocking(IntegerStream()())])
+        generator = view.get_generator()
+
+        # the fast source keeps the interleave going while the slow one is loading
+        sources = [next(generator)[1] for _ in range(20)]
+        self.assertListEqual(sources, [0] * 20)
+
+        # once the slow source has filled its read-ahead queue, its missed elements are compensated first
+        blocking.is_released.set()
+        for _ in range(500):
+            if blocking.nr_transformed > 2: break
+            time.sleep(0.01)
+
+        self.assertListEqual([next(generator)[1] for _ in range(2)], [1, 1])
+
+    def test_wrong_weights(self):
+        view = WeightedInterleave(weights=[1, 2, 3])([IntegerStream()(), IntegerStream()()])
+        self.assertRaises(AssertionError, lambda: next(view.get_generator()))